@@ -1,18 +1,235 @@
 """
 shazamController.py - Controlador para el Shazam MVP.
-Endpoints: listar canciones, subir canción, generar fingerprints, buscar.
+Endpoints: listar canciones, subir canción (job asíncrono), estado de jobs,
+generar fingerprints, buscar.
 
-El audio se almacena en TeraBox (nube, 1 TB gratis).
+El audio se almacena en TeraBox (nube, 1 TB gratis) o en disco local
+(audioStorageService, AUDIO_STORAGE_BACKEND).
 Solo los fingerprints (hashes) y metadatos se guardan en la BD.
 """
 
+import os
+import re
 import json
+import time
 import base64
-from django.http import JsonResponse, HttpResponse
+import asyncio
+from urllib.parse import unquote
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from VibeFlow.Public.Services import songsService
 from VibeFlow.Public.Services import fingerprintService
-from VibeFlow.Public.Services import teraboxService
+from VibeFlow.Public.Services import audioStreamService
+from VibeFlow.Public.Services import dspPoolService
+from VibeFlow.Public.Services import ingestJobsService
+from VibeFlow.Public.Services import fingerprintVersionService
+from VibeFlow.Public.Services import audioStorageService
+from VibeFlow.Public.Services import audioCodecService
+from VibeFlow.Public.Services import audioCacheService
+
+
+# Tamaño de lectura del body en uploads binarios
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+# Trozo máximo al servir audio (memoria por stream acotada)
+AUDIO_CHUNK_BYTES = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Progreso de regeneración por SSE: cada cuánto se consulta la BD y
+# cada cuánto se manda un comentario para que los proxies no corten
+REGENERATE_EVENTS_INTERVAL = float(os.getenv('REGENERATE_EVENTS_INTERVAL', '1'))
+REGENERATE_EVENTS_KEEPALIVE = 15
+
+# Metadatos aceptados en uploads binarios: campo → cabecera alternativa
+_META_HEADERS = {
+    'title':            'X-Song-Title',
+    'artist':           'X-Song-Artist',
+    'duration_seconds': 'X-Song-Duration',
+    'file_type':        'X-Song-File-Type',
+}
+
+
+def _leer_audio(request):
+    """
+    Extrae (metadatos, audio) de un request de upload/búsqueda.
+
+    - application/json     → audio = bytes (base64 decodificado).
+    - multipart/form-data  → audio = trozos del archivo 'audio' (Django lo
+                             manda a disco si es grande); metadatos en campos.
+    - cualquier otro tipo  → el body ES el WAV: audio = trozos leídos de
+                             request.read(); metadatos en query o cabeceras.
+    En los casos binarios nunca se materializa el archivo completo.
+    """
+    content_type = request.content_type or ''
+
+    if content_type == 'application/json':
+        body = json.loads(request.body)
+        audio_b64 = body.pop("audio_base64", "")
+        return body, base64.b64decode(audio_b64) if audio_b64 else b''
+
+    if content_type == 'multipart/form-data':
+        meta = {k: request.POST[k] for k in _META_HEADERS if request.POST.get(k)}
+        upload = request.FILES.get('audio')
+        audio = upload.chunks(UPLOAD_CHUNK_BYTES) if upload is not None else None
+        size = upload.size if upload is not None else 0
+    else:
+        meta = {}
+        for field, header in _META_HEADERS.items():
+            if request.GET.get(field):
+                meta[field] = request.GET[field]
+            elif request.headers.get(header):
+                # Cabeceras HTTP = ASCII: los valores llegan percent-encoded
+                meta[field] = unquote(request.headers[header])
+        # Sin Content-Length (transfer-encoding chunked) también hay body:
+        # el parser incremental del WAV rechaza uno vacío o inválido
+        size = int(request.META.get('CONTENT_LENGTH') or 0)
+        audio = iter(lambda: request.read(UPLOAD_CHUNK_BYTES), b'')
+
+    if 'duration_seconds' in meta:
+        meta['duration_seconds'] = float(meta['duration_seconds'])
+    if size:
+        meta['file_size'] = size
+    return meta, audio
+
+
+# ── Audio con soporte de Range ─────────────────────────────────────────
+def _leer_range(header):
+    """
+    Cabecera Range de un solo rango → (inicio, fin) con fin incluido o
+    None si es abierto; un sufijo ("bytes=-500") → (None, 500).  None si
+    no hay Range, tiene varios rangos o no se entiende (se sirve entero).
+    """
+    m = _RANGE_RE.match((header or '').strip())
+    if not m or m.group(1) == m.group(2) == '':
+        return None
+    if m.group(1) == '':
+        return None, int(m.group(2))
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else None
+    if end is not None and end < start:
+        return None
+    return start, end
+
+
+def _resolver_range(byte_range, size):
+    """(inicio, fin) absolutos dentro de `size` bytes, o None si no se puede satisfacer."""
+    start, end = byte_range
+    if start is None:
+        if end == 0:
+            return None
+        start, end = max(0, size - end), size - 1
+    if start >= size:
+        return None
+    return start, min(end if end is not None else size - 1, size - 1)
+
+
+# Los iteradores del audio son asíncronos: bajo ASGI (Daphne) Django
+# consume un iterador síncrono entero (sync_to_async(list)) antes de
+# mandar el primer byte.  Las lecturas bloqueantes van a un hilo.
+
+async def _iter_archivo(f, length):
+    """Lee `length` bytes de `f` en trozos de AUDIO_CHUNK_BYTES y lo cierra."""
+    try:
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(AUDIO_CHUNK_BYTES, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _respuesta_archivo(path, byte_range, content_type):
+    """
+    Sirve un archivo local (almacenamiento local o blob de la caché) con
+    200 o 206, por trozos.
+    """
+    size = os.path.getsize(path)
+    status = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        resolved = _resolver_range(byte_range, size)
+        if resolved is None:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = resolved
+        status = 206
+
+    # Abierto ya: si la caché desaloja el blob mientras tanto, el
+    # descriptor sigue siendo válido
+    f = open(path, 'rb')
+    f.seek(start)
+    response = StreamingHttpResponse(_iter_archivo(f, end - start + 1), status=status, content_type=content_type)
+    response['Content-Length'] = str(end - start + 1)
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+async def _iter_proxy(upstream, writer, expected_size):
+    """
+    Reenvía el cuerpo de TeraBox en trozos.  Si `writer` no es None el
+    cuerpo es el archivo completo y se guarda en la caché al terminar (se
+    descarta si el cliente corta antes).
+    """
+    chunks = upstream.iter_content(AUDIO_CHUNK_BYTES)
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                break
+            if writer is not None:
+                await asyncio.to_thread(writer.write, chunk)
+            yield chunk
+        if writer is not None:
+            await asyncio.to_thread(writer.commit, expected_size)
+            writer = None
+    finally:
+        if writer is not None:
+            writer.abort()
+        upstream.close()
+
+
+def _respuesta_proxy(terabox_path, byte_range, content_type):
+    """Proxy en streaming desde el backend (TeraBox) reenviando el Range."""
+    header = None
+    if byte_range is not None:
+        start, end = byte_range
+        header = f'bytes=-{end}' if start is None else f"bytes={start}-{'' if end is None else end}"
+    upstream = audioStorageService.stream(terabox_path, header)
+
+    if upstream.status_code == 416:
+        upstream.close()
+        response = HttpResponse(status=416)
+        if upstream.headers.get('Content-Range'):
+            response['Content-Range'] = upstream.headers['Content-Range']
+        return response
+
+    length = upstream.headers.get('Content-Length')
+    content_range = upstream.headers.get('Content-Range')
+    # ¿El cuerpo es el archivo entero? (200, o 206 de 0 al final: los
+    # navegadores piden "bytes=0-" al empezar a reproducir)
+    full = upstream.status_code == 200
+    if upstream.status_code == 206 and content_range:
+        m = re.match(r'bytes (\d+)-(\d+)/(\d+)', content_range)
+        full = bool(m) and int(m.group(1)) == 0 and int(m.group(2)) == int(m.group(3)) - 1
+    writer = audioCacheService.writer(terabox_path) if full else None
+
+    response = StreamingHttpResponse(
+        _iter_proxy(upstream, writer, int(length) if length else None),
+        status=upstream.status_code, content_type=content_type,
+    )
+    if length:
+        response['Content-Length'] = length
+    if upstream.status_code == 206 and content_range:
+        response['Content-Range'] = content_range
+    return response
 
 
 class ShazamController:
@@ -48,51 +265,35 @@ class ShazamController:
     @csrf_exempt
     def subir_cancion(request):
         """
-        POST: Sube una canción y genera fingerprints automáticamente.
-        Body JSON: { title, artist, audio_base64 (WAV), file_type, file_size, duration_seconds }
-        El audio se sube a TeraBox; solo metadatos y fingerprints van a la BD.
+        POST: Encola la ingesta de una canción y responde 202 con el job.
+        Body binario (recomendado):
+          - audio/wav | application/octet-stream con el WAV como body y
+            metadatos en query (?title=&artist=&duration_seconds=) o
+            cabeceras X-Song-Title / X-Song-Artist / X-Song-Duration.
+          - multipart/form-data: archivo 'audio' + campos title, artist, ...
+        Body JSON (compatibilidad): { title, artist, audio_base64 (WAV), file_type, file_size, duration_seconds }
+        Un worker (manage.py run_ingest_worker) genera los fingerprints, los
+        guarda y sube el audio a TeraBox.  Progreso: GET /api/shazam/jobs/<id>/
         """
         try:
-            body = json.loads(request.body)
-
-            title = body.get("title", "").strip()
-            audio_b64 = body.get("audio_base64", "")
+            meta, audio = _leer_audio(request)
 
+            title = (meta.get("title") or "").strip()
             if not title:
                 return JsonResponse({"status": False, "message": "El título es requerido"}, status=400)
-            if not audio_b64:
+            if not audio:
                 return JsonResponse({"status": False, "message": "El audio es requerido"}, status=400)
 
-            # 1. Decodificar audio
-            wav_bytes = base64.b64decode(audio_b64)
-
-            # 2. Generar fingerprints (antes de guardar nada)
-            fps = fingerprintService.generate_fingerprints(wav_bytes)
-
-            # 3. Crear la canción en BD (sin audio binario)
-            result = songsService.create_song(body)
-            song_id = result['id']
-
-            # 4. Subir audio a TeraBox
-            try:
-                terabox_path = teraboxService.upload_song(song_id, title, wav_bytes)
-                songsService.update_terabox_path(song_id, terabox_path)
-            except Exception as e:
-                print(f"[TeraBox] Error subiendo audio: {e}")
-                # La canción se creó en BD pero sin audio en TeraBox
-                # Los fingerprints aún se guardan, la canción funciona para búsqueda
-
-            # 5. Guardar fingerprints en BD
-            fp_count = fingerprintService.store_fingerprints(song_id, fps)
+            # Encolar job: el WAV va al spool validando la cabecera
+            # (el resto lo hace el worker)
+            meta["title"] = title
+            job = ingestJobsService.create_upload_job(meta, audio)
 
             return JsonResponse({
                 "status": True,
-                "data": {
-                    "song_id": song_id,
-                    "fingerprints_generated": fp_count
-                },
-                "message": f"Canción subida con {fp_count} fingerprints generados"
-            }, status=201)
+                "data": job,
+                "message": f"Canción en cola (job {job['id']})"
+            }, status=202)
 
         except ValueError as e:
             return JsonResponse({"status": False, "message": str(e)}, status=400)
@@ -102,23 +303,58 @@ class ShazamController:
             traceback.print_exc()
             return JsonResponse({"status": False, "message": str(e)}, status=500)
 
+    @staticmethod
+    @csrf_exempt
+    def estado_job(request, job_id):
+        """GET: Estado y progreso de un job de ingesta."""
+        try:
+            job = ingestJobsService.get_job(job_id)
+            if not job:
+                return JsonResponse({"status": False, "message": "Job no encontrado"}, status=404)
+            return JsonResponse({"status": True, "data": job})
+        except Exception as e:
+            return JsonResponse({"status": False, "message": str(e)}, status=500)
+
+    @staticmethod
+    @csrf_exempt
+    def reintentar_job(request, job_id):
+        """POST: Re-encola un job fallido desde la etapa que falló."""
+        try:
+            job = ingestJobsService.retry_job(job_id)
+            return JsonResponse({
+                "status": True,
+                "data": job,
+                "message": f"Job {job_id} re-encolado desde la etapa '{job['stage']}'"
+            }, status=202)
+        except LookupError as e:
+            return JsonResponse({"status": False, "message": str(e)}, status=404)
+        except ValueError as e:
+            return JsonResponse({"status": False, "message": str(e)}, status=409)
+        except Exception as e:
+            return JsonResponse({"status": False, "message": str(e)}, status=500)
+
     @staticmethod
     @csrf_exempt
     def buscar_cancion(request):
         """
-        POST: Busca una canción a partir de audio capturado.
-        Body JSON: { audio_base64 (WAV de ~5 segundos) }
+        POST: Busca una canción a partir de audio capturado (WAV de ~5 segundos).
+        Body binario (audio/wav, application/octet-stream o multipart con
+        archivo 'audio') o JSON { audio_base64 } (compatibilidad).
         """
         try:
-            body = json.loads(request.body)
-            audio_b64 = body.get("audio_base64", "")
+            _meta, audio = _leer_audio(request)
 
-            if not audio_b64:
+            if not audio:
                 return JsonResponse({"status": False, "message": "El audio es requerido"}, status=400)
 
-            # 1. Decodificar audio y generar fingerprints
-            wav_bytes = base64.b64decode(audio_b64)
-            fps = fingerprintService.generate_fingerprints(wav_bytes)
+            # 1. Decodificar audio (incremental si es binario) y generar
+            #    fingerprints con la versión activa del algoritmo
+            params = fingerprintVersionService.active_version()
+            if isinstance(audio, bytes):
+                fps = dspPoolService.fingerprint_wav(audio, params)
+            else:
+                sample_rate, samples = audioStreamService.read_wav_stream(audio)
+                fps = dspPoolService.fingerprint_samples(samples, sample_rate, params)
 
             if not fps:
                 return JsonResponse({
@@ -199,7 +435,13 @@ class ShazamController:
     @staticmethod
     @csrf_exempt
     def audio_cancion(request, song_id):
-        """GET: Descarga/reproduce el audio de una canción (proxy desde TeraBox)."""
+        """
+        GET: Reproduce el audio de una canción en streaming.
+        Desde disco si el almacenamiento lo tiene local (backend local o
+        caché de TeraBox); si no, proxy de TeraBox (que de paso llena la
+        caché).  Soporta Range (206) para que el reproductor
+        pueda saltar sin volver a bajar el archivo.
+        """
         try:
             song = songsService.get_song_by_id(song_id)
             if not song:
@@ -207,13 +449,21 @@ class ShazamController:
 
             terabox_path = song.get('terabox_path')
             if not terabox_path:
-                return JsonResponse({"status": False, "message": "Audio no disponible (no subido a TeraBox)"}, status=404)
+                return JsonResponse({"status": False, "message": "Audio no disponible (no guardado todavía)"}, status=404)
 
-            # Descargar audio desde TeraBox y servirlo al cliente
-            audio_bytes = teraboxService.download_song(terabox_path)
-            response = HttpResponse(audio_bytes, content_type=song.get('file_type', 'audio/wav'))
-            response['Content-Disposition'] = f'inline; filename="{song["title"]}.wav"'
+            content_type = song.get('file_type') or 'audio/wav'
+            byte_range = _leer_range(request.headers.get('Range'))
+            local = audioStorageService.local_path(terabox_path)
+            if local:
+                response = _respuesta_archivo(local, byte_range, content_type)
+            else:
+                response = _respuesta_proxy(terabox_path, byte_range, content_type)
+            response['Accept-Ranges'] = 'bytes'
+            response['Content-Disposition'] = f'inline; filename="{song["title"]}{audioCodecService.extension(content_type)}"'
             return response
+        except LookupError as e:
+            # Clave local cuyo archivo ya no está en disco
+            return JsonResponse({"status": False, "message": str(e)}, status=404)
         except Exception as e:
             return JsonResponse({"status": False, "message": str(e)}, status=500)
 
@@ -237,14 +487,100 @@ class ShazamController:
     @staticmethod
     @csrf_exempt
     def regenerar_todas(request):
-        """POST: Regenera fingerprints de TODAS las canciones."""
+        """
+        POST: Encola la regeneración de fingerprints de TODAS las canciones
+        (un job por canción, versión activa) y responde 202 con el lote.
+        Body opcional: { only_missing: true } → solo las que no tienen
+        fingerprints de la versión activa; { from_peaks: true } →
+        re-empareja desde la caché de picos (sin descargar el audio) las
+        canciones que la tienen.
+        Los workers (manage.py run_ingest_worker) procesan el lote.
+        Progreso: GET /api/shazam/regenerate-all/<batch_id>/ o, en vivo,
+        GET /api/shazam/regenerate-all/<batch_id>/events/ (SSE).
+        """
         try:
-            result = fingerprintService.regenerate_all()
+            body = json.loads(request.body) if request.content_type == 'application/json' and request.body else {}
+            batch = ingestJobsService.create_regenerate_batch(
+                only_missing=bool(body.get("only_missing")), from_peaks=bool(body.get("from_peaks")),
+            )
+            base = f"/api/shazam/regenerate-all/{batch['batch_id']}/"
+            batch["status_url"] = base
+            batch["events_url"] = base + "events/"
             return JsonResponse({
                 "status": True,
-                "data": result,
-                "message": f"Regeneración completa: {result['processed']} canciones procesadas"
-            })
+                "data": batch,
+                "message": f"Regeneración en cola: {batch['total']} canciones"
+            }, status=202)
         except Exception as e:
             import traceback; traceback.print_exc()
             return JsonResponse({"status": False, "message": str(e)}, status=500)
+
+    @staticmethod
+    @csrf_exempt
+    def estado_regeneracion(request, batch_id):
+        """GET: Progreso de un lote de regeneración."""
+        try:
+            batch = ingestJobsService.batch_progress(batch_id)
+            if not batch:
+                return JsonResponse({"status": False, "message": "Lote no encontrado"}, status=404)
+            return JsonResponse({"status": True, "data": batch})
+        except Exception as e:
+            return JsonResponse({"status": False, "message": str(e)}, status=500)
+
+    @staticmethod
+    @csrf_exempt
+    def eventos_regeneracion(request, batch_id):
+        """
+        GET: Progreso de un lote en vivo (text/event-stream).
+        Eventos 'progress' (cada vez que cambia) y 'done' al terminar, con
+        el mismo JSON que estado_regeneracion.  Lee el progreso de la BD,
+        así que funciona aunque los workers sean otros procesos.
+        """
+        if not ingestJobsService.batch_progress(batch_id):
+            return JsonResponse({"status": False, "message": "Lote no encontrado"}, status=404)
+
+        response = StreamingHttpResponse(_eventos_lote(batch_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    @csrf_exempt
+    def reintentar_regeneracion(request, batch_id):
+        """POST: Re-encola los jobs fallidos de un lote de regeneración."""
+        try:
+            batch = ingestJobsService.retry_batch(batch_id)
+            return JsonResponse({
+                "status": True,
+                "data": batch,
+                "message": f"Lote re-encolado: {batch['queued']} canciones pendientes"
+            }, status=202)
+        except LookupError as e:
+            return JsonResponse({"status": False, "message": str(e)}, status=404)
+        except ValueError as e:
+            return JsonResponse({"status": False, "message": str(e)}, status=409)
+        except Exception as e:
+            return JsonResponse({"status": False, "message": str(e)}, status=500)
+
+
+async def _eventos_lote(batch_id):
+    """
+    Generador SSE del progreso de un lote (asíncrono: bajo ASGI no ocupa
+    un hilo por cliente mientras espera).
+    """
+    progress = database_sync_to_async(ingestJobsService.batch_progress)
+    last, last_sent = None, time.monotonic()
+    while True:
+        batch = await progress(batch_id)
+        if batch is None:
+            return
+        if batch != last:
+            event = 'done' if batch['finished'] else 'progress'
+            yield f"event: {event}\ndata: {json.dumps(batch)}\n\n"
+            last, last_sent = batch, time.monotonic()
+            if batch['finished']:
+                return
+        elif time.monotonic() - last_sent >= REGENERATE_EVENTS_KEEPALIVE:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(REGENERATE_EVENTS_INTERVAL)
@@ -0,0 +1,83 @@
+"""
+0010_fingerprints_int64_hash.py - Hash de fingerprints como BIGINT.
+
+El formato nuevo empaqueta los 6 componentes espectrales en un entero
+de 64 bits (ver fingerprintService._pack_hashes) en lugar del SHA-1 hex
+de 40 caracteres.  Filas e índice B-tree varias veces más pequeños y
+comparaciones enteras en los IN (...) de la búsqueda.
+
+Ruta de migración:
+  1. Esta migración renombra la columna `hash` → `hash_sha1` (nullable,
+     conserva su índice) y crea `hash BIGINT` con índice propio.
+  2. Las filas antiguas quedan con hash NULL: no participan en búsquedas
+     hasta ejecutar POST /api/shazam/regenerate-all/, que reescribe todas
+     las canciones en el formato nuevo.
+  3. Tras regenerar, una migración posterior puede eliminar `hash_sha1`
+     (y su índice) para recuperar el espacio.
+
+Usa SQL directo porque la tabla vive en el schema 'app'.
+"""
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_drop_public_duplicates'),
+    ]
+
+    operations = [
+        # 1. Conservar el hash histórico en su propia columna
+        migrations.RunSQL(
+            sql=(
+                "ALTER TABLE app.fingerprints RENAME COLUMN hash TO hash_sha1;"
+                "ALTER TABLE app.fingerprints ALTER COLUMN hash_sha1 DROP NOT NULL;"
+            ),
+            reverse_sql=(
+                "DELETE FROM app.fingerprints WHERE hash_sha1 IS NULL;"
+                "ALTER TABLE app.fingerprints ALTER COLUMN hash_sha1 SET NOT NULL;"
+                "ALTER TABLE app.fingerprints RENAME COLUMN hash_sha1 TO hash;"
+            ),
+        ),
+        # 2. Nueva columna BIGINT + índice B-tree
+        migrations.RunSQL(
+            sql=(
+                "ALTER TABLE app.fingerprints ADD COLUMN IF NOT EXISTS hash BIGINT NULL;"
+                "CREATE INDEX IF NOT EXISTS fingerprints_hash_int64 ON app.fingerprints (hash);"
+            ),
+            reverse_sql=(
+                "DROP INDEX IF EXISTS app.fingerprints_hash_int64;"
+                "ALTER TABLE app.fingerprints DROP COLUMN IF EXISTS hash;"
+            ),
+        ),
+        # Actualizar estado interno de Django (sin tocar la BD)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='fingerprint',
+                    name='idx_fingerprint_hash',
+                ),
+                migrations.AlterField(
+                    model_name='fingerprint',
+                    name='hash',
+                    field=models.BigIntegerField(
+                        db_index=True,
+                        help_text='Hash empaquetado (64 bits) del par espectral',
+                        null=True,
+                    ),
+                ),
+                migrations.AddField(
+                    model_name='fingerprint',
+                    name='hash_sha1',
+                    field=models.CharField(
+                        blank=True,
+                        help_text='Hash SHA-1 histórico (formato anterior)',
+                        max_length=40,
+                        null=True,
+                    ),
+                ),
+            ],
+            database_operations=[],
+        ),
+    ]
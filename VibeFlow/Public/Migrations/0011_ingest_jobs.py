@@ -0,0 +1,82 @@
+"""
+0011_ingest_jobs.py - Tabla de jobs de ingesta asíncrona de canciones.
+
+POST /api/shazam/upload/ ya no procesa el audio dentro del request:
+encola un job en app.ingest_jobs y responde 202.  Los workers
+(manage.py run_ingest_worker) lo toman con FOR UPDATE SKIP LOCKED y
+ejecutan las etapas fingerprint → store → terabox.
+
+Usa SQL directo porque la tabla vive en el schema 'app'.
+"""
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_fingerprints_int64_hash'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS app.ingest_jobs (
+                    id                BIGSERIAL PRIMARY KEY,
+                    kind              VARCHAR(20)  NOT NULL DEFAULT 'upload',
+                    status            VARCHAR(20)  NOT NULL DEFAULT 'queued',
+                    stage             VARCHAR(20)  NOT NULL DEFAULT 'fingerprint',
+                    song_id           BIGINT NULL REFERENCES app.songs (id) ON DELETE SET NULL,
+                    payload           JSONB        NOT NULL DEFAULT '{}'::jsonb,
+                    audio_path        VARCHAR(500) NULL,
+                    fingerprints_path VARCHAR(500) NULL,
+                    fingerprint_count INTEGER      NOT NULL DEFAULT 0,
+                    stage_timings     JSONB        NOT NULL DEFAULT '{}'::jsonb,
+                    attempts          INTEGER      NOT NULL DEFAULT 0,
+                    error             TEXT NULL,
+                    worker            VARCHAR(100) NULL,
+                    heartbeat_at      TIMESTAMPTZ NULL,
+                    created_at        TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+                    updated_at        TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+                    finished_at       TIMESTAMPTZ NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON app.ingest_jobs (status, id);
+                CREATE INDEX IF NOT EXISTS ingest_jobs_song_id ON app.ingest_jobs (song_id);
+            """,
+            reverse_sql="DROP TABLE IF EXISTS app.ingest_jobs;",
+        ),
+        # Actualizar estado interno de Django (sin tocar la BD)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='IngestJob',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('kind', models.CharField(default='upload', help_text='Tipo de job (upload)', max_length=20)),
+                        ('status', models.CharField(choices=[('queued', 'En cola'), ('running', 'En ejecución'), ('failed', 'Fallido'), ('done', 'Completado')], default='queued', help_text='Estado del job', max_length=20)),
+                        ('stage', models.CharField(default='fingerprint', help_text='Etapa pendiente o fallida', max_length=20)),
+                        ('payload', models.JSONField(default=dict, help_text='Metadatos de la canción (title, artist, ...)')),
+                        ('audio_path', models.CharField(blank=True, help_text='WAV en el spool local', max_length=500, null=True)),
+                        ('fingerprints_path', models.CharField(blank=True, help_text='Fingerprints (.npz) en el spool local', max_length=500, null=True)),
+                        ('fingerprint_count', models.IntegerField(default=0, help_text='Cantidad de fingerprints generados')),
+                        ('stage_timings', models.JSONField(default=dict, help_text='Segundos por etapa')),
+                        ('attempts', models.IntegerField(default=0, help_text='Veces que un worker tomó el job')),
+                        ('error', models.TextField(blank=True, help_text='Último error', null=True)),
+                        ('worker', models.CharField(blank=True, help_text='Worker que lo ejecuta', max_length=100, null=True)),
+                        ('heartbeat_at', models.DateTimeField(blank=True, help_text='Último latido del worker', null=True)),
+                        ('created_at', models.DateTimeField(auto_now_add=True)),
+                        ('updated_at', models.DateTimeField(auto_now=True)),
+                        ('finished_at', models.DateTimeField(blank=True, null=True)),
+                        ('song', models.ForeignKey(blank=True, help_text='Canción creada por el job (tras la etapa store)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingest_jobs', to='accounts.song')),
+                    ],
+                    options={
+                        'db_table': 'ingest_jobs',
+                        'ordering': ['-created_at'],
+                        'indexes': [models.Index(fields=['status', 'id'], name='idx_ingest_jobs_status')],
+                    },
+                ),
+            ],
+            database_operations=[],
+        ),
+    ]
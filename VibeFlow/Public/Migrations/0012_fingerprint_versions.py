@@ -0,0 +1,86 @@
+"""
+0012_fingerprint_versions.py - Versiones del algoritmo de fingerprinting.
+
+Cada fila de app.fingerprints se etiqueta con algo_version y la tabla
+app.fingerprint_versions guarda los parámetros de cada versión y su
+estado (building → active → retired → collected).  Así una versión nueva
+se construye junto a la activa, la búsqueda sigue fijada a la activa y
+el cambio es un UPDATE atómico (ver fingerprintVersionService).
+
+Las filas existentes quedan en la versión 1; su fila en
+app.fingerprint_versions la crea el primer proceso que arranca, con los
+parámetros de su configuración (.env), que son los que generaron esas
+filas.  Con FINGERPRINT_INDEX=mmap hay que volver a exportar el índice
+(el archivo anterior no lleva versión y se ignora hasta entonces).
+
+Usa SQL directo porque las tablas viven en el schema 'app'.
+"""
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_ingest_jobs'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS app.fingerprint_versions (
+                    version      SMALLINT PRIMARY KEY,
+                    params       JSONB       NOT NULL,
+                    status       VARCHAR(20) NOT NULL DEFAULT 'building',
+                    created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    activated_at TIMESTAMPTZ NULL,
+                    retired_at   TIMESTAMPTZ NULL
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS fingerprint_versions_one_active
+                    ON app.fingerprint_versions (status) WHERE status = 'active';
+            """,
+            reverse_sql="DROP TABLE IF EXISTS app.fingerprint_versions;",
+        ),
+        # Con DEFAULT constante Postgres no reescribe la tabla
+        migrations.RunSQL(
+            sql=(
+                "ALTER TABLE app.fingerprints ADD COLUMN IF NOT EXISTS algo_version SMALLINT NOT NULL DEFAULT 1;"
+                "CREATE INDEX IF NOT EXISTS fingerprints_song_version ON app.fingerprints (song_id, algo_version);"
+            ),
+            reverse_sql=(
+                "DROP INDEX IF EXISTS app.fingerprints_song_version;"
+                "ALTER TABLE app.fingerprints DROP COLUMN IF EXISTS algo_version;"
+            ),
+        ),
+        # Actualizar estado interno de Django (sin tocar la BD)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='FingerprintVersion',
+                    fields=[
+                        ('version', models.SmallIntegerField(help_text='Número de versión (app.fingerprints.algo_version)', primary_key=True, serialize=False)),
+                        ('params', models.JSONField(help_text='Parámetros del algoritmo (fingerprintService.AlgoParams)')),
+                        ('status', models.CharField(choices=[('building', 'En construcción'), ('active', 'Activa'), ('retired', 'Retirada'), ('collected', 'Filas borradas')], default='building', help_text='Estado de la versión', max_length=20)),
+                        ('created_at', models.DateTimeField(auto_now_add=True)),
+                        ('activated_at', models.DateTimeField(blank=True, null=True)),
+                        ('retired_at', models.DateTimeField(blank=True, null=True)),
+                    ],
+                    options={
+                        'db_table': 'fingerprint_versions',
+                        'ordering': ['version'],
+                        'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('status',), name='fingerprint_versions_one_active')],
+                    },
+                ),
+                migrations.AddField(
+                    model_name='fingerprint',
+                    name='algo_version',
+                    field=models.SmallIntegerField(default=1, help_text='Versión del algoritmo que generó el hash'),
+                ),
+                migrations.AddIndex(
+                    model_name='fingerprint',
+                    index=models.Index(fields=['song', 'algo_version'], name='fingerprints_song_version'),
+                ),
+            ],
+            database_operations=[],
+        ),
+    ]
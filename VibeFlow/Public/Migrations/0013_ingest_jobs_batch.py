@@ -0,0 +1,53 @@
+"""
+0013_ingest_jobs_batch.py - Lotes de jobs (regeneración de fingerprints).
+
+POST /api/shazam/regenerate-all/ ya no regenera el catálogo dentro del
+request: encola un job 'regenerate' por canción en app.ingest_jobs, todos
+con el mismo batch_id.  Cada job es el checkpoint de su canción (un
+lote interrumpido se retoma con los jobs pendientes/fallidos) y el
+progreso del lote se agrega por batch_id.
+
+Usa SQL directo porque la tabla vive en el schema 'app'.
+"""
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_fingerprint_versions'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "ALTER TABLE app.ingest_jobs ADD COLUMN IF NOT EXISTS batch_id UUID NULL;"
+                "CREATE INDEX IF NOT EXISTS ingest_jobs_batch ON app.ingest_jobs (batch_id, status);"
+            ),
+            reverse_sql=(
+                "DROP INDEX IF EXISTS app.ingest_jobs_batch;"
+                "ALTER TABLE app.ingest_jobs DROP COLUMN IF EXISTS batch_id;"
+            ),
+        ),
+        # Actualizar estado interno de Django (sin tocar la BD)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='ingestjob',
+                    name='batch_id',
+                    field=models.UUIDField(blank=True, help_text='Lote al que pertenece (regeneración)', null=True),
+                ),
+                migrations.AlterField(
+                    model_name='ingestjob',
+                    name='kind',
+                    field=models.CharField(default='upload', help_text='Tipo de job (upload | regenerate)', max_length=20),
+                ),
+                migrations.AddIndex(
+                    model_name='ingestjob',
+                    index=models.Index(fields=['batch_id', 'status'], name='ingest_jobs_batch'),
+                ),
+            ],
+            database_operations=[],
+        ),
+    ]
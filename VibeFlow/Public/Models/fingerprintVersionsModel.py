@@ -0,0 +1,42 @@
+"""
+fingerprintVersionsModel.py - Versiones del algoritmo de fingerprinting (Shazam MVP).
+
+Cada versión guarda los parámetros con los que se generaron sus filas de
+app.fingerprints (algo_version).  Solo una está 'active' (la que usa la
+búsqueda); una versión nueva se construye en 'building' junto a ella y
+al activarla la anterior pasa a 'retired' hasta que el GC borra sus
+filas ('collected').  Ver fingerprintVersionService.
+"""
+
+from django.db import models
+
+
+class FingerprintVersion(models.Model):
+    STATUS_CHOICES = [
+        ('building', 'En construcción'),
+        ('active', 'Activa'),
+        ('retired', 'Retirada'),
+        ('collected', 'Filas borradas'),
+    ]
+
+    version = models.SmallIntegerField(primary_key=True, help_text="Número de versión (app.fingerprints.algo_version)")
+    params = models.JSONField(help_text="Parámetros del algoritmo (fingerprintService.AlgoParams)")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='building', help_text="Estado de la versión")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+    retired_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'accounts'
+        db_table = 'fingerprint_versions'
+        ordering = ['version']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['status'], condition=models.Q(status='active'),
+                name='fingerprint_versions_one_active',
+            ),
+        ]
+
+    def __str__(self):
+        return f"FingerprintVersion({self.version}, {self.status})"
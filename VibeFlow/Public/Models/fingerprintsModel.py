@@ -1,6 +1,14 @@
 """
 fingerprintsModel.py - Modelo para fingerprints de audio (Shazam MVP).
 Cada fingerprint es un hash derivado de picos espectrales.
+
+`hash` es un entero de 64 bits con los componentes espectrales
+empaquetados.  `hash_sha1` conserva el formato histórico (hex de 40
+caracteres) solo hasta que se regeneren todas las canciones.
+
+`algo_version` indica con qué versión del algoritmo se generó el hash
+(ver fingerprintVersionsModel): durante un re-indexado conviven las
+filas de la versión activa y las de la nueva.
 """
 
 from django.db import models
@@ -12,14 +20,16 @@ class Fingerprint(models.Model):
         related_name='fingerprints',
         help_text="Canción a la que pertenece este fingerprint"
     )
-    hash = models.CharField(max_length=40, db_index=True, help_text="SHA-1 hash del pico espectral")
+    hash = models.BigIntegerField(null=True, db_index=True, help_text="Hash empaquetado (64 bits) del par espectral")
+    hash_sha1 = models.CharField(max_length=40, null=True, blank=True, help_text="Hash SHA-1 histórico (formato anterior)")
     time_offset = models.IntegerField(help_text="Offset temporal en frames desde el inicio")
+    algo_version = models.SmallIntegerField(default=1, help_text="Versión del algoritmo que generó el hash")
 
     class Meta:
         app_label = 'accounts'
         db_table = 'fingerprints'
         indexes = [
-            models.Index(fields=['hash'], name='idx_fingerprint_hash'),
+            models.Index(fields=['song', 'algo_version'], name='fingerprints_song_version'),
         ]
 
     def __str__(self):
@@ -0,0 +1,57 @@
+"""
+ingestJobsModel.py - Jobs de ingesta de canciones (Shazam MVP).
+
+Cada subida crea un job que los workers (manage.py run_ingest_worker)
+ejecutan por etapas: fingerprint → store → terabox.  `stage` es la etapa
+pendiente (o la que falló); reintentar un job retoma desde ahí usando
+los artefactos ya guardados en el spool (audio y fingerprints).
+
+La regeneración del catálogo crea un job 'regenerate' por canción
+(download → fingerprint → replace) agrupados por batch_id.
+"""
+
+from django.db import models
+
+
+class IngestJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'En cola'),
+        ('running', 'En ejecución'),
+        ('failed', 'Fallido'),
+        ('done', 'Completado'),
+    ]
+
+    kind = models.CharField(max_length=20, default='upload', help_text="Tipo de job (upload | regenerate)")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', help_text="Estado del job")
+    stage = models.CharField(max_length=20, default='fingerprint', help_text="Etapa pendiente o fallida")
+    song = models.ForeignKey(
+        'accounts.Song', on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='ingest_jobs',
+        help_text="Canción creada por el job (tras la etapa store)"
+    )
+    batch_id = models.UUIDField(null=True, blank=True, help_text="Lote al que pertenece (regeneración)")
+    payload = models.JSONField(default=dict, help_text="Metadatos de la canción (title, artist, ...)")
+    audio_path = models.CharField(max_length=500, null=True, blank=True, help_text="WAV en el spool local")
+    fingerprints_path = models.CharField(max_length=500, null=True, blank=True, help_text="Fingerprints (.npz) en el spool local")
+    fingerprint_count = models.IntegerField(default=0, help_text="Cantidad de fingerprints generados")
+    stage_timings = models.JSONField(default=dict, help_text="Segundos por etapa")
+    attempts = models.IntegerField(default=0, help_text="Veces que un worker tomó el job")
+    error = models.TextField(null=True, blank=True, help_text="Último error")
+    worker = models.CharField(max_length=100, null=True, blank=True, help_text="Worker que lo ejecuta")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Último latido del worker")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'accounts'
+        db_table = 'ingest_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='idx_ingest_jobs_status'),
+            models.Index(fields=['batch_id', 'status'], name='ingest_jobs_batch'),
+        ]
+
+    def __str__(self):
+        return f"IngestJob({self.id}, {self.kind}, {self.status}/{self.stage})"
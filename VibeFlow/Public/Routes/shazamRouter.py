@@ -9,9 +9,15 @@ urlpatterns = [
     # GET /api/shazam/ — listar canciones
     path('', ShazamController.obtener_canciones, name='api-shazam-list'),
 
-    # POST /api/shazam/upload/ — subir canción + generar fingerprints
+    # POST /api/shazam/upload/ — encolar ingesta de canción (202 + job)
     path('upload/', ShazamController.subir_cancion, name='api-shazam-upload'),
 
+    # GET /api/shazam/jobs/<id>/ — estado/progreso de un job de ingesta
+    path('jobs/<int:job_id>/', ShazamController.estado_job, name='api-shazam-job'),
+
+    # POST /api/shazam/jobs/<id>/retry/ — reintentar job fallido
+    path('jobs/<int:job_id>/retry/', ShazamController.reintentar_job, name='api-shazam-job-retry'),
+
     # POST /api/shazam/search/ — buscar canción por audio
     path('search/', ShazamController.buscar_cancion, name='api-shazam-search'),
 
@@ -30,6 +36,15 @@ urlpatterns = [
     # POST /api/shazam/<id>/regenerate/ — regenerar fingerprints de 1 canción
     path('<int:song_id>/regenerate/', ShazamController.regenerar_cancion, name='api-shazam-regenerate'),
 
-    # POST /api/shazam/regenerate-all/ — regenerar fingerprints de TODAS
+    # POST /api/shazam/regenerate-all/ — encolar regeneración de TODAS (202 + lote)
     path('regenerate-all/', ShazamController.regenerar_todas, name='api-shazam-regenerate-all'),
+
+    # GET /api/shazam/regenerate-all/<batch_id>/ — progreso de un lote de regeneración
+    path('regenerate-all/<uuid:batch_id>/', ShazamController.estado_regeneracion, name='api-shazam-regenerate-batch'),
+
+    # GET /api/shazam/regenerate-all/<batch_id>/events/ — progreso en vivo (SSE)
+    path('regenerate-all/<uuid:batch_id>/events/', ShazamController.eventos_regeneracion, name='api-shazam-regenerate-events'),
+
+    # POST /api/shazam/regenerate-all/<batch_id>/retry/ — reintentar canciones fallidas del lote
+    path('regenerate-all/<uuid:batch_id>/retry/', ShazamController.reintentar_regeneracion, name='api-shazam-regenerate-retry'),
 ]
@@ -0,0 +1,348 @@
+"""
+audioCacheService.py - Caché LRU en disco del audio descargado de TeraBox.
+
+Cada descarga de TeraBox resuelve un dlink y baja el archivo completo.
+Reproducir una canción dos veces o regenerar sus fingerprints volvía a
+bajar los mismos bytes; con esta caché solo la primera vez va a la red.
+
+Estructura (direccionada por contenido):
+
+  AUDIO_CACHE_DIR/blobs/ab/<sha256 del audio>     contenido
+  AUDIO_CACHE_DIR/refs/cd/<sha256 de la ruta>     sha256 del contenido
+
+Dos rutas remotas con el mismo audio comparten blob.  Las escrituras son
+atómicas (temporal en el mismo directorio + os.replace): un lector nunca
+ve un archivo a medias y varios procesos (servidor web, workers) pueden
+compartir el directorio.  Cada acierto actualiza el mtime del blob; al
+pasar de AUDIO_CACHE_MAX_BYTES se borran los blobs menos usados hasta
+quedar en el 90 % del tope.  Las refs que apuntan a un blob borrado se
+limpian al consultarlas.
+
+writer() guarda un archivo que llega por trozos (proxy de streaming de
+audio_cancion) sin tenerlo entero en memoria; local_path() da la ruta
+del blob para servirlo desde disco.
+
+Variables de entorno:
+  AUDIO_CACHE_DIR        directorio de la caché (var/audio-cache)
+  AUDIO_CACHE_MAX_BYTES  tope de tamaño (2 GB); 0 desactiva la caché
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+
+# ── Configuración ──────────────────────────────────────────────────────
+AUDIO_CACHE_DIR = os.getenv(
+    'AUDIO_CACHE_DIR',
+    str(Path(__file__).resolve().parents[3] / 'var' / 'audio-cache'),
+)
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+
+# Al desalojar se baja hasta esta fracción del tope (evita desalojar en
+# cada escritura cuando la caché está llena)
+_LOW_WATERMARK = 0.9
+
+
+class AudioDiskCache:
+    """Caché de blobs en disco con desalojo LRU y métricas (thread-safe)."""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._used = None        # bytes en blobs; se calcula al primer uso
+        self.hits = 0
+        self.misses = 0
+        self.hit_bytes = 0
+        self.stored = 0
+        self.evicted = 0
+
+    # ── Rutas ──────────────────────────────────────────────────────────
+    def _blob_path(self, digest):
+        return os.path.join(self.root, 'blobs', digest[:2], digest)
+
+    def _ref_path(self, key):
+        h = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'refs', h[:2], h)
+
+    def _tmp_dir(self):
+        return os.path.join(self.root, 'tmp')
+
+    @staticmethod
+    def _write_atomic(path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    # ── Lectura ────────────────────────────────────────────────────────
+    def path(self, key):
+        """
+        Ruta local del blob de `key` (y lo marca como recién usado) o None.
+        No cuenta como acierto ni fallo.
+        """
+        ref = self._ref_path(key)
+        try:
+            with open(ref, 'r') as f:
+                digest = f.read().strip()
+        except FileNotFoundError:
+            return None
+        blob = self._blob_path(digest)
+        try:
+            os.utime(blob)
+        except FileNotFoundError:
+            # Blob desalojado: la ref ya no sirve
+            self._remove(ref)
+            return None
+        return blob
+
+    def lookup(self, key):
+        """Como path() pero cuenta acierto/fallo (para servir el blob desde disco)."""
+        blob = self.path(key)
+        size = 0
+        if blob is not None:
+            try:
+                size = os.path.getsize(blob)
+            except FileNotFoundError:
+                blob = None
+        with self._lock:
+            if blob is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.hit_bytes += size
+        return blob
+
+    def get(self, key):
+        """Contenido cacheado de `key` o None."""
+        blob = self.path(key)
+        data = None
+        if blob is not None:
+            try:
+                with open(blob, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                pass     # desalojado entre path() y open()
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.hit_bytes += len(data)
+        return data
+
+    # ── Escritura ──────────────────────────────────────────────────────
+    def put(self, key, data):
+        """
+        Guarda `data` para `key`.  Retorna el sha256 del contenido, o None
+        si no cabe (mayor que el tope).
+        """
+        writer = self.writer(key)
+        writer.write(data)
+        return writer.commit()
+
+    def writer(self, key):
+        """CacheWriter para guardar el contenido de `key` por trozos."""
+        return CacheWriter(self, key)
+
+    def _commit(self, key, tmp_path, digest, size):
+        """Mueve el temporal de un CacheWriter a su blob y escribe la ref."""
+        blob = self._blob_path(digest)
+        added = 0
+        if os.path.exists(blob):
+            os.remove(tmp_path)
+            os.utime(blob)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(tmp_path, blob)
+            added = size
+        self._write_atomic(self._ref_path(key), digest.encode('ascii'))
+
+        with self._lock:
+            if self._used is None:
+                self._used = self._scan_size()
+            else:
+                self._used += added
+            self.stored += bool(added)
+            if self._used > self.max_bytes:
+                self._evict()
+        return digest
+
+    def invalidate(self, key):
+        """Olvida la ref de `key` (el blob se desaloja por LRU si nadie lo usa)."""
+        self._remove(self._ref_path(key))
+
+    # ── Desalojo ───────────────────────────────────────────────────────
+    def _blobs(self):
+        """[(mtime, tamaño, ruta)] de todos los blobs."""
+        entries = []
+        blobs_dir = os.path.join(self.root, 'blobs')
+        if not os.path.isdir(blobs_dir):
+            return entries
+        for sub in os.scandir(blobs_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _mtime, size, _path in self._blobs())
+
+    def _evict(self):
+        """
+        Borra los blobs menos usados hasta quedar bajo el 90 % del tope.
+        Re-escanea el disco: otros procesos que comparten el directorio
+        también escriben.  Llamar con self._lock tomado.
+        """
+        entries = sorted(self._blobs())
+        used = sum(size for _mtime, size, _path in entries)
+        target = self.max_bytes * _LOW_WATERMARK
+        freed = 0
+        for _mtime, size, path in entries:
+            if used - freed <= target:
+                break
+            if self._remove(path):
+                freed += size
+                self.evicted += 1
+        self._used = used - freed
+        print(f"[AudioCache] Desalojados {freed} bytes ({self._used}/{self.max_bytes} en uso)")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    # ── Métricas ───────────────────────────────────────────────────────
+    def stats(self):
+        with self._lock:
+            if self._used is None:
+                self._used = self._scan_size()
+            lookups = self.hits + self.misses
+            return {
+                'hits':       self.hits,
+                'misses':     self.misses,
+                'hit_ratio':  round(self.hits / lookups, 3) if lookups else None,
+                'hit_bytes':  self.hit_bytes,
+                'stored':     self.stored,
+                'evicted':    self.evicted,
+                'used_bytes': self._used,
+                'max_bytes':  self.max_bytes,
+            }
+
+
+class CacheWriter:
+    """
+    Escritura por trozos de un blob: temporal en AUDIO_CACHE_DIR/tmp +
+    sha256 incremental.  commit() lo publica; abort() (o pasar del tope)
+    lo descarta.
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.size = 0
+        self._sha = hashlib.sha256()
+        os.makedirs(cache._tmp_dir(), exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(dir=cache._tmp_dir(), prefix='.tmp-')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        if self._file is None:
+            return
+        self.size += len(chunk)
+        if self.size > self.cache.max_bytes:
+            self.abort()
+            return
+        self._sha.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self, expected_size=None):
+        """
+        Publica el blob.  Con expected_size solo si llegó completo.
+        Retorna el sha256 o None si se descartó.
+        """
+        if self._file is None:
+            return None
+        if expected_size is not None and self.size != expected_size:
+            self.abort()
+            return None
+        self._file.close()
+        self._file = None
+        digest = self._sha.hexdigest()
+        try:
+            self.cache._commit(self.key, self._tmp, digest, self.size)
+        except BaseException:
+            self.cache._remove(self._tmp)
+            raise
+        return digest
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self.cache._remove(self._tmp)
+
+
+_cache = AudioDiskCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES) if AUDIO_CACHE_MAX_BYTES > 0 else None
+
+
+def fetch(key, loader):
+    """
+    Contenido de `key` desde la caché; si no está, lo obtiene con
+    loader(key), lo guarda y lo retorna.
+    """
+    if _cache is None:
+        return loader(key)
+    data = _cache.get(key)
+    if data is not None:
+        return data
+    data = loader(key)
+    _cache.put(key, data)
+    return data
+
+
+def put(key, data):
+    """Guarda contenido ya disponible (p. ej. recién subido a TeraBox)."""
+    if _cache is not None:
+        _cache.put(key, data)
+
+
+def local_path(key):
+    """Ruta del blob cacheado de `key` (cuenta acierto/fallo) o None."""
+    return _cache.lookup(key) if _cache is not None else None
+
+
+def writer(key):
+    """CacheWriter para `key` o None si la caché está desactivada."""
+    return _cache.writer(key) if _cache is not None else None
+
+
+def invalidate(key):
+    if _cache is not None:
+        _cache.invalidate(key)
+
+
+def stats():
+    """Métricas de la caché en este proceso (None si está desactivada)."""
+    return _cache.stats() if _cache is not None else None
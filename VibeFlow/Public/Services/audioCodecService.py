@@ -0,0 +1,159 @@
+"""
+audioCodecService.py - Formato de almacenamiento del audio (WAV o FLAC).
+
+Con AUDIO_STORAGE_FORMAT=flac las canciones se guardan comprimidas sin
+pérdida: el worker de ingesta codifica el WAV del spool a FLAC antes de
+subirlo (la mitad de bytes, aprox., en almacenamiento, descargas y
+regeneración).  Las grabaciones WAV se comprimen al guardarlas.
+
+Para fingerprintar, el FLAC se decodifica directamente a float32 mono
+por bloques (sin pasar por un WAV intermedio).  Para reproducir se sirve
+tal cual (audio/flac): todos los navegadores actuales lo reproducen en
+<audio>, con Range.
+
+El formato se detecta por la firma del archivo ("fLaC"), no por la
+configuración: un catálogo puede mezclar canciones WAV antiguas y FLAC
+nuevas, y volver a AUDIO_STORAGE_FORMAT=wav no rompe las existentes.
+
+Dependencia opcional: soundfile (libsndfile).  Solo hace falta con
+AUDIO_STORAGE_FORMAT=flac o si hay audio FLAC guardado.
+
+Variables de entorno:
+  AUDIO_STORAGE_FORMAT  wav | flac (wav)
+"""
+
+import io
+import os
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+import numpy as np
+
+# ── Configuración ──────────────────────────────────────────────────────
+AUDIO_STORAGE_FORMAT = os.getenv('AUDIO_STORAGE_FORMAT', 'wav').lower()
+
+# Extensión y Content-Type de cada formato
+FORMATS = {
+    'wav':  ('.wav', 'audio/wav'),
+    'flac': ('.flac', 'audio/flac'),
+}
+
+FLAC_MAGIC = b'fLaC'
+
+# Frames por bloque al codificar/decodificar (memoria acotada)
+BLOCK_FRAMES = 256 * 1024
+
+if AUDIO_STORAGE_FORMAT not in FORMATS:
+    raise ValueError(
+        f"AUDIO_STORAGE_FORMAT no soportado: {AUDIO_STORAGE_FORMAT} "
+        f"(usa {', '.join(FORMATS)})"
+    )
+if AUDIO_STORAGE_FORMAT == 'flac' and soundfile is None:
+    raise ImportError("AUDIO_STORAGE_FORMAT=flac requiere soundfile (pip install soundfile)")
+
+
+def _require():
+    if soundfile is None:
+        raise ImportError("Leer/escribir audio FLAC requiere soundfile (pip install soundfile)")
+
+
+def compress():
+    """¿Se guarda el audio nuevo en FLAC?"""
+    return AUDIO_STORAGE_FORMAT == 'flac'
+
+
+def extension(file_type):
+    """Extensión de archivo para un Content-Type de audio (.wav por defecto)."""
+    for ext, mime in FORMATS.values():
+        if mime == file_type:
+            return ext
+    return '.wav'
+
+
+def is_flac(data):
+    """¿Los primeros bytes son de un FLAC?"""
+    return bytes(data[:4]) == FLAC_MAGIC
+
+
+def file_is_flac(path):
+    with open(path, 'rb') as f:
+        return is_flac(f.read(4))
+
+
+# ── Codificación ───────────────────────────────────────────────────────
+def _flac_subtype(info):
+    """
+    Subtipo FLAC para el WAV de origen.  FLAC admite enteros de 8, 16 y
+    24 bits; PCM de 32 bits y float se guardan en 24 bits (más que de
+    sobra para reproducir y fingerprintar).
+    """
+    if info.subtype in ('PCM_S8', 'PCM_U8'):
+        return 'PCM_S8'
+    if info.subtype == 'PCM_16':
+        return 'PCM_16'
+    return 'PCM_24'
+
+
+def _encode(src, dest):
+    """Copia el audio de `src` a `dest` (archivos o buffers) como FLAC."""
+    _require()
+    with soundfile.SoundFile(src) as wav:
+        # Enteros → int32 (exacto); float → float32 (se cuantiza al escribir)
+        dtype = 'int32' if wav.subtype.startswith('PCM') else 'float32'
+        with soundfile.SoundFile(
+            dest, 'w', samplerate=wav.samplerate, channels=wav.channels,
+            format='FLAC', subtype=_flac_subtype(wav),
+        ) as flac:
+            while True:
+                block = wav.read(BLOCK_FRAMES, dtype=dtype)
+                if not len(block):
+                    break
+                flac.write(block)
+
+
+def encode_flac_file(src_path, dest_path):
+    """Codifica un WAV en disco a FLAC.  Retorna el tamaño del FLAC."""
+    try:
+        _encode(src_path, dest_path)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return os.path.getsize(dest_path)
+
+
+def encode_flac(wav_bytes):
+    """Codifica un WAV (bytes) a FLAC (bytes)."""
+    out = io.BytesIO()
+    _encode(io.BytesIO(wav_bytes), out)
+    return out.getvalue()
+
+
+# ── Decodificación ─────────────────────────────────────────────────────
+def _mono(block):
+    """(frames, canales) float32 → mono float32."""
+    return block[:, 0] if block.shape[1] == 1 else block.mean(axis=1, dtype=np.float32)
+
+
+def decode_flac(data):
+    """FLAC (bytes) → (sample_rate, muestras mono float32)."""
+    _require()
+    samples, sample_rate = soundfile.read(io.BytesIO(data), dtype='float32', always_2d=True)
+    return sample_rate, _mono(samples)
+
+
+def flac_info(path):
+    """(sample_rate, frames) de un FLAC en disco."""
+    _require()
+    info = soundfile.info(path)
+    return info.samplerate, info.frames
+
+
+def iter_flac_blocks(path, block_frames=BLOCK_FRAMES):
+    """Muestras mono float32 de un FLAC en disco, por bloques."""
+    _require()
+    for block in soundfile.blocks(path, blocksize=block_frames, dtype='float32', always_2d=True):
+        yield _mono(block)
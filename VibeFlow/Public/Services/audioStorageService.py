@@ -0,0 +1,261 @@
+"""
+audioStorageService.py - Almacenamiento del audio de las canciones.
+
+Interfaz común (StorageBackend: put/get/stream/delete/stat) con dos
+implementaciones:
+
+  - TeraBoxStorage: TeraBox (teraboxService) + caché LRU en disco
+    (audioCacheService).  Claves = rutas remotas ("/VibeFlow/songs/...").
+  - LocalStorage:   archivos en AUDIO_STORAGE_DIR (disco local / NVMe).
+    Claves = "local://<archivo>".  Copia con os.sendfile (sin pasar por
+    Python) y expone la ruta para servir/fingerprintar sin copias.
+
+AUDIO_STORAGE_BACKEND elige dónde se GUARDAN las canciones nuevas.  Para
+leer o borrar, el backend sale del prefijo de la clave: al cambiar de
+backend las canciones ya guardadas se siguen leyendo de donde estaban.
+La clave se guarda en app.songs.terabox_path (nombre histórico).
+
+Variables de entorno:
+  AUDIO_STORAGE_BACKEND  terabox | local (terabox)
+  AUDIO_STORAGE_DIR      directorio de LocalStorage (var/audio)
+"""
+
+import os
+import re
+import tempfile
+from pathlib import Path
+from VibeFlow.Public.Services import audioCacheService, teraboxService
+
+# ── Configuración ──────────────────────────────────────────────────────
+AUDIO_STORAGE_BACKEND = os.getenv('AUDIO_STORAGE_BACKEND', 'terabox').lower()
+AUDIO_STORAGE_DIR = os.getenv(
+    'AUDIO_STORAGE_DIR',
+    str(Path(__file__).resolve().parents[3] / 'var' / 'audio'),
+)
+
+LOCAL_PREFIX = 'local://'
+
+# Bloque de os.sendfile al copiar
+_SENDFILE_BYTES = 8 * 1024 * 1024
+
+
+def song_filename(song_id, title, ext='.wav'):
+    """Nombre normalizado del archivo de una canción: <id>_<titulo><ext>"""
+    safe_title = re.sub(r'[^\w\s-]', '', title).strip().replace(' ', '_')[:50]
+    return f'{song_id}_{safe_title}{ext}'
+
+
+class StorageBackend:
+    """Interfaz de un almacenamiento de audio (claves opacas, str)."""
+
+    name = None
+
+    def put(self, song_id, title, data, ext='.wav'):
+        """
+        Guarda el audio (bytes) de una canción.  `ext` según el formato
+        (.wav, .flac).  Retorna la clave.
+        """
+        raise NotImplementedError
+
+    def put_file(self, song_id, title, path, ext='.wav'):
+        """Como put() pero desde un archivo local."""
+        with open(path, 'rb') as f:
+            return self.put(song_id, title, f.read(), ext)
+
+    def get(self, key):
+        """Contenido completo (bytes)."""
+        raise NotImplementedError
+
+    def fetch_to_file(self, key, dest):
+        """Escribe el contenido en `dest`.  Retorna los bytes escritos."""
+        data = self.get(key)
+        with open(dest, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+    def local_path(self, key):
+        """Ruta de un archivo local con el contenido, o None."""
+        return None
+
+    def stream(self, key, byte_range=None):
+        """
+        Respuesta en streaming (requests.Response o equivalente: status_code,
+        headers, iter_content, close) reenviando la cabecera Range.  Solo
+        hace falta cuando local_path() es None.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def stat(self, key):
+        """{'size': bytes} o None si no existe."""
+        raise NotImplementedError
+
+    def prefetch(self, keys):
+        """Prepara la lectura de varias claves (p. ej. resolver dlinks)."""
+
+
+class TeraBoxStorage(StorageBackend):
+    name = 'terabox'
+
+    def put(self, song_id, title, data, ext='.wav'):
+        return teraboxService.upload_song(song_filename(song_id, title, ext), data)
+
+    def get(self, key):
+        return teraboxService.download_song(key)
+
+    def local_path(self, key):
+        # Blob de la caché en disco, si está
+        return audioCacheService.local_path(key)
+
+    def stream(self, key, byte_range=None):
+        return teraboxService.open_song_stream(key, byte_range)
+
+    def delete(self, key):
+        return teraboxService.delete_song(key)
+
+    def stat(self, key):
+        return teraboxService.get_client().stat(key)
+
+    def prefetch(self, keys):
+        teraboxService.resolve_download_urls(keys)
+
+
+class LocalStorage(StorageBackend):
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        name = key[len(LOCAL_PREFIX):]
+        if not key.startswith(LOCAL_PREFIX) or not name or os.path.basename(name) != name:
+            raise ValueError(f"Clave de almacenamiento local inválida: {key}")
+        return os.path.join(self.root, name)
+
+    def _store(self, song_id, title, ext, write):
+        """Escritura atómica: temporal en el mismo directorio + os.replace."""
+        name = song_filename(song_id, title, ext)
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, os.path.join(self.root, name))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return LOCAL_PREFIX + name
+
+    def put(self, song_id, title, data, ext='.wav'):
+        return self._store(song_id, title, ext, lambda f: f.write(data))
+
+    def put_file(self, song_id, title, path, ext='.wav'):
+        with open(path, 'rb') as src:
+            return self._store(song_id, title, ext, lambda f: _sendfile(src, f))
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def fetch_to_file(self, key, dest):
+        with open(self._path(key), 'rb') as src, open(dest, 'wb') as f:
+            return _sendfile(src, f)
+
+    def local_path(self, key):
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def stream(self, key, byte_range=None):
+        raise LookupError(f"Audio no encontrado: {key}")
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def stat(self, key):
+        try:
+            return {'size': os.path.getsize(self._path(key))}
+        except FileNotFoundError:
+            return None
+
+
+def _sendfile(src, dst):
+    """Copia src → dst (archivos abiertos) con os.sendfile; retorna bytes."""
+    total, offset = 0, 0
+    size = os.fstat(src.fileno()).st_size
+    dst.flush()
+    while offset < size:
+        sent = os.sendfile(dst.fileno(), src.fileno(), offset, min(_SENDFILE_BYTES, size - offset))
+        if sent == 0:
+            break
+        offset += sent
+        total += sent
+    return total
+
+
+_backends = {
+    'terabox': TeraBoxStorage(),
+    'local':   LocalStorage(AUDIO_STORAGE_DIR),
+}
+
+if AUDIO_STORAGE_BACKEND not in _backends:
+    raise ValueError(
+        f"AUDIO_STORAGE_BACKEND no soportado: {AUDIO_STORAGE_BACKEND} "
+        f"(usa {', '.join(_backends)})"
+    )
+
+
+def get_backend():
+    """Backend donde se guardan las canciones nuevas (AUDIO_STORAGE_BACKEND)."""
+    return _backends[AUDIO_STORAGE_BACKEND]
+
+
+def backend_for(key):
+    """Backend que tiene la clave `key` (según su prefijo)."""
+    return _backends['local' if key.startswith(LOCAL_PREFIX) else 'terabox']
+
+
+# ── Atajos ─────────────────────────────────────────────────────────────
+def put_song(song_id, title, data, ext='.wav'):
+    return get_backend().put(song_id, title, data, ext)
+
+
+def put_song_file(song_id, title, path, ext='.wav'):
+    return get_backend().put_file(song_id, title, path, ext)
+
+
+def get(key):
+    return backend_for(key).get(key)
+
+
+def fetch_to_file(key, dest):
+    return backend_for(key).fetch_to_file(key, dest)
+
+
+def local_path(key):
+    return backend_for(key).local_path(key)
+
+
+def stream(key, byte_range=None):
+    return backend_for(key).stream(key, byte_range)
+
+
+def delete(key):
+    return backend_for(key).delete(key)
+
+
+def stat(key):
+    return backend_for(key).stat(key)
+
+
+def prefetch(keys):
+    """Agrupa las claves por backend y llama a su prefetch()."""
+    groups = {}
+    for key in keys:
+        groups.setdefault(backend_for(key).name, []).append(key)
+    for name, group in groups.items():
+        _backends[name].prefetch(group)
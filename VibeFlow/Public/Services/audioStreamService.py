@@ -0,0 +1,421 @@
+"""
+audioStreamService.py - Decodificación incremental de audio en streaming.
+
+Usado por el WebSocket de Shazam: el cliente declara el formato en un
+handshake JSON y luego envía frames PCM crudos (sin cabecera WAV).
+
+  - PcmStreamDecoder: bytes PCM → muestras mono float32.  Conserva los
+    bytes sobrantes cuando un mensaje corta una muestra/frame a la mitad.
+  - AudioRingBuffer:  buffer circular float32 preasignado con las últimas
+    `capacity` muestras.
+  - open_ring / close_ring: reservan el ring de una conexión y el estado
+    de su sesión (STREAM_STATE_BYTES) contra el presupuesto de memoria por
+    conexión y global del proceso.
+  - WavStreamParser / read_wav_stream: WAV recibido por trozos (upload
+    binario) → muestras mono float32, sin tener el archivo entero en RAM.
+
+Variables de entorno:
+  STREAM_BUFFER_SECONDS          ventana de audio por conexión (30)
+  STREAM_MAX_BYTES_PER_CONNECTION tope por conexión: ring + estado de la
+                                 sesión (8 MB)
+  STREAM_MAX_BYTES_TOTAL         tope de todos los rings del proceso (512 MB)
+  STREAM_MIN_BUFFER_SECONDS      ventana mínima aceptable si el presupuesto
+                                 global está justo (5); por debajo se rechaza
+"""
+
+import os
+import struct
+import threading
+import numpy as np
+
+
+# ── Formatos PCM aceptados ─────────────────────────────────────────────
+# nombre → (dtype numpy, factor de escala a [-1, 1])
+SAMPLE_FORMATS = {
+    's16le': ('<i2', 1.0 / 32768.0),
+    'f32le': ('<f4', None),
+}
+
+# ── Presupuestos de memoria ────────────────────────────────────────────
+STREAM_BUFFER_SECONDS           = int(os.getenv('STREAM_BUFFER_SECONDS', '30'))
+STREAM_MIN_BUFFER_SECONDS       = int(os.getenv('STREAM_MIN_BUFFER_SECONDS', '5'))
+STREAM_MAX_BYTES_PER_CONNECTION = int(os.getenv('STREAM_MAX_BYTES_PER_CONNECTION', str(8 * 1024 * 1024)))
+STREAM_MAX_BYTES_TOTAL          = int(os.getenv('STREAM_MAX_BYTES_TOTAL', str(512 * 1024 * 1024)))
+
+SAMPLE_BYTES = np.dtype(np.float32).itemsize
+
+# Parte del presupuesto por conexión para el estado de la sesión fuera
+# del ring: histograma de votos (VoteAccumulator, que dimensiona su tope
+# con esto) y estado del StreamingFingerprinter.  Se reserva con el ring.
+STREAM_STATE_BYTES = STREAM_MAX_BYTES_PER_CONNECTION // 4
+STREAM_STATE_BYTES -= STREAM_STATE_BYTES % SAMPLE_BYTES
+
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 192000
+MAX_CHANNELS    = 8
+
+
+class PcmStreamDecoder:
+    """Decodifica frames PCM intercalados a mono float32, mensaje a mensaje."""
+
+    def __init__(self, sample_rate, channels=1, sample_format='s16le'):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(
+                f"Formato no soportado: {sample_format} "
+                f"(usa {', '.join(SAMPLE_FORMATS)})"
+            )
+        sample_rate = int(sample_rate)
+        channels = int(channels)
+        if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+            raise ValueError(f"sample_rate fuera de rango: {sample_rate}")
+        if not 1 <= channels <= MAX_CHANNELS:
+            raise ValueError(f"channels fuera de rango: {channels}")
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_format = sample_format
+        self._dtype, self._scale = SAMPLE_FORMATS[sample_format]
+        self.frame_bytes = np.dtype(self._dtype).itemsize * channels
+        self._pending = b''
+
+    def feed(self, data):
+        """Decodifica un mensaje binario.  Retorna float32 mono (puede ser vacío)."""
+        buf = self._pending + data if self._pending else data
+        usable = len(buf) - len(buf) % self.frame_bytes
+        self._pending = bytes(buf[usable:])
+
+        samples = np.frombuffer(buf, dtype=self._dtype, count=usable // np.dtype(self._dtype).itemsize)
+        samples = samples.astype(np.float32)
+        if self._scale is not None:
+            samples *= self._scale
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        return samples
+
+    def reset(self):
+        self._pending = b''
+
+
+class WavStreamParser:
+    """
+    Parser RIFF/WAVE incremental.  feed() acepta trozos de cualquier tamaño
+    y devuelve las muestras mono float32 decodificadas del chunk 'data'
+    (mismas conversiones que fingerprintService._parse_wav_bytes).
+    Con decode=False solo valida la cabecera y cuenta bytes (spool).
+    """
+
+    def __init__(self, decode=True):
+        self.decode = decode
+        self._buf = bytearray()
+        self._state = 'riff'       # riff → chunk → fmt/skip/data → done
+        self._need = 0             # bytes del chunk actual (fmt/skip/data)
+        self.audio_format = None
+        self.channels = None
+        self.sample_rate = None
+        self.bits_per_sample = None
+        self.data_bytes = None     # tamaño declarado del chunk data
+        self.data_offset = None    # posición del primer byte de audio
+        self._fed = 0
+
+    @property
+    def frame_bytes(self):
+        return self.channels * self.bits_per_sample // 8
+
+    @property
+    def expected_frames(self):
+        """Frames anunciados por la cabecera (None si aún no se leyó)."""
+        if self.data_bytes is None:
+            return None
+        return self.data_bytes // self.frame_bytes
+
+    def feed(self, data):
+        self._buf += data
+        self._fed += len(data)
+        out = []
+        while True:
+            buf = self._buf
+            if self._state == 'riff':
+                if len(buf) < 12:
+                    break
+                if buf[0:4] != b'RIFF':
+                    raise ValueError("No es un archivo WAV válido (falta RIFF)")
+                if buf[8:12] != b'WAVE':
+                    raise ValueError("No es un archivo WAV válido (falta WAVE)")
+                del buf[:12]
+                self._state = 'chunk'
+
+            elif self._state == 'chunk':
+                if len(buf) < 8:
+                    break
+                chunk_id = bytes(buf[0:4])
+                self._need = struct.unpack('<I', buf[4:8])[0]
+                del buf[:8]
+                if chunk_id == b'fmt ':
+                    self._state = 'fmt'
+                elif chunk_id == b'data':
+                    self._start_data()
+                else:
+                    self._state = 'skip'
+
+            elif self._state == 'fmt':
+                if len(buf) < self._need:
+                    break
+                self.audio_format    = struct.unpack('<H', buf[0:2])[0]
+                self.channels        = struct.unpack('<H', buf[2:4])[0]
+                self.sample_rate     = struct.unpack('<I', buf[4:8])[0]
+                self.bits_per_sample = struct.unpack('<H', buf[14:16])[0]
+                del buf[:self._need]
+                self._state = 'chunk'
+
+            elif self._state == 'skip':
+                n = min(self._need, len(buf))
+                del buf[:n]
+                self._need -= n
+                if self._need:
+                    break
+                self._state = 'chunk'
+
+            elif self._state == 'data':
+                take = min(self._need, len(buf))
+                take -= take % self.frame_bytes
+                if take:
+                    if self.decode:
+                        out.append(self._decode(bytes(buf[:take])))
+                    del buf[:take]
+                    self._need -= take
+                if self._need < self.frame_bytes:
+                    self._state = 'done'
+                    continue
+                break
+
+            else:  # done: lo que venga después de data se ignora
+                buf.clear()
+                break
+
+        if not out:
+            return np.empty(0, dtype=np.float32)
+        return out[0] if len(out) == 1 else np.concatenate(out)
+
+    def finish(self):
+        """Fin del stream: valida que hubo fmt + data."""
+        if self._state not in ('data', 'done'):
+            raise ValueError("WAV incompleto: falta chunk fmt o data")
+
+    def _start_data(self):
+        if self.audio_format is None:
+            raise ValueError("WAV incompleto: falta chunk fmt o data")
+        if self.audio_format == 3:
+            if self.bits_per_sample not in (32, 64):
+                raise ValueError(f"Bits por sample no soportados: {self.bits_per_sample}")
+        elif self.audio_format == 1:
+            if self.bits_per_sample not in (8, 16, 32):
+                raise ValueError(f"Bits por sample no soportados: {self.bits_per_sample}")
+        else:
+            raise ValueError(f"Formato de audio no soportado: {self.audio_format}")
+        if not self.channels:
+            raise ValueError("WAV inválido: 0 canales")
+        self.data_bytes = self._need
+        self.data_offset = self._fed - len(self._buf)
+        self._state = 'data'
+
+    def _decode(self, raw):
+        bits = self.bits_per_sample
+        if self.audio_format == 3:
+            dtype = np.float32 if bits == 32 else np.float64
+            samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+        elif bits == 16:
+            samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+        elif bits == 8:
+            samples = np.frombuffer(raw, dtype=np.uint8).astype(np.float32) / 128.0 - 1.0
+        else:
+            samples = np.frombuffer(raw, dtype=np.int32).astype(np.float32) / 2147483648.0
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return samples
+
+
+def read_wav_stream(chunks):
+    """
+    Decodifica un WAV que llega como iterable de trozos de bytes.
+    Retorna (sample_rate, samples_mono_float32); el único buffer grande es
+    el array de salida, preasignado con el tamaño que anuncia la cabecera.
+    """
+    parser = WavStreamParser()
+    out = np.empty(0, dtype=np.float32)
+    n = 0
+    for chunk in chunks:
+        samples = parser.feed(chunk)
+        if not len(samples):
+            continue
+        if n + len(samples) > len(out):
+            # Preasignar lo anunciado (o crecer si la cabecera mintió)
+            size = max(parser.expected_frames or 0, n + len(samples), 2 * len(out))
+            grown = np.empty(size, dtype=np.float32)
+            grown[:n] = out[:n]
+            out = grown
+        out[n:n + len(samples)] = samples
+        n += len(samples)
+    parser.finish()
+    return parser.sample_rate, out[:n]
+
+
+class AudioRingBuffer:
+    """
+    Buffer circular float32 de capacidad fija (conserva lo más reciente).
+    `evicted` cuenta las muestras sobrescritas por falta de espacio.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._buf = np.zeros(self.capacity, dtype=np.float32)
+        self._start = 0
+        self._len = 0
+        self.total_written = 0
+        self.evicted = 0
+        self.reserved = self.nbytes   # bytes reservados (open_ring: + estado de la sesión)
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def nbytes(self):
+        return self._buf.nbytes
+
+    def append(self, samples):
+        n = len(samples)
+        if not n:
+            return
+        self.total_written += n
+        if n >= self.capacity:
+            self.evicted += self._len + n - self.capacity
+            self._buf[:] = samples[-self.capacity:]
+            self._start, self._len = 0, self.capacity
+            return
+
+        end = (self._start + self._len) % self.capacity
+        first = min(n, self.capacity - end)
+        self._buf[end:end + first] = samples[:first]
+        self._buf[:n - first] = samples[first:]
+
+        overflow = self._len + n - self.capacity
+        if overflow > 0:
+            self.evicted += overflow
+            self._start = (self._start + overflow) % self.capacity
+            self._len = self.capacity
+        else:
+            self._len += n
+
+    def to_array(self):
+        """Copia contigua, de la muestra más antigua a la más reciente."""
+        end = self._start + self._len
+        if end <= self.capacity:
+            return self._buf[self._start:end].copy()
+        return np.concatenate([self._buf[self._start:], self._buf[:end - self.capacity]])
+
+    def latest(self, n):
+        """Copia de las últimas n muestras (n ≤ len)."""
+        n = min(int(n), self._len)
+        if n <= 0:
+            return np.empty(0, dtype=np.float32)
+        first = (self._start + self._len - n) % self.capacity
+        end = first + n
+        if end <= self.capacity:
+            return self._buf[first:end].copy()
+        return np.concatenate([self._buf[first:], self._buf[:end - self.capacity]])
+
+    def clear(self):
+        self._start = 0
+        self._len = 0
+        self.total_written = 0
+
+    def stats(self):
+        return {
+            'capacity_samples': self.capacity,
+            'buffered_samples': self._len,
+            'total_written':    self.total_written,
+            'evicted_samples':  self.evicted,
+            'bytes':            self.nbytes,
+            'reserved_bytes':   self.reserved,
+        }
+
+
+# ── Presupuesto global ─────────────────────────────────────────────────
+class _MemoryBudget:
+    """Contabilidad thread-safe de los bytes reservados por las conexiones."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self.reserved = 0
+        self.sessions = 0
+        self.peak = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def reserve(self, wanted, minimum):
+        """Reserva hasta `wanted` bytes (al menos `minimum`).  0 si no cabe."""
+        with self._lock:
+            granted = min(wanted, self.limit - self.reserved)
+            granted -= granted % SAMPLE_BYTES
+            if granted < minimum:
+                self.rejected += 1
+                return 0
+            self.reserved += granted
+            self.sessions += 1
+            self.peak = max(self.peak, self.reserved)
+            return granted
+
+    def release(self, nbytes, evicted=0):
+        with self._lock:
+            self.reserved -= nbytes
+            self.sessions -= 1
+            self.evicted += evicted
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions':       self.sessions,
+                'reserved_bytes': self.reserved,
+                'limit_bytes':    self.limit,
+                'peak_bytes':     self.peak,
+                'rejected':       self.rejected,
+                'evicted_samples': self.evicted,
+            }
+
+
+_budget = _MemoryBudget(STREAM_MAX_BYTES_TOTAL)
+
+
+class StreamBudgetExceeded(ValueError):
+    """No queda presupuesto de memoria global para otro stream."""
+
+
+def open_ring(sample_rate):
+    """
+    Crea el ring de una conexión: STREAM_BUFFER_SECONDS de audio, limitado
+    por STREAM_MAX_BYTES_PER_CONNECTION (menos STREAM_STATE_BYTES, que se
+    reservan para el estado de la sesión) y por lo que quede del
+    presupuesto global.  Si no caben STREAM_MIN_BUFFER_SECONDS lanza
+    StreamBudgetExceeded.
+    """
+    ring_max = STREAM_MAX_BYTES_PER_CONNECTION - STREAM_STATE_BYTES
+    wanted = min(STREAM_BUFFER_SECONDS * sample_rate * SAMPLE_BYTES, ring_max)
+    minimum = min(STREAM_MIN_BUFFER_SECONDS * sample_rate * SAMPLE_BYTES, wanted)
+    granted = _budget.reserve(wanted + STREAM_STATE_BYTES, minimum + STREAM_STATE_BYTES)
+    if not granted:
+        print(f"[Stream] Conexión rechazada: presupuesto global agotado ({_budget.stats()})")
+        raise StreamBudgetExceeded('Servidor ocupado: no hay memoria para otro stream, inténtalo más tarde.')
+    ring = AudioRingBuffer((granted - STREAM_STATE_BYTES) // SAMPLE_BYTES)
+    ring.reserved = granted
+    return ring
+
+
+def close_ring(ring):
+    """Devuelve al presupuesto global la memoria reservada por open_ring."""
+    if ring is not None:
+        _budget.release(ring.reserved, ring.evicted)
+
+
+def stats():
+    """Estadísticas globales de los streams del proceso."""
+    return _budget.stats()
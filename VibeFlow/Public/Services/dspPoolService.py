@@ -0,0 +1,250 @@
+"""
+dspPoolService.py - Pool de procesos para el DSP de fingerprinting.
+
+La STFT y el hashing son CPU puro: en el hilo de Django (o en el executor
+de database_sync_to_async) compiten por el GIL con el resto de requests
+del proceso.  Este servicio los ejecuta en un ProcessPoolExecutor:
+
+  - El buffer de muestras float32 viaja por memoria compartida
+    (multiprocessing.shared_memory): el padre copia una vez, el worker lo
+    mapea sin copiar ni picklear el audio.
+  - El worker devuelve solo los arrays resultado (hashes/offsets o picos).
+  - Los workers se arrancan con 'spawn' (el servidor ASGI tiene hilos;
+    hacer fork de un proceso con hilos no es seguro).
+
+API:
+  fingerprint_samples / fingerprint_wav  → FingerprintArrays (bloqueante)
+  fingerprint_wav_file                   → ídem desde disco, por bloques
+  submit_samples / submit_wav[_file]     → Future (para solapar trabajo)
+  afingerprint_samples / aband_peaks     → corrutinas (WebSocket)
+
+Todas aceptan params (fingerprintService.AlgoParams): la versión del
+algoritmo a generar, que viaja al worker con la tarea.
+
+Variables de entorno:
+  FINGERPRINT_WORKERS  nº de procesos (por defecto min(4, CPUs));
+                       0 = ejecutar en el propio proceso (sin pool)
+"""
+
+import os
+import asyncio
+import atexit
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+import numpy as np
+
+
+# ── Configuración ──────────────────────────────────────────────────────
+FINGERPRINT_WORKERS = int(os.getenv('FINGERPRINT_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+_executor = None
+_lock = threading.Lock()
+
+
+# ── Worker (se ejecuta en el proceso hijo) ─────────────────────────────
+def _attach(shm_name, n):
+    """Mapea el bloque compartido del padre como array float32 (sin copia)."""
+    # El bloque lo crea y lo libera (unlink) el padre; con 'spawn' el hijo
+    # comparte su resource_tracker, así que no hay que desregistrarlo aquí.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    return shm, np.ndarray((n,), dtype=np.float32, buffer=shm.buf)
+
+
+def _worker_fingerprints(shm_name, n, sample_rate, params):
+    shm, samples = _attach(shm_name, n)
+    try:
+        return _fingerprints_inline(samples, sample_rate, params)
+    finally:
+        del samples
+        shm.close()
+
+
+def _worker_wav_file(path, params, keep_peaks=False):
+    # El worker lee el archivo por bloques: no hay audio en memoria compartida
+    return _wav_file_inline(path, params, keep_peaks)
+
+
+def _worker_band_peaks(shm_name, n, params):
+    shm, samples = _attach(shm_name, n)
+    try:
+        return _band_peaks_inline(samples, params)
+    finally:
+        del samples
+        shm.close()
+
+
+# ── Pool ───────────────────────────────────────────────────────────────
+def is_enabled():
+    return FINGERPRINT_WORKERS > 0
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=FINGERPRINT_WORKERS,
+                mp_context=get_context('spawn'),
+            )
+            print(f"[DSPPool] {FINGERPRINT_WORKERS} workers")
+        return _executor
+
+
+def _discard_executor(broken):
+    """Descarta un pool roto (worker muerto); el siguiente submit crea otro."""
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+atexit.register(shutdown)
+
+
+def _submit(fn, samples, *args):
+    """
+    Copia `samples` a un bloque compartido y encola fn(shm_name, n, *args).
+    El bloque se libera cuando termina el future.
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    shm = shared_memory.SharedMemory(create=True, size=max(samples.nbytes, 1))
+    np.ndarray(samples.shape, dtype=np.float32, buffer=shm.buf)[:] = samples
+
+    executor = _get_executor()
+
+    def _done(future):
+        shm.close()
+        shm.unlink()
+        # Un worker murió (OOM, señal…): el pool queda inutilizable
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            _discard_executor(executor)
+
+    try:
+        future = executor.submit(fn, shm.name, len(samples), *args)
+    except BrokenProcessPool:
+        shm.close()
+        shm.unlink()
+        _discard_executor(executor)
+        raise
+    future.add_done_callback(_done)
+    return future
+
+
+# ── Equivalentes en el propio proceso (FINGERPRINT_WORKERS=0) ──────────
+def _fingerprints_inline(samples, sample_rate, params=None):
+    from VibeFlow.Public.Services import fingerprintService
+    fps = fingerprintService.generate_fingerprints_from_samples(samples, sample_rate, params)
+    return fps.hashes, fps.offsets
+
+
+def _wav_file_inline(path, params=None, keep_peaks=False):
+    from VibeFlow.Public.Services import fingerprintService
+    fps = fingerprintService.generate_fingerprints_file(path, params=params, keep_peaks=keep_peaks)
+    if keep_peaks:
+        # Bins y distancias caben en int16: 4 veces menos bytes de vuelta al padre
+        peaks = tuple(p.astype(np.int16) for p in fps.peaks) if fps.peaks is not None else None
+        return fps.hashes, fps.offsets, peaks
+    return fps.hashes, fps.offsets
+
+
+def _band_peaks_inline(samples, params=None):
+    from VibeFlow.Public.Services import fingerprintService
+    return fingerprintService._segment_peaks(samples, params)
+
+
+# ── API ────────────────────────────────────────────────────────────────
+def _run_inline(fn, *args):
+    """Future ya resuelto con fn(*args) (FINGERPRINT_WORKERS=0)."""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def submit_samples(samples, sample_rate, params=None):
+    """Future → (hashes, offsets) de muestras mono float32."""
+    if not is_enabled():
+        return _run_inline(_fingerprints_inline, samples, sample_rate, params)
+    return _submit(_worker_fingerprints, samples, sample_rate, params)
+
+
+def submit_wav(wav_bytes, params=None):
+    """Future → (hashes, offsets) de un WAV (se parsea en el padre)."""
+    from VibeFlow.Public.Services import fingerprintService
+    sample_rate, samples = fingerprintService._parse_wav_bytes(wav_bytes)
+    return submit_samples(samples, sample_rate, params)
+
+
+def submit_wav_file(path, params=None, keep_peaks=False):
+    """
+    Future → (hashes, offsets) de un WAV en disco, procesado por bloques
+    (memoria acotada sin importar la duración).  keep_peaks añade los
+    picos por frame: (hashes, offsets, peaks).
+    """
+    if not is_enabled():
+        return _run_inline(_wav_file_inline, path, params, keep_peaks)
+    executor = _get_executor()
+
+    def _done(future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            _discard_executor(executor)
+
+    try:
+        future = executor.submit(_worker_wav_file, path, params, keep_peaks)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise
+    future.add_done_callback(_done)
+    return future
+
+
+def result_arrays(future, params=None):
+    """Espera un future de submit_* → FingerprintArrays (de la versión de params)."""
+    from VibeFlow.Public.Services import fingerprintService
+    hashes, offsets, *peaks = future.result()
+    return fingerprintService.FingerprintArrays(
+        hashes, offsets, params.version if params else None, peaks[0] if peaks else None,
+    )
+
+
+def fingerprint_samples(samples, sample_rate, params=None):
+    return result_arrays(submit_samples(samples, sample_rate, params), params)
+
+
+def fingerprint_wav(wav_bytes, params=None):
+    return result_arrays(submit_wav(wav_bytes, params), params)
+
+
+def fingerprint_wav_file(path, params=None, keep_peaks=False):
+    return result_arrays(submit_wav_file(path, params, keep_peaks), params)
+
+
+async def afingerprint_samples(samples, sample_rate, params=None):
+    """Versión asíncrona: no bloquea el event loop ni ocupa un hilo."""
+    if not is_enabled():
+        return await asyncio.to_thread(fingerprint_samples, samples, sample_rate, params)
+    return result_arrays(await asyncio.wrap_future(submit_samples(samples, sample_rate, params)), params)
+
+
+async def aband_peaks(samples, params=None):
+    """
+    Picos por frame de un tramo ya resampleado a SAMPLE_RATE (lo que
+    devuelve StreamingFingerprinter.take_frames), con los parámetros de
+    la versión fijada por la sesión.
+    """
+    if not is_enabled():
+        return await asyncio.to_thread(_band_peaks_inline, samples, params)
+    return await asyncio.wrap_future(_submit(_worker_band_peaks, samples, params))
@@ -0,0 +1,786 @@
+"""
+fingerprintIndexService.py - Índice invertido de fingerprints en memoria.
+
+Carga app.fingerprints en arrays NumPy ordenados por hash:
+
+    hashes   int64[N]   (ordenado)
+    song_ids int64[N]   (posting paralelo)
+    offsets  int32[N]   (posting paralelo)
+
+La búsqueda usa np.searchsorted para localizar los rangos de cada hash del
+query y vota (song_id, offset_diff) de forma vectorizada, sin tocar la BD.
+
+Actualizaciones incrementales:
+  - add_song()    → reemplaza los postings de una canción (store_fingerprints)
+  - remove_song() → elimina los postings de una canción (delete_song)
+Las altas van a un segmento "delta" pequeño que se fusiona con el
+principal cuando crece; así cada alta no reordena todo el índice.
+
+El índice contiene una sola versión del algoritmo (app.fingerprints.
+algo_version): get_index(version) solo lo devuelve si coincide con la
+pedida; si no, el llamador vota en SQL.  set_version() (al cambiar la
+versión activa) lanza la recarga con la versión nueva.
+
+Modos (FINGERPRINT_INDEX):
+  - memory → cada proceso carga su propia copia desde la BD; los cambios
+             hechos por otro worker se ven tras la recarga periódica
+             (FINGERPRINT_INDEX_TTL segundos).
+  - mmap   → todos los workers mapean (np.memmap, solo lectura) el mismo
+             archivo exportado con `manage.py export_fingerprint_index`;
+             comparten el page cache sin copias.  Las altas/bajas locales
+             se superponen en memoria hasta el siguiente export.
+
+Las canciones que guardan otros procesos (el worker de ingesta) se
+aplican en ambos modos sin esperar a la recarga ni al export: cada
+FINGERPRINT_INDEX_CHECK segundos se consultan las canciones con
+app.songs.updated_at reciente (ver _sync_changes).
+
+Archivo mmap (little-endian), ver export_index_file():
+    header  64 bytes  magic, formato, versión del algoritmo, snapshot,
+                      started_at, n_keys, n_postings
+    keys    int64[n_keys]        hashes únicos ordenados
+    starts  int64[n_keys + 1]    offsets CSR hacia los postings
+    songs   int32[n_postings]    song_id de cada posting
+    times   int32[n_postings]    time_offset de cada posting
+El archivo activo se publica reemplazando atómicamente un pequeño archivo
+puntero (FINGERPRINT_INDEX_PATH) que nombra el binario versionado; los
+binarios nunca se sobrescriben mientras un worker los tiene mapeados.
+
+Configuración (.env):
+    FINGERPRINT_INDEX=memory|mmap    (vacío = desactivado, se usa SQL)
+    FINGERPRINT_INDEX_TTL=300        (memory: segundos entre recargas)
+    FINGERPRINT_INDEX_PATH=var/fingerprints.idx   (mmap: archivo puntero)
+    FINGERPRINT_INDEX_CHECK=5        (segundos entre chequeos del puntero (mmap)
+                                      y de canciones nuevas en la BD)
+"""
+
+import os
+import json
+import time
+import struct
+import threading
+from pathlib import Path
+import numpy as np
+from django.db import connection, transaction
+
+
+# ── Configuración ──────────────────────────────────────────────────────
+FINGERPRINT_INDEX     = os.getenv('FINGERPRINT_INDEX', '').lower()
+FINGERPRINT_INDEX_TTL = int(os.getenv('FINGERPRINT_INDEX_TTL', '300'))
+FINGERPRINT_INDEX_PATH = os.getenv(
+    'FINGERPRINT_INDEX_PATH',
+    str(Path(__file__).resolve().parents[3] / 'var' / 'fingerprints.idx'),
+)
+FINGERPRINT_INDEX_CHECK = float(os.getenv('FINGERPRINT_INDEX_CHECK', '5'))
+
+# Filas por fetchmany al cargar (acota la memoria de tuplas Python)
+_LOAD_BATCH = 100_000
+
+# El delta se fusiona con el principal al superar esta fracción
+_DELTA_MERGE_RATIO = 0.125
+
+# Formato del archivo mmap
+_MAGIC       = b'VFFPIDX1'
+_FILE_FORMAT = 1
+_HEADER      = struct.Struct('<8sIIqdqq')   # magic, formato, algo_version,
+_HEADER_SIZE = 64                           # snapshot, started_at, n_keys, n_postings
+
+# Binarios antiguos que se conservan (un worker puede tenerlos mapeados)
+_KEEP_FILES = 2
+
+
+def _expand_postings(lo, counts, q_times, song_ids, offsets):
+    """
+    Expande los rangos de postings [lo, lo+count) de cada hash encontrado
+    a arrays planos (song_ids, offset_diffs), sin bucle Python.
+    """
+    hit = counts > 0
+    if not hit.any():
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+
+    lo, counts, qt = lo[hit], counts[hit], q_times[hit]
+    ends = np.cumsum(counts)
+    idx = np.repeat(lo - (ends - counts), counts) + np.arange(ends[-1])
+
+    sids = song_ids[idx].astype(np.int64)
+    diffs = offsets[idx].astype(np.int64) - np.repeat(qt, counts)
+    return sids, diffs
+
+
+# ── Segmento ordenado ──────────────────────────────────────────────────
+class _Segment:
+    """Arrays paralelos ordenados por hash."""
+
+    __slots__ = ('hashes', 'song_ids', 'offsets')
+
+    def __init__(self, hashes, song_ids, offsets, presorted=False):
+        hashes   = np.asarray(hashes, dtype=np.int64)
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        offsets  = np.asarray(offsets, dtype=np.int32)
+        if not presorted:
+            order = np.argsort(hashes, kind='stable')
+            hashes, song_ids, offsets = hashes[order], song_ids[order], offsets[order]
+        self.hashes   = hashes
+        self.song_ids = song_ids
+        self.offsets  = offsets
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], presorted=True)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def without_songs(self, song_ids):
+        """Copia del segmento sin los postings de las canciones dadas."""
+        keep = ~np.isin(self.song_ids, np.fromiter(song_ids, dtype=np.int64))
+        if keep.all():
+            return self
+        return _Segment(self.hashes[keep], self.song_ids[keep], self.offsets[keep], presorted=True)
+
+    def merged(self, other):
+        """Fusiona dos segmentos manteniendo el orden por hash."""
+        if not len(other):
+            return self
+        if not len(self):
+            return other
+        return _Segment(
+            np.concatenate([self.hashes, other.hashes]),
+            np.concatenate([self.song_ids, other.song_ids]),
+            np.concatenate([self.offsets, other.offsets]),
+        )
+
+    def lookup(self, q_hashes, q_times):
+        """
+        Postings que coinciden con cada (hash, query_time) del query.
+        Retorna (song_ids, offset_diffs) — un elemento por coincidencia.
+        """
+        lo = np.searchsorted(self.hashes, q_hashes, side='left')
+        hi = np.searchsorted(self.hashes, q_hashes, side='right')
+        return _expand_postings(lo, hi - lo, q_times, self.song_ids, self.offsets)
+
+
+def _best_per_song(song_ids, diffs):
+    """
+    Votación vectorizada: cuenta (song_id, offset_diff) y devuelve el
+    mayor grupo coherente por canción → {song_id: count}.
+    """
+    if not len(song_ids):
+        return {}
+    # Clave única por (song_id, offset_diff): song_id en los 32 bits altos
+    keys = (song_ids << 32) | (diffs & 0xFFFFFFFF)
+    uniq, counts = np.unique(keys, return_counts=True)
+    songs = uniq >> 32
+
+    # uniq está ordenado → los grupos de cada canción son contiguos
+    starts = np.flatnonzero(np.r_[True, songs[1:] != songs[:-1]])
+    best = np.maximum.reduceat(counts, starts)
+    return dict(zip(songs[starts].tolist(), best.tolist()))
+
+
+def _coherent_votes(song_ids, diffs):
+    """Votos crudos → {(song_id, offset_diff): count}."""
+    if not len(song_ids):
+        return {}
+    keys = (song_ids << 32) | (diffs & 0xFFFFFFFF)
+    uniq, counts = np.unique(keys, return_counts=True)
+    # offset_diff con signo a partir de los 32 bits bajos
+    od = ((uniq & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+    return dict(zip(zip((uniq >> 32).tolist(), od.tolist()), counts.tolist()))
+
+
+def _fetch_postings(version):
+    """
+    Lee (hash, song_id, time_offset) de una versión del algoritmo en
+    app.fingerprints, en bloques con un cursor del lado del servidor.
+    Genera arrays int64 (n, 3).
+    """
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute("""
+            SELECT hash, song_id, time_offset
+            FROM app.fingerprints
+            WHERE hash IS NOT NULL AND algo_version = %s
+        """, [version])
+        while True:
+            rows = cursor.fetchmany(_LOAD_BATCH)
+            if not rows:
+                break
+            yield np.array(rows, dtype=np.int64)
+
+
+def _fetch_all_song_info():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, title, artist FROM app.songs")
+        return {
+            sid: {'title': title, 'artist': artist}
+            for sid, title, artist in cursor.fetchall()
+        }
+
+
+# ── Índice ─────────────────────────────────────────────────────────────
+class _BaseIndex:
+    """Votación y metadatos de canciones comunes a los índices."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._song_info = {}
+
+    def _matches(self, q_hashes, q_times):
+        """(song_ids, offset_diffs) de todas las coincidencias del query."""
+        raise NotImplementedError
+
+    def set_song_info(self, song_id, title, artist):
+        with self._lock:
+            self._song_info[song_id] = {'title': title, 'artist': artist}
+
+    # ── Búsqueda ───────────────────────────────────────────────────────
+    def vote(self, fingerprints):
+        """
+        Votación de coherencia temporal sobre el índice.
+        Retorna (song_best {song_id: count}, song_info {song_id: {title, artist}}),
+        el mismo contrato que fingerprintService._vote_sql/_vote_python.
+        """
+        sids, diffs = self._matches(fingerprints.hashes, fingerprints.offsets)
+        song_best = _best_per_song(sids, diffs)
+
+        info = self._song_info
+        missing = [sid for sid in song_best if sid not in info]
+        if missing:
+            self._fetch_song_info(missing)
+            info = self._song_info
+
+        song_info = {sid: info.get(sid, {'title': None, 'artist': None}) for sid in song_best}
+        return song_best, song_info
+
+    def coherent_votes(self, fingerprints):
+        """Votos sin reducir {(song_id, offset_diff): count} (streaming)."""
+        sids, diffs = self._matches(fingerprints.hashes, fingerprints.offsets)
+        return _coherent_votes(sids, diffs)
+
+    def _fetch_song_info(self, song_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, title, artist FROM app.songs WHERE id = ANY(%s)",
+                [list(song_ids)],
+            )
+            rows = cursor.fetchall()
+        with self._lock:
+            for sid, title, artist in rows:
+                self._song_info[sid] = {'title': title, 'artist': artist}
+
+
+class FingerprintIndex(_BaseIndex):
+    """Índice invertido en memoria (thread-safe) de una versión del algoritmo."""
+
+    def __init__(self, version):
+        super().__init__()
+        self.version = version
+        self._main = _Segment.empty()
+        self._delta = _Segment.empty()
+        self.loaded_at = None
+        self.started_at = None       # time.time() al empezar la carga
+
+    def __len__(self):
+        return len(self._main) + len(self._delta)
+
+    # ── Carga completa ─────────────────────────────────────────────────
+    def load(self):
+        """Carga todos los fingerprints y metadatos de canciones desde BD."""
+        started_at = time.time()
+        blocks = list(_fetch_postings(self.version))
+        song_info = _fetch_all_song_info()
+
+        if blocks:
+            data = np.concatenate(blocks)
+            main = _Segment(data[:, 0], data[:, 1], data[:, 2])
+        else:
+            main = _Segment.empty()
+
+        with self._lock:
+            self._main = main
+            self._delta = _Segment.empty()
+            self._song_info = song_info
+            self.loaded_at = time.monotonic()
+            self.started_at = started_at
+
+        print(f"[FingerprintIndex] Cargado (versión {self.version}): "
+              f"{len(main)} fingerprints, {len(song_info)} canciones")
+
+    # ── Actualizaciones incrementales ──────────────────────────────────
+    def add_song(self, song_id, fingerprints):
+        """Reemplaza los postings de una canción por los nuevos fingerprints."""
+        if not _same_version(fingerprints, self.version):
+            return
+        segment = _Segment(
+            fingerprints.hashes,
+            np.full(len(fingerprints), song_id, dtype=np.int64),
+            fingerprints.offsets,
+        )
+        with self._lock:
+            self._main = self._main.without_songs([song_id])
+            self._delta = self._delta.without_songs([song_id]).merged(segment)
+            if len(self._delta) > len(self._main) * _DELTA_MERGE_RATIO:
+                self._main = self._main.merged(self._delta)
+                self._delta = _Segment.empty()
+
+    def remove_song(self, song_id):
+        """Elimina todos los postings de una canción."""
+        with self._lock:
+            self._main = self._main.without_songs([song_id])
+            self._delta = self._delta.without_songs([song_id])
+            self._song_info.pop(song_id, None)
+
+    def _matches(self, q_hashes, q_times):
+        with self._lock:
+            main, delta = self._main, self._delta
+        sids_m, diffs_m = main.lookup(q_hashes, q_times)
+        sids_d, diffs_d = delta.lookup(q_hashes, q_times)
+        return np.concatenate([sids_m, sids_d]), np.concatenate([diffs_m, diffs_d])
+
+
+# ── Archivo mmap ───────────────────────────────────────────────────────
+class _MappedSnapshot:
+    """Vista de solo lectura (np.memmap) de un archivo de índice exportado."""
+
+    def __init__(self, path):
+        self.path = path
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, fmt, version, snapshot, started_at, n_keys, n_postings = \
+            _HEADER.unpack(bytes(self._mm[:_HEADER.size]))
+        if magic != _MAGIC or fmt != _FILE_FORMAT:
+            raise ValueError(f"Archivo de índice inválido: {path}")
+
+        self.version = version
+        self.snapshot = snapshot
+        self.started_at = started_at
+
+        pos = _HEADER_SIZE
+        def take(dtype, n):
+            nonlocal pos
+            size = np.dtype(dtype).itemsize * n
+            arr = self._mm[pos:pos + size].view(dtype)
+            pos += size
+            return arr
+
+        self.keys     = take('<i8', n_keys)
+        self.starts   = take('<i8', n_keys + 1)
+        self.song_ids = take('<i4', n_postings)
+        self.offsets  = take('<i4', n_postings)
+
+    def __len__(self):
+        return len(self.song_ids)
+
+    def lookup(self, q_hashes, q_times):
+        if not len(self.keys):
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        pos = np.minimum(np.searchsorted(self.keys, q_hashes), len(self.keys) - 1)
+        found = self.keys[pos] == q_hashes
+        lo = np.where(found, self.starts[pos], 0)
+        counts = np.where(found, self.starts[pos + 1] - lo, 0)
+        return _expand_postings(lo, counts, q_times, self.song_ids, self.offsets)
+
+
+def _read_pointer(pointer_path):
+    with open(pointer_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class MmapFingerprintIndex(_BaseIndex):
+    """
+    Índice sobre el archivo exportado (compartido entre procesos) más una
+    capa en memoria con los cambios locales posteriores al snapshot:
+    canciones dadas de alta/regeneradas (delta) y canciones ocultas
+    (tombstones).  Al publicarse un archivo nuevo se remapea y se
+    reaplican solo los cambios posteriores a su snapshot.
+    """
+
+    def __init__(self, pointer_path):
+        super().__init__()
+        self.pointer_path = pointer_path
+        self._snapshot = None
+        self._pointer_mtime = None
+        self._checked_at = 0.0
+        self._ops = []                  # [(time, op, args)] cambios locales
+        self._delta = _Segment.empty()
+        self._tombstones = set()
+
+    def __len__(self):
+        return (len(self._snapshot) if self._snapshot else 0) + len(self._delta)
+
+    @property
+    def snapshot(self):
+        return self._snapshot.snapshot if self._snapshot else None
+
+    @property
+    def version(self):
+        return self._snapshot.version if self._snapshot else None
+
+    @property
+    def started_at(self):
+        return self._snapshot.started_at if self._snapshot else None
+
+    # ── (Re)mapeo ──────────────────────────────────────────────────────
+    def refresh(self, force=False):
+        """
+        Remapea si el puntero cambió.  Retorna True si hay snapshot usable.
+        El stat del puntero se hace como mucho cada FINGERPRINT_INDEX_CHECK s.
+        """
+        now = time.monotonic()
+        if not force and self._snapshot is not None and now - self._checked_at < FINGERPRINT_INDEX_CHECK:
+            return True
+        self._checked_at = now
+
+        try:
+            mtime = os.stat(self.pointer_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._snapshot is not None
+        if mtime == self._pointer_mtime and self._snapshot is not None:
+            return True
+
+        pointer = _read_pointer(self.pointer_path)
+        data_path = os.path.join(os.path.dirname(self.pointer_path), pointer['file'])
+        snapshot = _MappedSnapshot(data_path)
+        song_info = _fetch_all_song_info()
+
+        with self._lock:
+            self._snapshot = snapshot
+            self._pointer_mtime = mtime
+            self._song_info = song_info
+            # Solo sobreviven los cambios posteriores al inicio del export
+            self._ops = [op for op in self._ops if op[0] >= snapshot.started_at]
+            self._delta = _Segment.empty()
+            self._tombstones = set()
+            for _ts, op, args in self._ops:
+                getattr(self, '_' + op)(*args)
+
+        print(f"[FingerprintIndex] Mapeado {data_path}: {len(snapshot)} fingerprints "
+              f"(versión {snapshot.version}, snapshot {snapshot.snapshot})")
+        return True
+
+    # ── Cambios locales ────────────────────────────────────────────────
+    def add_song(self, song_id, fingerprints):
+        if not _same_version(fingerprints, self.version):
+            return
+        with self._lock:
+            self._ops.append((time.time(), 'add_song', (song_id, fingerprints)))
+            self._add_song(song_id, fingerprints)
+
+    def remove_song(self, song_id):
+        with self._lock:
+            self._ops.append((time.time(), 'remove_song', (song_id,)))
+            self._remove_song(song_id)
+
+    def _add_song(self, song_id, fingerprints):
+        segment = _Segment(
+            fingerprints.hashes,
+            np.full(len(fingerprints), song_id, dtype=np.int64),
+            fingerprints.offsets,
+        )
+        self._tombstones.add(song_id)
+        self._delta = self._delta.without_songs([song_id]).merged(segment)
+
+    def _remove_song(self, song_id):
+        self._tombstones.add(song_id)
+        self._delta = self._delta.without_songs([song_id])
+        self._song_info.pop(song_id, None)
+
+    def _matches(self, q_hashes, q_times):
+        with self._lock:
+            snapshot, delta, tombstones = self._snapshot, self._delta, self._tombstones
+
+        sids_s, diffs_s = snapshot.lookup(q_hashes, q_times)
+        if tombstones and len(sids_s):
+            keep = ~np.isin(sids_s, np.fromiter(tombstones, dtype=np.int64))
+            sids_s, diffs_s = sids_s[keep], diffs_s[keep]
+        sids_d, diffs_d = delta.lookup(q_hashes, q_times)
+        return np.concatenate([sids_s, sids_d]), np.concatenate([diffs_s, diffs_d])
+
+
+def export_index_file(version, pointer_path=None):
+    """
+    Exporta una versión del algoritmo de app.fingerprints a un binario
+    ordenado (formato mmap) y lo publica de forma atómica:
+      1. Escribe <stem>-<snapshot>.bin en el mismo directorio (fsync).
+      2. Reemplaza el puntero con os.replace (atómico).
+      3. Borra binarios antiguos (conserva los últimos _KEEP_FILES).
+
+    Retorna dict con resumen {path, file, snapshot, keys, postings}.
+    """
+    pointer_path = Path(pointer_path or FINGERPRINT_INDEX_PATH)
+    pointer_path.parent.mkdir(parents=True, exist_ok=True)
+
+    started_at = time.time()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM app.fingerprints")
+        snapshot = cursor.fetchone()[0]
+
+    blocks = list(_fetch_postings(version))
+    data = np.concatenate(blocks) if blocks else np.empty((0, 3), dtype=np.int64)
+    if len(data) and data[:, 1:].max() > np.iinfo(np.int32).max:
+        raise ValueError("song_id/time_offset excede int32; no cabe en el formato de índice")
+
+    order = np.argsort(data[:, 0], kind='stable')
+    hashes = data[order, 0]
+    song_ids = data[order, 1].astype('<i4')
+    offsets = data[order, 2].astype('<i4')
+    del data, order
+
+    # CSR: hashes únicos + offset de inicio de sus postings
+    if len(hashes):
+        first = np.flatnonzero(np.r_[True, hashes[1:] != hashes[:-1]])
+    else:
+        first = np.empty(0, dtype=np.int64)
+    keys = hashes[first].astype('<i8')
+    starts = np.r_[first, len(hashes)].astype('<i8')
+
+    header = _HEADER.pack(_MAGIC, _FILE_FORMAT, version, snapshot, started_at, len(keys), len(hashes))
+    file_name = f"{pointer_path.stem}-{snapshot}-{int(started_at)}.bin"
+    data_path = pointer_path.parent / file_name
+    tmp_path = data_path.with_suffix('.tmp')
+
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(_HEADER_SIZE, b'\0'))
+        for arr in (keys, starts, song_ids, offsets):
+            f.write(arr.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, data_path)
+
+    # Publicar: reemplazo atómico del puntero
+    pointer_tmp = pointer_path.with_suffix(pointer_path.suffix + '.tmp')
+    with open(pointer_tmp, 'w', encoding='utf-8') as f:
+        json.dump({'file': file_name, 'algo_version': version, 'snapshot': snapshot,
+                   'started_at': started_at, 'keys': int(len(keys)), 'postings': int(len(hashes))}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, pointer_path)
+
+    # Limpieza: binarios antiguos (si un worker aún lo mapea, se reintenta luego)
+    old = sorted(pointer_path.parent.glob(f"{pointer_path.stem}-*.bin"),
+                 key=lambda p: p.stat().st_mtime, reverse=True)
+    for stale in old[_KEEP_FILES:]:
+        try:
+            stale.unlink()
+        except OSError:
+            pass
+
+    print(f"[FingerprintIndex] Exportado {data_path} (versión {version}): "
+          f"{len(keys)} hashes, {len(hashes)} postings")
+    return {
+        'path': str(pointer_path),
+        'file': file_name,
+        'algo_version': version,
+        'snapshot': snapshot,
+        'keys': int(len(keys)),
+        'postings': int(len(hashes)),
+    }
+
+
+# ── Singleton por proceso ──────────────────────────────────────────────
+_index = None
+_version = None        # versión que debe cargar el índice (la activa)
+_loading = False
+_pending = []          # cambios ocurridos mientras se carga un índice nuevo
+_state_lock = threading.Lock()
+
+
+def is_enabled():
+    return FINGERPRINT_INDEX in ('memory', 'mmap')
+
+
+def _same_version(fingerprints, version):
+    """Los fingerprints sin versión se asumen de la del índice."""
+    fp_version = getattr(fingerprints, 'version', None)
+    return fp_version is None or fp_version == version
+
+
+def _load_in_background(index):
+    global _index, _loading
+    try:
+        index.load()
+        with _state_lock:
+            # Reaplicar altas/bajas que llegaron durante la carga
+            for op, args in _pending:
+                getattr(index, op)(*args)
+            _index = index
+    except Exception as e:
+        print(f"[FingerprintIndex] Error cargando índice: {e}")
+    finally:
+        connection.close()
+        with _state_lock:
+            _loading = False
+            _pending.clear()
+
+
+def _schedule_load():
+    """Lanza una carga completa en un hilo (si no hay una en curso)."""
+    global _loading
+    with _state_lock:
+        if _loading:
+            return
+        _loading = True
+        version = _version
+    threading.Thread(
+        target=_load_in_background, args=(FingerprintIndex(version),),
+        name='fingerprint-index-load', daemon=True,
+    ).start()
+
+
+def set_version(version):
+    """
+    Fija la versión del algoritmo que sirve el índice (la activa).  En
+    modo memory un cambio lanza la recarga; hasta que termina, las
+    búsquedas de la versión nueva van por SQL.  En modo mmap el índice
+    cambia cuando se publica el archivo exportado de esa versión.
+    """
+    global _version
+    with _state_lock:
+        changed = version != _version
+        _version = version
+    if changed and FINGERPRINT_INDEX == 'memory' and _index is not None:
+        _schedule_load()
+
+
+# Sincronización con los cambios de otros procesos
+_synced_from = None    # updated_at desde el que se consulta (hora de la BD)
+_synced = {}           # song_id → updated_at ya aplicado
+_synced_checked = 0.0
+_sync_lock = threading.Lock()
+
+
+def _sync_changes(index):
+    """
+    Aplica al índice de este proceso las canciones guardadas por otros
+    procesos: el worker de ingesta escribe los fingerprints en la BD pero
+    su índice no es el de los servidores que buscan.
+
+    store_fingerprints marca app.songs.updated_at = NOW() (inicio de su
+    transacción).  Cada consulta arranca en la transacción abierta más
+    antigua de la consulta anterior: una canción que aún no había hecho
+    commit no se pierde.  Las ya aplicadas (mismo updated_at) se saltan.
+    La primera consulta arranca en el inicio de la carga o del export del
+    índice (con un minuto de margen por desfase de relojes).
+    """
+    global _synced_from, _synced_checked
+    now = time.monotonic()
+    if now - _synced_checked < FINGERPRINT_INDEX_CHECK or not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        _synced_checked = now
+        from VibeFlow.Public.Services.fingerprintService import FingerprintArrays
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT NOW(), LEAST(NOW(), MIN(xact_start))
+                FROM pg_stat_activity
+                WHERE xact_start IS NOT NULL AND pid <> pg_backend_pid()
+            """)
+            db_now, oldest = cursor.fetchone()
+            cursor.execute("""
+                SELECT id, title, artist, updated_at FROM app.songs
+                WHERE updated_at >= COALESCE(%s, to_timestamp(%s) - interval '1 minute')
+            """, [_synced_from, index.started_at])
+            changed = [row for row in cursor.fetchall() if _synced.get(row[0]) != row[3]]
+
+            for song_id, title, artist, updated_at in changed:
+                cursor.execute("""
+                    SELECT hash, time_offset FROM app.fingerprints
+                    WHERE song_id = %s AND algo_version = %s AND hash IS NOT NULL
+                """, [song_id, index.version])
+                rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+                update_song_info(song_id, title, artist)
+                add_song(song_id, FingerprintArrays(rows[:, 0], rows[:, 1], index.version))
+                _synced[song_id] = updated_at
+
+        _synced_from = oldest or db_now
+        for song_id in [sid for sid, ts in _synced.items() if ts < _synced_from]:
+            del _synced[song_id]
+        if changed:
+            print(f"[FingerprintIndex] {len(changed)} canciones actualizadas desde la BD")
+    except Exception as e:
+        print(f"[FingerprintIndex] Error sincronizando cambios: {e}")
+    finally:
+        _sync_lock.release()
+
+
+def get_index(version):
+    """
+    Retorna el índice listo para buscar la versión dada, o None si está
+    desactivado, todavía cargando o contiene otra versión (el llamador
+    debe usar la búsqueda SQL).
+    La primera llamada y cada FINGERPRINT_INDEX_TTL lanzan una recarga
+    en segundo plano; mientras tanto se sigue sirviendo el índice actual.
+    """
+    global _version
+    if not is_enabled():
+        return None
+    if FINGERPRINT_INDEX == 'mmap':
+        index = _get_mmap_index()
+        if index is None or index.version != version:
+            return None
+        _sync_changes(index)
+        return index
+
+    if _version is None:
+        _version = version
+    index = _index
+    if index is None:
+        _schedule_load()
+        return None
+
+    if time.monotonic() - index.loaded_at > FINGERPRINT_INDEX_TTL:
+        _schedule_load()
+    if index.version != version:
+        return None
+    _sync_changes(index)
+    return index
+
+
+def _get_mmap_index():
+    """Índice mmap del proceso; None si aún no se exportó ningún archivo."""
+    global _index
+    with _state_lock:
+        if _index is None:
+            _index = MmapFingerprintIndex(FINGERPRINT_INDEX_PATH)
+        index = _index
+    try:
+        return index if index.refresh() else None
+    except Exception as e:
+        print(f"[FingerprintIndex] Error mapeando índice: {e}")
+        return None
+
+
+def export_if_mmap(version):
+    """Tras regenerate_all: reconstruye y publica el archivo mmap si aplica."""
+    if FINGERPRINT_INDEX != 'mmap':
+        return None
+    summary = export_index_file(version)
+    index = _get_mmap_index()
+    if index is not None:
+        index.refresh(force=True)
+    return summary
+
+
+def _apply(op, *args):
+    """Aplica un cambio al índice actual y lo encola si hay una carga en curso."""
+    with _state_lock:
+        index = _index
+        if _loading:
+            _pending.append((op, args))
+    if index is not None:
+        getattr(index, op)(*args)
+
+
+def add_song(song_id, fingerprints):
+    """Hook de store_fingerprints: actualiza el índice si está cargado."""
+    _apply('add_song', song_id, fingerprints)
+
+
+def remove_song(song_id):
+    """Hook de delete_song: quita la canción del índice si está cargado."""
+    _apply('remove_song', song_id)
+
+
+def update_song_info(song_id, title, artist):
+    """Hook de update_song: refresca título/artista en el índice."""
+    _apply('set_song_info', song_id, title, artist)
@@ -9,8 +9,10 @@ Algoritmo:
    c) distance — distancia entre f_peak y f_midlow (relación espectral)
 3. Genera pares constelación: compara el trío (f_peak, f_midlow, dist)
    del frame en segundo t con el del frame en segundo t+0.5 s.
-4. Hash = SHA-1(f_peak_t1 | f_midlow_t1 | dist_t1 | f_peak_t2 | f_midlow_t2 | dist_t2)
-5. Almacena (hash, anchor_time) en BD.
+4. Hash = entero de 64 bits con los 6 componentes empaquetados
+   (f_peak_t1, f_midlow_t1, dist_t1, f_peak_t2, f_midlow_t2, dist_t2),
+   10 bits por componente.  Se calcula para todos los pares a la vez.
+5. Almacena (hash, anchor_time) en BD (columna BIGINT).
 
 Búsqueda:
 - Genera fingerprints del audio capturado.
@@ -19,15 +21,24 @@ Búsqueda:
 - Agrupa matches por (canción, offset_diff).  Si un grupo tiene
   ≥ MIN_MATCHES (25) coincidencias temporalmente coherentes,
   la canción está CONFIRMADA.
+- En Postgres la votación se hace en el propio servidor (un solo
+  statement); solo vuelven los mejores grupos por canción.
 """
 
 import io
-import hashlib
+import os
+import json
+import math
 import struct
+import hashlib
+import tempfile
 from collections import defaultdict
+from functools import lru_cache
 import numpy as np
-from scipy.signal import spectrogram as scipy_spectrogram
-from django.db import connection
+from scipy.ndimage import maximum_filter, maximum_filter1d
+from scipy.signal import firwin, upfirdn, spectrogram as scipy_spectrogram
+from django.db import connection, transaction
+from VibeFlow.Public.Services import audioCodecService, audioStreamService, dspPoolService, fingerprintIndexService, peakCacheService
 
 
 # ── Configuración ──────────────────────────────────────────────────────
@@ -38,6 +49,13 @@ HOP         = NPERSEG - NOVERLAP             # = 512 samples
 FPS         = SAMPLE_RATE / HOP              # ≈ 21.5 frames/s
 FREQ_QUANT  = 4                # Cuantización de bins (tolerancia ≈43 Hz)
 
+# Remuestreo a SAMPLE_RATE:
+#   'linear'    → interpolación lineal (histórico); el contenido por encima
+#                 de 5.5 kHz se pliega sobre la banda que leen los picos
+#   'polyphase' → FIR racional polifásico (anti-aliasing, filtros cacheados)
+# Cambiarlo altera los hashes: las canciones se deben regenerar.
+RESAMPLER = os.getenv('FINGERPRINT_RESAMPLER', 'linear')
+
 # Deltas temporales para pares constelación (en frames).
 # 0.5 s ≈ 11 frames.  Usamos 9, 11, 13 para mayor robustez.
 TARGET_DELTAS = [9, 11, 13]
@@ -45,13 +63,172 @@ TARGET_DELTAS = [9, 11, 13]
 # Mínimo de matches temporalmente coherentes para confirmar
 MIN_MATCHES = 25
 
+# Modo de constellation:
+#   'bands' → pico global + pico de la mitad inferior por frame, pares a
+#             TARGET_DELTAS: siempre 3 hashes por frame (histórico)
+#   'topn'  → hasta TOPN_PEAKS_PER_BAND máximos locales (filtro de máximo
+#             2-D) por frame y banda; cada pico ancla se empareja con los
+#             TOPN_FAN_OUT primeros picos de su zona objetivo
+# TOPN_PEAKS_PER_BAND es la perilla de densidad: más picos → más hashes
+# por segundo (índice más grande), más recall con audio corto o ruidoso y
+# también más votos casuales de canciones ajenas frente a MIN_MATCHES
+# (medir con Scripts/bench_constellation.py antes de subirla).
+# El hash 'topn' (f1, f2, Δt) tiene menos campos que el de 'bands': con
+# FREQ_QUANT las coincidencias casuales de canciones ajenas llegan a
+# MIN_MATCHES, por eso sus frecuencias van a resolución de bin.
+FINGERPRINT_MODE    = os.getenv('FINGERPRINT_MODE', 'bands')
+TOPN_PEAKS_PER_BAND = int(os.getenv('FINGERPRINT_TOPN_PEAKS', '1'))
+TOPN_FAN_OUT        = int(os.getenv('FINGERPRINT_TOPN_FAN_OUT', '4'))
+TOPN_BAND_EDGES     = (1, 32, 96, 192, 513)  # bins: ≈0.34 / 1 / 2 / 5.5 kHz
+TOPN_NEIGHBORHOOD   = (9, 3)                 # (bins, frames) del filtro de máximo
+TOPN_TOLERANCE_DB   = 3.0                    # margen frente al máximo 2-D
+TOPN_ZONE           = (2, 33)                # frames [inicio, fin) tras el ancla
+TOPN_MIN_DB         = -80.0                  # descarta máximos en silencio
+TOPN_FREQ_QUANT     = 1                      # bins sin cuantizar (ver abajo)
+
+# Empaquetado del hash: 6 componentes × 10 bits = 60 bits (cabe en BIGINT
+# con signo).  f_peak/f_midlow cuantizados ≤ 128; la distancia puede ser
+# negativa y se desplaza con HASH_DIST_BIAS.
+HASH_FIELD_BITS = 10
+HASH_FIELD_MASK = (1 << HASH_FIELD_BITS) - 1
+HASH_DIST_BIAS  = 1 << (HASH_FIELD_BITS - 1)
+
+# Los bits 60-62 llevan la versión del formato del hash, así los hashes
+# de ambos modos pueden convivir en la tabla sin colisionar.  'bands'
+# es la versión 0 (los hashes históricos no cambian).
+HASH_VERSION_SHIFT = 6 * HASH_FIELD_BITS
+HASH_VERSIONS = {'bands': 0, 'topn': 1}
+
+# Modo de búsqueda:
+#   'index'  → índice invertido en memoria (fingerprintIndexService);
+#              mientras no esté cargado se usa 'sql'
+#   'sql'    → votación (song_id, offset_diff) en Postgres, 1 round trip
+#   'python' → trae todas las filas coincidentes y vota en Python
+SEARCH_MODE = os.getenv(
+    'FINGERPRINT_SEARCH_MODE',
+    'index' if fingerprintIndexService.is_enabled() else 'sql',
+)
+
+# Candidatos devueltos en el resultado
+TOP_CANDIDATES = 5
+
+# Histograma (song_id, offset_diff) de una sesión de streaming: cada
+# grupo ocupa VOTE_KEY_BYTES (clave int64 + votos int32).  Su tope sale
+# del estado de sesión que reserva audioStreamService.open_ring, menos
+# STREAM_FINGERPRINTER_BYTES para el StreamingFingerprinter (cola STFT y
+# picos pendientes: unos 10 KB), y deja la mitad libre para los
+# temporales al sumar votos.  Al superarlo se podan los grupos con menos
+# votos.
+VOTE_KEY_BYTES = 12
+STREAM_FINGERPRINTER_BYTES = 64 * 1024
+STREAM_MAX_VOTE_KEYS = max(
+    1024, (audioStreamService.STREAM_STATE_BYTES - STREAM_FINGERPRINTER_BYTES) // (2 * VOTE_KEY_BYTES),
+)
+
+# Bytes de WAV por bloque en el modo por ventanas (archivos largos)
+CHUNK_BYTES = int(os.getenv('FINGERPRINT_CHUNK_BYTES', str(4 << 20)))
+
+# Formato de los picos de la caché (peakCacheService): subirlo si cambia
+# el cálculo de _segment_peaks sin que cambie ningún parámetro
+PEAKS_FORMAT = 1
+
+
+# ── Parámetros del algoritmo (versiones) ──────────────────────────────
+class AlgoParams:
+    """
+    Juego de parámetros que determina los hashes: cada versión de
+    app.fingerprint_versions guarda uno (fingerprintVersionService).
+    Sin argumentos toma la configuración de este módulo (.env); los
+    valores dados la sobrescriben.  SAMPLE_RATE/NPERSEG/HOP son fijos
+    (los offsets de todas las versiones se miden en los mismos frames).
+
+    `version` es el número registrado (None si no viene de la tabla) y no
+    participa en la igualdad: dos versiones con los mismos parámetros
+    generan los mismos hashes.
+    """
+
+    FIELDS = (
+        'mode', 'resampler', 'freq_quant', 'target_deltas',
+        'topn_peaks', 'topn_fan_out', 'topn_band_edges', 'topn_neighborhood',
+        'topn_tolerance_db', 'topn_zone', 'topn_min_db', 'topn_freq_quant',
+    )
+    # Los que influyen en los picos por frame (el resto solo en el
+    # emparejado: se pueden cambiar regenerando desde la caché de picos)
+    PEAK_FIELDS = {
+        'bands': ('mode', 'resampler', 'freq_quant'),
+        'topn':  ('mode', 'resampler', 'topn_peaks', 'topn_band_edges', 'topn_neighborhood',
+                  'topn_tolerance_db', 'topn_min_db', 'topn_freq_quant'),
+    }
+    __slots__ = FIELDS + ('version',)
+
+    def __init__(self, version=None, **params):
+        values = {
+            'mode':              FINGERPRINT_MODE,
+            'resampler':         RESAMPLER,
+            'freq_quant':        FREQ_QUANT,
+            'target_deltas':     TARGET_DELTAS,
+            'topn_peaks':        TOPN_PEAKS_PER_BAND,
+            'topn_fan_out':      TOPN_FAN_OUT,
+            'topn_band_edges':   TOPN_BAND_EDGES,
+            'topn_neighborhood': TOPN_NEIGHBORHOOD,
+            'topn_tolerance_db': TOPN_TOLERANCE_DB,
+            'topn_zone':         TOPN_ZONE,
+            'topn_min_db':       TOPN_MIN_DB,
+            'topn_freq_quant':   TOPN_FREQ_QUANT,
+        }
+        unknown = set(params) - set(values)
+        if unknown:
+            raise ValueError(f"Parámetros de fingerprint desconocidos: {', '.join(sorted(unknown))}")
+        values.update(params)
+        if values['mode'] not in HASH_VERSIONS:
+            raise ValueError(f"Modo de fingerprint no soportado: {values['mode']}")
+        if values['resampler'] not in ('linear', 'polyphase'):
+            raise ValueError(f"Resampler no soportado: {values['resampler']}")
+
+        for name, value in values.items():
+            setattr(self, name, tuple(value) if isinstance(value, (list, tuple)) else value)
+        self.version = version
+
+    @classmethod
+    def from_dict(cls, data, version=None):
+        """Desde el JSON de app.fingerprint_versions.params."""
+        return cls(version=version, **data)
+
+    def as_dict(self):
+        """Parámetros serializables a JSON (tuplas → listas)."""
+        return {
+            name: list(value) if isinstance(value, tuple) else value
+            for name, value in ((name, getattr(self, name)) for name in self.FIELDS)
+        }
+
+    def _key(self):
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    def peak_digest(self):
+        """Digest de la configuración DSP (PEAK_FIELDS + STFT): clave de la caché de picos."""
+        data = {name: getattr(self, name) for name in self.PEAK_FIELDS[self.mode]}
+        data['stft'] = (SAMPLE_RATE, NPERSEG, NOVERLAP, PEAKS_FORMAT)
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    def __eq__(self, other):
+        return isinstance(other, AlgoParams) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"AlgoParams(version={self.version}, mode={self.mode!r}, resampler={self.resampler!r})"
+
 
 # ── WAV Parser ─────────────────────────────────────────────────────────
 def _parse_wav_bytes(wav_bytes):
     """
     Parsea WAV bytes manualmente (PCM 8/16/32-bit, IEEE float 32/64).
+    Acepta también FLAC (audio guardado con AUDIO_STORAGE_FORMAT=flac).
     Retorna (sample_rate, samples_mono_float32).
     """
+    if audioCodecService.is_flac(wav_bytes):
+        return audioCodecService.decode_flac(wav_bytes)
     data = io.BytesIO(wav_bytes)
 
     riff = data.read(4)
@@ -112,53 +289,156 @@ def _parse_wav_bytes(wav_bytes):
     return sample_rate, samples
 
 
-def _resample(samples, orig_sr, target_sr):
-    """Resamplea audio a la frecuencia objetivo (interpolación lineal)."""
+@lru_cache(maxsize=None)
+def _polyphase_filter(up, down):
+    """
+    FIR paso bajo para remuestrear por up/down, diseñado una sola vez por
+    par (44100, 48000, 22050, 16000 → 11025 son los habituales).  Corte en
+    la Nyquist de la frecuencia menor con ventana Kaiser β=5, el mismo
+    diseño que scipy.signal.resample_poly.  Se antepone relleno para que el
+    retardo sea múltiplo de `down`.  Retorna (h, delay) en muestras del
+    dominio sobremuestreado.
+    """
+    half_len = 10 * max(up, down)
+    h = firwin(2 * half_len + 1, 1.0 / max(up, down), window=('kaiser', 5.0)) * up
+    pad = (-half_len) % down
+    h = np.concatenate([np.zeros(pad), h])
+    h.flags.writeable = False
+    return h, half_len + pad
+
+
+def _resample(samples, orig_sr, target_sr, resampler=None):
+    """Resamplea audio a la frecuencia objetivo (según RESAMPLER)."""
     if orig_sr == target_sr:
         return samples
+    if (resampler or RESAMPLER) == 'polyphase':
+        return PolyphaseResampler(orig_sr, target_sr).process(samples, final=True)
     target_len = int(len(samples) * target_sr / orig_sr)
     indices = np.linspace(0, len(samples) - 1, target_len)
     return np.interp(indices, np.arange(len(samples)), samples).astype(np.float32)
 
 
 # ── Extracción de picos por banda ──────────────────────────────────────
-def _extract_band_peaks(Sxx_db):
+def _extract_band_peaks(Sxx_db, freq_quant=None):
     """
     Para cada frame temporal extrae:
       f_peak   — bin cuantizado del pico dominante (espectro completo)
       f_midlow — bin cuantizado del pico en la mitad inferior
       distance — f_peak - f_midlow  (relación espectral)
 
-    Retorna lista de tuplas (f_peak_q, f_midlow_q, distance) por frame.
+    Todo se calcula de una vez con argmax por eje (sin bucle por frame).
+    Retorna tupla de arrays (f_peak_q, f_midlow_q, distance), uno por frame.
+    """
+    n_bins  = Sxx_db.shape[0]           # 513 para NPERSEG=1024
+    mid_bin = n_bins // 2               # ≈ 256 (frontera mitad inferior)
+
+    # Pico dominante en todo el espectro (saltar DC, bin 0)
+    f_peak   = np.argmax(Sxx_db[1:, :], axis=0) + 1
+    # Pico dominante en la mitad inferior (frecuencia media-baja)
+    f_midlow = np.argmax(Sxx_db[1:mid_bin, :], axis=0) + 1
+
+    # Cuantizar para tolerancia al ruido/micrófono
+    freq_quant = freq_quant or FREQ_QUANT
+    fp_q = f_peak   // freq_quant
+    fm_q = f_midlow // freq_quant
+
+    # Distancia espectral (tercera componente)
+    dist = fp_q - fm_q
+
+    return fp_q, fm_q, dist
+
+
+def _extract_topn_peaks(Sxx_db, params=None):
+    """
+    Modo 'topn': picos del espectrograma y, por frame y banda de
+    TOPN_BAND_EDGES, los TOPN_PEAKS_PER_BAND más fuertes.
+
+    Un pico es máximo local en frecuencia y queda a menos de
+    TOPN_TOLERANCE_DB del máximo 2-D de su vecindario (TOPN_NEIGHBORHOOD).
+    Exigir el máximo exacto también en tiempo deja en una nota sostenida
+    un pico en un frame cualquiera (el que el ruido haga ganar); con el
+    margen la nota marca todos sus frames y los transitorios siguen
+    apagando a sus vecinos más débiles.
+
+    Retorna tupla con un único array (n_frames, n_bandas × N) de bins
+    cuantizados, ordenados por banda y por intensidad; -1 = sin pico.
+    """
+    params = params or AlgoParams()
+    area_max = maximum_filter(Sxx_db, size=params.topn_neighborhood, mode='constant', cval=-np.inf)
+    freq_max = maximum_filter1d(Sxx_db, size=params.topn_neighborhood[0], axis=0, mode='constant', cval=-np.inf)
+    is_peak = (
+        (Sxx_db == freq_max)
+        & (Sxx_db >= area_max - params.topn_tolerance_db)
+        & (Sxx_db > params.topn_min_db)
+    )
+    strength = np.where(is_peak, Sxx_db, -np.inf)
+
+    n = params.topn_peaks
+    edges = params.topn_band_edges
+    out = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        band = strength[lo:hi]
+        order = np.argsort(-band, axis=0, kind='stable')[:n]     # (n, frames)
+        found = np.take_along_axis(band, order, axis=0) > -np.inf
+        out.append(np.where(found, (order + lo) // params.topn_freq_quant, -1).T)
+    return (np.concatenate(out, axis=1).astype(np.int64),)
+
+
+def _segment_peaks(samples, params=None):
+    """Picos por frame de un tramo a SAMPLE_RATE según el modo."""
+    params = params or AlgoParams()
+    Sxx_db = _spectrogram_db(samples)
+    if params.mode == 'topn':
+        return _extract_topn_peaks(Sxx_db, params)
+    return _extract_band_peaks(Sxx_db, params.freq_quant)
+
+
+def _peak_context(params=None):
+    """Frames vecinos a cada lado de los que dependen los picos de un frame."""
+    params = params or AlgoParams()
+    return params.topn_neighborhood[1] // 2 if params.mode == 'topn' else 0
+
+
+# ── Hashes ────────────────────────────────────────────────────────────
+class FingerprintArrays:
+    """
+    Resultado de generate_fingerprints: arrays paralelos hashes (int64)
+    y offsets (frame ancla).  Se comporta como la lista histórica de
+    tuplas: len(), bool() e iteración devuelven (hash, anchor_frame).
+    `version` es la versión del algoritmo con la que se generaron (la
+    búsqueda y el guardado la respetan; None = la activa).  `peaks`: los
+    picos por frame de todo el audio si se pidieron (keep_peaks), para
+    la caché de picos.
     """
-    n_bins   = Sxx_db.shape[0]          # 513 para NPERSEG=1024
-    n_frames = Sxx_db.shape[1]
-    mid_bin  = n_bins // 2              # ≈ 256 (frontera mitad inferior)
 
-    frame_peaks = []
-    for t in range(n_frames):
-        col = Sxx_db[:, t]
+    __slots__ = ('hashes', 'offsets', 'version', 'peaks')
 
-        # Pico dominante en todo el espectro (primera frecuencia)
-        f_peak = int(np.argmax(col[1:])) + 1        # saltar DC (bin 0)
+    def __init__(self, hashes=None, offsets=None, version=None, peaks=None):
+        self.hashes  = np.asarray(hashes if hashes is not None else [], dtype=np.int64)
+        self.offsets = np.asarray(offsets if offsets is not None else [], dtype=np.int64)
+        self.version = version
+        self.peaks   = peaks
 
-        # Pico dominante en la mitad inferior (frecuencia media-baja)
-        f_midlow = int(np.argmax(col[1:mid_bin])) + 1
+    def __len__(self):
+        return len(self.hashes)
 
-        # Cuantizar para tolerancia al ruido/micrófono
-        fp_q = f_peak   // FREQ_QUANT
-        fm_q = f_midlow // FREQ_QUANT
+    def __iter__(self):
+        return zip(self.hashes.tolist(), self.offsets.tolist())
 
-        # Distancia espectral (tercera componente)
-        dist = fp_q - fm_q
+    def __repr__(self):
+        return f"FingerprintArrays(n={len(self)})"
 
-        frame_peaks.append((fp_q, fm_q, dist))
 
-    return frame_peaks
+def _pack_hashes(fp1, fm1, d1, fp2, fm2, d2):
+    """Empaqueta los 6 componentes (arrays) en hashes int64 de 60 bits."""
+    h = np.zeros(len(fp1), dtype=np.int64)
+    for comp in (fp1, fm1, d1 + HASH_DIST_BIAS, fp2, fm2, d2 + HASH_DIST_BIAS):
+        h = (h << HASH_FIELD_BITS) | (comp.astype(np.int64) & HASH_FIELD_MASK)
+    return h
 
 
 # ── Generación de fingerprints ─────────────────────────────────────────
-def generate_fingerprints(wav_bytes):
+def generate_fingerprints(wav_bytes, params=None):
     """
     Genera fingerprints del audio WAV.
 
@@ -168,18 +448,145 @@ def generate_fingerprints(wav_bytes):
     3. Extrae (f_peak, f_midlow, distance) por frame.
     4. Para cada frame t1 y cada delta en TARGET_DELTAS,
        toma t2 = t1 + delta y genera:
-       hash = SHA-1(fp1|fm1|d1|fp2|fm2|d2)
+       hash = pack(fp1, fm1, d1, fp2, fm2, d2)  (int64)
        Se almacena (hash, t1).
 
-    Retorna list[ (hash_hex, anchor_frame_int) ].
+    Retorna FingerprintArrays (hashes int64, offsets) ordenados por
+    (t1, delta), igual que el formato histórico.
+
+    params: AlgoParams de la versión a generar (por defecto la
+    configuración del módulo).
     """
     orig_sr, samples = _parse_wav_bytes(wav_bytes)
-    samples = _resample(samples, orig_sr, SAMPLE_RATE)
+    return generate_fingerprints_from_samples(samples, orig_sr, params)
+
+
+def generate_fingerprints_from_samples(samples, sample_rate, params=None):
+    """
+    Igual que generate_fingerprints pero a partir de muestras mono float32
+    ya decodificadas (p. ej. PCM recibido por WebSocket).
+    """
+    params = params or AlgoParams()
+    samples = _resample(samples, sample_rate, SAMPLE_RATE, params.resampler)
 
     if len(samples) < NPERSEG:
-        return []
+        return FingerprintArrays(version=params.version)
+
+    hashes, offsets = _pair_peaks(_segment_peaks(samples, params), params)
+    return FingerprintArrays(hashes, offsets, params.version)
+
+
+def generate_fingerprints_chunked(chunks, file_size=None, params=None, keep_peaks=False):
+    """
+    Modo por ventanas de generate_fingerprints para audios largos (sets,
+    directos): `chunks` es un iterable de trozos de bytes del WAV.
 
-    # Espectrograma (STFT)
+    Cada trozo se decodifica, remuestrea y pasa por la STFT por separado;
+    entre trozos solo se conservan la cola que no completa un frame y los
+    picos de los últimos max(TARGET_DELTAS) frames.  La memoria de trabajo
+    depende del tamaño del trozo, no de la duración, y los hashes/offsets
+    son exactamente los mismos que los de una sola pasada.
+
+    La rejilla de remuestreo necesita la longitud total, que se toma de
+    la cabecera; con file_size (WAV completo en disco) se corrige para
+    archivos truncados igual que hace _parse_wav_bytes.
+
+    keep_peaks conserva además los picos de todos los frames (.peaks).
+    """
+    params = params or AlgoParams()
+    parser = audioStreamService.WavStreamParser()
+    fingerprinter = None
+    hashes, offsets = [], []
+    received = 0
+
+    for chunk in chunks:
+        samples = parser.feed(chunk)
+        if not len(samples):
+            continue
+        if fingerprinter is None:
+            total = parser.expected_frames
+            if file_size is not None:
+                total = min(total, (file_size - parser.data_offset) // parser.frame_bytes)
+            fingerprinter = StreamingFingerprinter(
+                parser.sample_rate, total_samples=total, params=params, keep_peaks=keep_peaks,
+            )
+        received += len(samples)
+        fps = fingerprinter.feed(samples)
+        if len(fps):
+            hashes.append(fps.hashes)
+            offsets.append(fps.offsets)
+    parser.finish()
+
+    if fingerprinter is not None:
+        fps = fingerprinter.feed(np.empty(0, dtype=np.float32), final=True)
+        if len(fps):
+            hashes.append(fps.hashes)
+            offsets.append(fps.offsets)
+
+    if fingerprinter is not None and received != fingerprinter.total_samples:
+        raise ValueError(
+            f"WAV truncado: la cabecera anuncia {fingerprinter.total_samples} "
+            f"muestras y llegaron {received}"
+        )
+    peaks = fingerprinter.kept_peaks() if keep_peaks and fingerprinter is not None else None
+    if not hashes:
+        return FingerprintArrays(version=params.version, peaks=peaks)
+    return FingerprintArrays(np.concatenate(hashes), np.concatenate(offsets), params.version, peaks)
+
+
+def generate_fingerprints_file(path, chunk_bytes=CHUNK_BYTES, params=None, keep_peaks=False):
+    """
+    generate_fingerprints_chunked leyendo el WAV de disco por bloques.
+    Un FLAC se decodifica por bloques directamente a float32.
+    """
+    if audioCodecService.file_is_flac(path):
+        return _generate_fingerprints_flac_file(path, params, keep_peaks)
+
+    def _read():
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_bytes)
+                if not chunk:
+                    return
+                yield chunk
+    return generate_fingerprints_chunked(_read(), file_size=os.path.getsize(path), params=params, keep_peaks=keep_peaks)
+
+
+def _generate_fingerprints_flac_file(path, params=None, keep_peaks=False):
+    """generate_fingerprints_file para FLAC: bloques float32 → StreamingFingerprinter."""
+    params = params or AlgoParams()
+    sample_rate, frames = audioCodecService.flac_info(path)
+    fingerprinter = StreamingFingerprinter(sample_rate, total_samples=frames, params=params, keep_peaks=keep_peaks)
+    hashes, offsets = [], []
+
+    def _collect(fps):
+        if len(fps):
+            hashes.append(fps.hashes)
+            offsets.append(fps.offsets)
+
+    for samples in audioCodecService.iter_flac_blocks(path):
+        _collect(fingerprinter.feed(samples))
+    _collect(fingerprinter.feed(np.empty(0, dtype=np.float32), final=True))
+    peaks = fingerprinter.kept_peaks() if keep_peaks else None
+    if not hashes:
+        return FingerprintArrays(version=params.version, peaks=peaks)
+    return FingerprintArrays(np.concatenate(hashes), np.concatenate(offsets), params.version, peaks)
+
+
+def fingerprints_from_peaks(peaks, params=None):
+    """
+    Hashes a partir de los picos por frame de todo el audio (caché de
+    picos): solo el emparejado, sin audio ni STFT.  Mismo resultado que
+    generate_fingerprints con params si los picos se calcularon con la
+    misma configuración DSP (AlgoParams.peak_digest).
+    """
+    params = params or AlgoParams()
+    hashes, offsets = _pair_peaks(peaks, params)
+    return FingerprintArrays(hashes, offsets, params.version)
+
+
+def _spectrogram_db(samples):
+    """Espectrograma (STFT) en dB de muestras a SAMPLE_RATE."""
     _freqs, _times, Sxx = scipy_spectrogram(
         samples,
         fs=SAMPLE_RATE,
@@ -187,62 +594,497 @@ def generate_fingerprints(wav_bytes):
         noverlap=NOVERLAP,
         scaling='spectrum',
     )
-    Sxx_db = 10 * np.log10(Sxx + 1e-10)
+    return 10 * np.log10(Sxx + 1e-10)
+
+
+def _pair_horizon(params=None):
+    """Frames que necesita un ancla por delante para emitir sus pares."""
+    params = params or AlgoParams()
+    return params.topn_zone[1] - 1 if params.mode == 'topn' else max(params.target_deltas)
 
-    # Extraer tríos (f_peak, f_midlow, distance) por frame
-    frame_peaks = _extract_band_peaks(Sxx_db)
-    n_frames = len(frame_peaks)
 
-    # Generar pares constelación con cada delta
-    max_delta = max(TARGET_DELTAS)
-    fingerprints = []
+def _pair_peaks(peaks, params=None):
+    """(hashes, anchors) de los picos de _segment_peaks según el modo."""
+    params = params or AlgoParams()
+    if params.mode == 'topn':
+        return _pair_topn(*peaks, params=params)
+    return _pair_hashes(*peaks, deltas=params.target_deltas)
+
+
+def _pair_topn(peaks, params=None, block=4096):
+    """
+    Pares del modo 'topn': cada pico del frame t1 con los TOPN_FAN_OUT
+    primeros picos (por tiempo, luego por banda/intensidad) de los frames
+    t1 + TOPN_ZONE.  hash = versión | f1 | f2 | Δt  (10 bits cada uno).
+    Solo anclas con la zona completa, en orden (t1, pico ancla, destino).
+    Se procesa por bloques de anclas para acotar la memoria.
+    """
+    params = params or AlgoParams()
+    dts = np.arange(*params.topn_zone, dtype=np.int64)
+    n_anchors = len(peaks) - _pair_horizon(params)
+    hashes, anchors = [], []
+    for start in range(0, max(n_anchors, 0), block):
+        t1 = np.arange(start, min(start + block, n_anchors), dtype=np.int64)
+        targets = peaks[t1[:, None] + dts[None, :]].reshape(len(t1), -1)   # (A, Z·K)
+        target_dt = np.repeat(dts, peaks.shape[1])
+        chosen = (targets >= 0) & (np.cumsum(targets >= 0, axis=1) <= params.topn_fan_out)
+
+        a, k, j = np.nonzero((peaks[t1] >= 0)[:, :, None] & chosen[:, None, :])
+        f1 = peaks[t1[a], k]
+        hashes.append(
+            (np.int64(HASH_VERSIONS['topn']) << HASH_VERSION_SHIFT)
+            | (f1 << (2 * HASH_FIELD_BITS))
+            | (targets[a, j] << HASH_FIELD_BITS)
+            | target_dt[j]
+        )
+        anchors.append(t1[a])
+    if not hashes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(hashes), np.concatenate(anchors)
 
-    for t1 in range(n_frames - max_delta):
-        fp1, fm1, d1 = frame_peaks[t1]
-        for delta in TARGET_DELTAS:
-            t2 = t1 + delta
-            fp2, fm2, d2 = frame_peaks[t2]
 
-            # Hash = SHA-1 del par de tríos espectrales
-            raw = f"{fp1}|{fm1}|{d1}|{fp2}|{fm2}|{d2}"
-            h = hashlib.sha1(raw.encode()).hexdigest()
-            fingerprints.append((h, int(t1)))
+def hash_version(hashes):
+    """Versión del formato (HASH_VERSIONS) codificada en cada hash."""
+    return np.asarray(hashes, dtype=np.int64) >> HASH_VERSION_SHIFT
 
-    return fingerprints
+
+def _pair_hashes(fp_q, fm_q, dist, deltas=None):
+    """
+    Pares constelación de todos los frames ancla completos (los que tienen
+    delante max(TARGET_DELTAS) frames).  Retorna (hashes, anchors) con el
+    anchor relativo al primer frame recibido, en orden (t1, delta).
+    """
+    deltas = deltas or TARGET_DELTAS
+    n_anchors = len(fp_q) - max(deltas)
+    if n_anchors <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Matriz (n_anchors, len(deltas))
+    t1 = np.arange(n_anchors, dtype=np.int64)[:, None]
+    t2 = t1 + np.asarray(deltas, dtype=np.int64)[None, :]
+    t1 = np.broadcast_to(t1, t2.shape)
+
+    hashes = _pack_hashes(
+        fp_q[t1].ravel(), fm_q[t1].ravel(), dist[t1].ravel(),
+        fp_q[t2].ravel(), fm_q[t2].ravel(), dist[t2].ravel(),
+    )
+    return hashes, t1.ravel()
+
+
+# ── Streaming (sesiones WebSocket) ─────────────────────────────────────
+class StreamResampler:
+    """
+    Interpolación lineal con fase continua entre bloques: la salida k
+    corresponde a la posición k·orig_sr/target_sr del stream completo,
+    así que trocear la entrada no introduce saltos en la rejilla.
+
+    Si se conoce la longitud total (total_samples) se usa la misma rejilla
+    que _resample (np.linspace sobre todo el archivo) y la salida es
+    idéntica bit a bit a la del remuestreo de una sola pasada.
+    """
+
+    def __init__(self, orig_sr, target_sr=SAMPLE_RATE, total_samples=None):
+        self.step = orig_sr / target_sr
+        self.passthrough = orig_sr == target_sr
+        self.total_samples = total_samples
+        self.total_out = None
+        if total_samples is not None:
+            # Mismos valores que _resample: linspace(0, L-1, total_out)
+            self.total_out = int(total_samples * target_sr / orig_sr)
+            if self.total_out > 1:
+                self.step = (total_samples - 1) / (self.total_out - 1)
+        self._tail = np.empty(0, dtype=np.float32)  # entrada aún necesaria
+        self._tail_start = 0                        # índice absoluto de _tail[0]
+        self._next_out = 0                          # próximo índice de salida
+
+    def process(self, samples, final=False):
+        # final no tiene efecto: la interpolación lineal no tiene retardo
+        samples = np.asarray(samples, dtype=np.float32)
+        if self.passthrough:
+            return samples
+
+        buf = np.concatenate([self._tail, samples])
+        if not len(buf):
+            return buf
+        last = self._tail_start + len(buf) - 1      # última posición disponible
+
+        k_end = int(np.floor(last / self.step)) + 1
+        if self.total_out is not None:
+            # La última salida de linspace es exactamente L-1
+            complete = last >= self.total_samples - 1
+            k_end = self.total_out if complete else min(k_end, self.total_out)
+        out = np.empty(0, dtype=np.float32)
+        if k_end > self._next_out:
+            x = np.arange(self._next_out, k_end, dtype=np.float64) * self.step
+            if self.total_out is not None and k_end == self.total_out:
+                x[-1] = self.total_samples - 1
+            out = np.interp(x - self._tail_start, np.arange(len(buf)), buf).astype(np.float32)
+            self._next_out = k_end
+
+        # Conservar desde la muestra que necesita la próxima salida
+        keep = min(int(np.floor(self._next_out * self.step)), last) - self._tail_start
+        self._tail = buf[keep:]
+        self._tail_start += keep
+        return out
+
+
+class PolyphaseResampler:
+    """
+    Remuestreo racional polifásico por bloques (upfirdn con el filtro
+    cacheado de _polyphase_filter).
+
+    La salida m está centrada en la entrada m·down/up y solo se emite
+    cuando todas sus taps han llegado; se calcula siempre sobre una
+    ventana alineada a la rejilla de upfirdn, así que el resultado es el
+    mismo bit a bit se trocee como se trocee la entrada.  process(...,
+    final=True) vacía las últimas salidas (ceros tras el final) y deja
+    ceil(n·up/down) muestras en total, como resample_poly.
+    """
+
+    def __init__(self, orig_sr, target_sr=SAMPLE_RATE):
+        g = math.gcd(int(orig_sr), int(target_sr))
+        self.up, self.down = int(target_sr) // g, int(orig_sr) // g
+        self._h, self._delay = _polyphase_filter(self.up, self.down)
+        self._buf = np.empty(0, dtype=np.float32)   # entrada aún necesaria
+        self._buf_start = 0                         # índice absoluto de _buf[0]
+        self._next_out = 0                          # próximo índice de salida
+
+    def process(self, samples, final=False):
+        up, down = self.up, self.down
+        buf = np.concatenate([self._buf, np.asarray(samples, dtype=np.float32)])
+        end = self._buf_start + len(buf)            # muestras recibidas
+
+        if final:
+            m_end = -(-end * up // down)
+        else:
+            # Salidas con todas sus taps: (m·down + delay) // up ≤ end - 1
+            m_end = max(0, ((end - 1) * up - self._delay) // down + 1)
+
+        out = np.empty(0, dtype=np.float32)
+        if m_end > self._next_out:
+            y = upfirdn(self._h, buf, up, down)
+            first = (self._next_out * down + self._delay - self._buf_start * up) // down
+            out = y[first:first + m_end - self._next_out].astype(np.float32)
+            self._next_out = m_end
+
+        # Conservar desde la primera muestra que usa la próxima salida,
+        # con el inicio en múltiplo de `down` (misma rejilla de upfirdn)
+        k = self._next_out * down + self._delay
+        keep = max(self._buf_start, -(-(k - len(self._h) + 1) // up))
+        keep = min(keep, end)
+        keep -= keep % down
+        self._buf = buf[keep - self._buf_start:]
+        self._buf_start = keep
+        return out
+
+
+def _stream_resampler(sample_rate, total_samples=None, resampler=None):
+    """Resampler por bloques equivalente a _resample (según RESAMPLER)."""
+    if (resampler or RESAMPLER) == 'polyphase' and sample_rate != SAMPLE_RATE:
+        return PolyphaseResampler(sample_rate, SAMPLE_RATE)
+    return StreamResampler(sample_rate, SAMPLE_RATE, total_samples)
+
+
+class StreamingFingerprinter:
+    """
+    Fingerprinting incremental de un stream de audio.
+
+    Conserva la cola de muestras que aún no completa un frame STFT y el
+    historial de picos de los frames que todavía pueden ser t2 de un ancla
+    pendiente.  feed() solo calcula los frames nuevos y devuelve los
+    hashes nuevos, con anchors absolutos desde el inicio del stream
+    (frame_offset permite continuar la numeración tras un hueco).
+    Con total_samples (archivo de longitud conocida) el resultado
+    acumulado es idéntico al de generate_fingerprints_from_samples.
+
+    En modo 'topn' los picos de un frame dependen de sus vecinos (filtro
+    de máximo 2-D): cada tramo recalcula _peak_context() frames a cada
+    lado y solo fija los que ya tienen todo su vecindario.
+
+    params fija la versión del algoritmo durante todo el stream.
+    keep_peaks conserva los picos de todos los frames (kept_peaks()).
+    """
+
+    def __init__(self, sample_rate, frame_offset=0, total_samples=None, params=None, keep_peaks=False):
+        self.params = params or AlgoParams()
+        self.total_samples = total_samples
+        self._kept = [] if keep_peaks else None
+        self._resampler = _stream_resampler(sample_rate, total_samples, self.params.resampler)
+        self._context = _peak_context(self.params)
+        self._pending = np.empty(0, dtype=np.float32)
+        self._pending_frame = 0      # frame (relativo) en que empieza _pending
+        self._next_frame = 0         # primer frame (relativo) sin picos fijados
+        self._trim = None            # (descartar, fijar) del último take_frames
+        self._peaks = None           # picos de los frames aún necesarios
+        self._base = frame_offset    # frame absoluto de _peaks[*][0]
+
+    @property
+    def frames(self):
+        """Frames STFT calculados desde el inicio del stream."""
+        return self._base + (len(self._peaks[0]) if self._peaks is not None else 0)
+
+    def feed(self, samples, final=False):
+        """
+        Procesa audio nuevo → FingerprintArrays solo con hashes nuevos.
+        final=True marca el fin del audio (vacía el retardo del resampler
+        y fija los últimos frames).
+        """
+        segment = self.take_frames(samples, final)
+        peaks = _segment_peaks(segment, self.params) if segment is not None else None
+        return self.push_peaks(peaks)
+
+    def take_frames(self, samples, final=False):
+        """
+        Primera mitad de feed(): resamplea y devuelve el tramo (a
+        SAMPLE_RATE) que cubre los frames STFT completos nuevos, o None.
+        Sus picos (_segment_peaks) se pueden calcular fuera
+        (dspPoolService) y entregar a push_peaks().
+        """
+        buf = np.concatenate([self._pending, self._resampler.process(samples, final)])
+        n = (len(buf) - NOVERLAP) // HOP if len(buf) >= NPERSEG else 0
+        # Último frame con su vecindario completo (o todos al final)
+        last = self._pending_frame + n - 1 - (0 if final else self._context)
+        if n <= 0 or last < self._next_frame:
+            self._pending = buf
+            return None
+
+        self._trim = (self._next_frame - self._pending_frame, last - self._next_frame + 1)
+        segment = buf[:(n - 1) * HOP + NPERSEG]
+        # El próximo tramo arranca con `_context` frames de contexto izquierdo
+        keep_frame = max(self._pending_frame, last + 1 - self._context)
+        self._pending = buf[(keep_frame - self._pending_frame) * HOP:]
+        self._pending_frame = keep_frame
+        self._next_frame = last + 1
+        return segment
+
+    def push_peaks(self, peaks):
+        """Segunda mitad de feed(): añade picos y emite los hashes nuevos."""
+        if peaks is not None:
+            skip, count = self._trim
+            peaks = tuple(np.asarray(p, dtype=np.int64)[skip:skip + count] for p in peaks)
+            if self._kept is not None:
+                self._kept.append(peaks)
+            self._peaks = peaks if self._peaks is None else tuple(
+                np.concatenate([old, new]) for old, new in zip(self._peaks, peaks)
+            )
+        version = self.params.version
+        if self._peaks is None:
+            return FingerprintArrays(version=version)
+
+        hashes, anchors = _pair_peaks(self._peaks, self.params)
+        n_anchors = max(0, len(self._peaks[0]) - _pair_horizon(self.params))
+        if n_anchors:
+            anchors = anchors + self._base
+            # Las anclas emitidas ya no hacen falta
+            self._peaks = tuple(a[n_anchors:] for a in self._peaks)
+            self._base += n_anchors
+        return FingerprintArrays(hashes, anchors, version)
+
+    def kept_peaks(self):
+        """Picos de todos los frames fijados (con keep_peaks), tupla de arrays."""
+        if not self._kept:
+            return None
+        return tuple(np.concatenate(parts) for parts in zip(*self._kept))
+
+
+class VoteAccumulator:
+    """
+    Histograma persistente (song_id, offset_diff) de una sesión de
+    streaming: cada análisis suma solo los votos de los hashes nuevos y
+    mantiene el mejor grupo por canción.  El histograma se limita a
+    max_keys grupos podando los de menos votos (casi siempre ruido: los
+    grupos coherentes acumulan votos y sobreviven).
+
+    Los grupos se guardan en arrays NumPy ordenados (clave
+    song_id << 32 | offset_diff de 32 bits, y votos): VOTE_KEY_BYTES por
+    grupo en vez de los ~200 B de un dict de tuplas.
+    """
+
+    def __init__(self, mode=None, max_keys=STREAM_MAX_VOTE_KEYS):
+        self.mode = mode
+        self.max_keys = max_keys
+        self._keys = np.empty(0, dtype=np.int64)     # ordenadas
+        self._counts = np.empty(0, dtype=np.int32)
+        self.song_best = {}             # song_id → max coherent count
+        self.query_hashes = 0
+        self.pruned = 0
+        self._song_info = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def nbytes(self):
+        return self._keys.nbytes + self._counts.nbytes
+
+    def add(self, fingerprints):
+        self.query_hashes += len(fingerprints)
+        if not fingerprints:
+            return
+        votes = count_votes(fingerprints, self.mode)
+        if not votes:
+            return
+        keys = np.fromiter(
+            ((sid << 32) | (od & 0xFFFFFFFF) for sid, od in votes),
+            dtype=np.int64, count=len(votes),
+        )
+        counts = np.fromiter(votes.values(), dtype=np.int32, count=len(votes))
+        order = np.argsort(keys)
+        keys, counts = keys[order], counts[order]
+
+        # Suma a los grupos existentes e inserta los nuevos (en orden)
+        pos = np.searchsorted(self._keys, keys)
+        hit = pos < len(self._keys)
+        hit[hit] = self._keys[pos[hit]] == keys[hit]
+        self._counts[pos[hit]] += counts[hit]
+        if not hit.all():
+            self._keys = np.insert(self._keys, pos[~hit], keys[~hit])
+            self._counts = np.insert(self._counts, pos[~hit], counts[~hit])
+
+        # Mejor grupo por canción entre los tocados (keys ordenadas → song_id ordenado)
+        totals = self._counts[np.searchsorted(self._keys, keys)]
+        sids = keys >> 32
+        starts = np.flatnonzero(np.r_[True, sids[1:] != sids[:-1]])
+        for sid, best in zip(sids[starts].tolist(), np.maximum.reduceat(totals, starts).tolist()):
+            if best > self.song_best.get(sid, 0):
+                self.song_best[sid] = best
+
+        if len(self._keys) > self.max_keys:
+            self._prune()
+
+    def _prune(self):
+        """Descarta grupos con pocos votos hasta quedar bajo max_keys."""
+        threshold = 1
+        while len(self._keys) > self.max_keys // 2:
+            keep = self._counts > threshold
+            self.pruned += len(keep) - int(keep.sum())
+            self._keys, self._counts = self._keys[keep], self._counts[keep]
+            threshold += 1
+
+    def result(self):
+        """Mismo dict que search_by_fingerprints (o None)."""
+        if not self.song_best:
+            return None
+        top = dict(sorted(self.song_best.items(), key=lambda x: x[1], reverse=True)[:TOP_CANDIDATES])
+        missing = [sid for sid in top if sid not in self._song_info]
+        if missing:
+            self._song_info.update(_fetch_song_info(missing))
+        return _build_result(top, self._song_info, self.query_hashes)
 
 
 # ── Almacenamiento ─────────────────────────────────────────────────────
 def store_fingerprints(song_id, fingerprints):
-    """Guarda fingerprints en BD (batch de 500)."""
+    """
+    Guarda fingerprints en BD.  En Postgres usa COPY binario (un solo
+    statement, sin parsear SQL por fila); con otro motor, INSERT en
+    lotes de 500.
+
+    Las filas se etiquetan con fingerprints.version (None = la versión
+    activa).  fingerprint_count de la canción y el índice en memoria solo
+    reflejan la versión activa.
+    """
     if not fingerprints:
         return 0
 
+    active = _active_version()
+    version = fingerprints.version or active
     with connection.cursor() as cursor:
-        batch_size = 500
-        total = 0
+        if connection.vendor == 'postgresql':
+            total = _copy_fingerprints(cursor, song_id, fingerprints, version)
+        else:
+            total = _insert_fingerprints(cursor, song_id, fingerprints, version)
 
-        for i in range(0, len(fingerprints), batch_size):
-            batch = fingerprints[i:i + batch_size]
-            values = []
-            params = []
-            for h, t in batch:
-                values.append("(%s, %s, %s)")
-                params.extend([song_id, h, t])
+        if version == active:
+            cursor.execute(
+                "UPDATE app.songs SET fingerprint_count = %s, updated_at = NOW() WHERE id = %s",
+                [total, song_id],
+            )
 
-            sql = f"INSERT INTO app.fingerprints (song_id, hash, time_offset) VALUES {','.join(values)}"
-            cursor.execute(sql, params)
-            total += len(batch)
+    if version == active:
+        fingerprintIndexService.add_song(song_id, fingerprints)
+    return total
 
-        cursor.execute(
-            "UPDATE app.songs SET fingerprint_count = %s, updated_at = NOW() WHERE id = %s",
-            [total, song_id],
-        )
 
+# Formato binario de COPY: cabecera + una tupla por fila + trailer -1.
+# Cada tupla = nº de campos (int16) y, por campo, longitud (int32) + valor
+# big-endian: song_id BIGINT, hash BIGINT, time_offset INTEGER,
+# algo_version SMALLINT.
+_PGCOPY_HEADER  = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_PGCOPY_TRAILER = struct.pack('>h', -1)
+_PGCOPY_ROW = np.dtype([
+    ('fields', '>i2'),
+    ('sid_len', '>i4'),  ('song_id', '>i8'),
+    ('hash_len', '>i4'), ('hash', '>i8'),
+    ('time_len', '>i4'), ('time_offset', '>i4'),
+    ('version_len', '>i4'), ('algo_version', '>i2'),
+])
+
+COPY_CHUNK_BYTES = 1 << 20
+
+
+def _pgcopy_payload(song_id, fingerprints, version):
+    """Filas de COPY binario construidas de una vez con un array estructurado."""
+    rows = np.empty(len(fingerprints), dtype=_PGCOPY_ROW)
+    rows['fields'] = 4
+    rows['sid_len'], rows['hash_len'], rows['time_len'], rows['version_len'] = 8, 8, 4, 2
+    rows['song_id'] = song_id
+    rows['hash'] = fingerprints.hashes
+    rows['time_offset'] = fingerprints.offsets
+    rows['algo_version'] = version
+    return _PGCOPY_HEADER + rows.tobytes() + _PGCOPY_TRAILER
+
+
+def _copy_fingerprints(cursor, song_id, fingerprints, version):
+    """COPY app.fingerprints FROM STDIN (BINARY) con psycopg2 o psycopg 3."""
+    sql = "COPY app.fingerprints (song_id, hash, time_offset, algo_version) FROM STDIN WITH (FORMAT BINARY)"
+    payload = _pgcopy_payload(song_id, fingerprints, version)
+    raw = cursor.cursor
+
+    if hasattr(raw, 'copy_expert'):          # psycopg2
+        raw.copy_expert(sql, io.BytesIO(payload), size=COPY_CHUNK_BYTES)
+    elif hasattr(raw, 'copy'):               # psycopg 3
+        view = memoryview(payload)
+        with raw.copy(sql) as copy:
+            for i in range(0, len(view), COPY_CHUNK_BYTES):
+                copy.write(view[i:i + COPY_CHUNK_BYTES])
+    else:
+        return _insert_fingerprints(cursor, song_id, fingerprints, version)
+    return len(fingerprints)
+
+
+def _insert_fingerprints(cursor, song_id, fingerprints, version):
+    """INSERT multi-fila en lotes de 500 (motores sin COPY)."""
+    hashes  = fingerprints.hashes.tolist()
+    offsets = fingerprints.offsets.tolist()
+    batch_size = 500
+    total = 0
+
+    for i in range(0, len(hashes), batch_size):
+        batch = zip(hashes[i:i + batch_size], offsets[i:i + batch_size])
+        values = []
+        params = []
+        for h, t in batch:
+            values.append("(%s, %s, %s, %s)")
+            params.extend([song_id, h, t, version])
+
+        sql = f"INSERT INTO app.fingerprints (song_id, hash, time_offset, algo_version) VALUES {','.join(values)}"
+        cursor.execute(sql, params)
+        total += len(values)
     return total
 
 
+def _active_params():
+    """AlgoParams de la versión activa del algoritmo (cacheado por proceso)."""
+    from VibeFlow.Public.Services import fingerprintVersionService
+    return fingerprintVersionService.active_version()
+
+
+def _active_version():
+    return _active_params().version
+
+
 # ── Búsqueda con coherencia temporal ──────────────────────────────────
-def search_by_fingerprints(fingerprints):
+def search_by_fingerprints(fingerprints, mode=None):
     """
     Busca coincidencias en BD usando coherencia temporal.
 
@@ -252,11 +1094,131 @@ def search_by_fingerprints(fingerprints):
     4. El grupo más grande indica la mejor coincidencia.
     5. Si el grupo ≥ MIN_MATCHES (25) → confirmado.
 
+    mode: 'index' | 'sql' | 'python' (por defecto SEARCH_MODE).
+    'index' cae a 'sql' si el índice en memoria no está listo; 'sql'
+    requiere Postgres y con otro motor se usa 'python'.
+
+    Solo se vota contra las filas de la versión del algoritmo con la que
+    se generó el query (fingerprints.version, por defecto la activa).
+
     Retorna dict con resultado o None.
     """
     if not fingerprints:
         return None
 
+    mode = mode or SEARCH_MODE
+    version = fingerprints.version or _active_version()
+    index = fingerprintIndexService.get_index(version) if mode == 'index' else None
+    if index is not None:
+        song_best, song_info = index.vote(fingerprints)
+    elif mode in ('index', 'sql') and connection.vendor == 'postgresql':
+        song_best, song_info = _vote_sql(fingerprints, version)
+    else:
+        song_best, song_info = _vote_python(fingerprints, version)
+
+    if not song_best:
+        return None
+
+    return _build_result(song_best, song_info, len(fingerprints))
+
+
+def count_votes(fingerprints, mode=None):
+    """
+    Votos crudos de coherencia temporal, sin reducir por canción:
+    {(song_id, offset_diff): count}.  Lo usa VoteAccumulator para sumar
+    los votos de cada análisis incremental.  Mismos modos que
+    search_by_fingerprints.
+    """
+    if not fingerprints:
+        return {}
+
+    mode = mode or SEARCH_MODE
+    version = fingerprints.version or _active_version()
+    index = fingerprintIndexService.get_index(version) if mode == 'index' else None
+    if index is not None:
+        return index.coherent_votes(fingerprints)
+    if mode in ('index', 'sql') and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                WITH q AS (
+                    SELECT * FROM unnest(%s::bigint[], %s::integer[]) AS q(hash, qt)
+                )
+                SELECT f.song_id, f.time_offset - q.qt AS offset_diff, COUNT(*)
+                FROM q
+                JOIN app.fingerprints f ON f.hash = q.hash AND f.algo_version = %s
+                GROUP BY 1, 2
+            """, [fingerprints.hashes.tolist(), fingerprints.offsets.tolist(), version])
+            return {(sid, od): cnt for sid, od, cnt in cursor.fetchall()}
+    coherent, _song_info = _coherent_python(fingerprints, version)
+    return dict(coherent)
+
+
+def _fetch_song_info(song_ids):
+    """{song_id: {title, artist}} de las canciones indicadas."""
+    song_ids = list(song_ids)
+    ph = ','.join(['%s'] * len(song_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT id, title, artist FROM app.songs WHERE id IN ({ph})", song_ids)
+        return {sid: {'title': title, 'artist': artist} for sid, title, artist in cursor.fetchall()}
+
+
+def _vote_sql(fingerprints, version, top_n=TOP_CANDIDATES):
+    """
+    Votación en el servidor: envía los pares (hash, query_time) como dos
+    arrays, Postgres hace el JOIN + GROUP BY (song_id, offset_diff) y
+    devuelve solo el mejor grupo coherente de las top_n canciones.
+
+    Retorna (song_best {song_id: count}, song_info {song_id: {title, artist}}).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            WITH q AS (
+                SELECT * FROM unnest(%s::bigint[], %s::integer[]) AS q(hash, qt)
+            ),
+            votes AS (
+                SELECT f.song_id, COUNT(*) AS cnt
+                FROM q
+                JOIN app.fingerprints f ON f.hash = q.hash AND f.algo_version = %s
+                GROUP BY f.song_id, f.time_offset - q.qt
+            ),
+            best AS (
+                SELECT song_id, MAX(cnt) AS cnt
+                FROM votes
+                GROUP BY song_id
+            )
+            SELECT b.song_id, b.cnt, s.title, s.artist
+            FROM best b
+            JOIN app.songs s ON s.id = b.song_id
+            ORDER BY b.cnt DESC, b.song_id
+            LIMIT %s
+        """, [fingerprints.hashes.tolist(), fingerprints.offsets.tolist(), version, top_n])
+        rows = cursor.fetchall()
+
+    song_best = {sid: cnt for sid, cnt, _title, _artist in rows}
+    song_info = {sid: {'title': title, 'artist': artist} for sid, _cnt, title, artist in rows}
+    return song_best, song_info
+
+
+def _vote_python(fingerprints, version):
+    """
+    Votación histórica: trae cada fila coincidente (lotes de 500 hashes)
+    y cuenta (song_id, offset_diff) en un dict.
+
+    Retorna (song_best {song_id: count}, song_info {song_id: {title, artist}}).
+    """
+    coherent, song_info = _coherent_python(fingerprints, version)
+
+    # Mejor grupo coherente por canción
+    song_best = {}   # song_id → max coherent count
+    for (sid, _od), cnt in coherent.items():
+        if sid not in song_best or cnt > song_best[sid]:
+            song_best[sid] = cnt
+
+    return song_best, song_info
+
+
+def _coherent_python(fingerprints, version):
+    """(coherent {(song_id, offset_diff): count}, song_info) en Python."""
     # Mapear hash → lista de query_times (un hash puede repetirse)
     hash_to_qtimes = defaultdict(list)
     for h, t in fingerprints:
@@ -276,14 +1238,11 @@ def search_by_fingerprints(fingerprints):
                        s.title, s.artist
                 FROM app.fingerprints f
                 JOIN app.songs s ON s.id = f.song_id
-                WHERE f.hash IN ({ph})
-            """, batch)
+                WHERE f.hash IN ({ph}) AND f.algo_version = %s
+            """, batch + [version])
             cols = [c[0] for c in cursor.description]
             db_rows.extend(dict(zip(cols, row)) for row in cursor.fetchall())
 
-    if not db_rows:
-        return None
-
     # Coherencia temporal: agrupar por (song_id, offset_diff)
     coherent = defaultdict(int)   # (song_id, offset_diff) → count
     song_info = {}                # song_id → {title, artist}
@@ -298,26 +1257,22 @@ def search_by_fingerprints(fingerprints):
             offset_diff = db_time - qt
             coherent[(sid, offset_diff)] += 1
 
-    if not coherent:
-        return None
+    return coherent, song_info
 
-    # Mejor grupo coherente por canción
-    song_best = {}   # song_id → max coherent count
-    for (sid, _od), cnt in coherent.items():
-        if sid not in song_best or cnt > song_best[sid]:
-            song_best[sid] = cnt
 
+def _build_result(song_best, song_info, query_hashes):
+    """Arma el dict de resultado (mejor canción + top candidatos)."""
     # Mejor global
     best_sid = max(song_best, key=song_best.get)
     best_count = song_best[best_sid]
 
     is_confirmed = best_count >= MIN_MATCHES
-    confidence = round((best_count / len(fingerprints)) * 100, 1)
+    confidence = round((best_count / query_hashes) * 100, 1)
 
     # Candidatos (top 5)
     candidates = []
-    for sid, cnt in sorted(song_best.items(), key=lambda x: x[1], reverse=True)[:5]:
-        c_conf = round((cnt / len(fingerprints)) * 100, 1)
+    for sid, cnt in sorted(song_best.items(), key=lambda x: x[1], reverse=True)[:TOP_CANDIDATES]:
+        c_conf = round((cnt / query_hashes) * 100, 1)
         candidates.append({
             'song_id': sid,
             'title':   song_info[sid]['title'],
@@ -331,7 +1286,7 @@ def search_by_fingerprints(fingerprints):
         'title':          song_info[best_sid]['title'],
         'artist':         song_info[best_sid]['artist'],
         'matched_hashes': best_count,
-        'query_hashes':   len(fingerprints),
+        'query_hashes':   query_hashes,
         'confidence':     confidence,
         'is_confirmed':   is_confirmed,
         'min_required':   MIN_MATCHES,
@@ -340,20 +1295,44 @@ def search_by_fingerprints(fingerprints):
 
 
 # ── Regeneración de fingerprints ──────────────────────────────────────
-def regenerate_song(song_id):
+def regenerate_song(song_id, params=None, from_peaks=False):
     """
-    Regenera los fingerprints de UNA canción descargando el audio
-    desde TeraBox.
+    Regenera los fingerprints de UNA canción leyendo su audio del
+    almacenamiento (audioStorageService).
 
-    1. Lee terabox_path de la canción en BD.
-    2. Descarga el audio WAV desde TeraBox.
+    1. Lee la clave de almacenamiento (terabox_path) de la canción en BD.
+    2. Obtiene el WAV (ruta local directa o descarga a un temporal).
     3. Borra fingerprints viejos.
-    4. Genera y guarda fingerprints con el algoritmo actual.
+    4. Genera (pool DSP) y guarda fingerprints con el algoritmo actual,
+       y sus picos en la caché de picos.
 
+    params: versión a regenerar (AlgoParams registrado; por defecto la
+    activa).  from_peaks: si la caché tiene los picos de la canción con
+    la misma configuración DSP, solo se re-emparejan (sin audio ni STFT).
     Retorna cantidad de fingerprints generados.
     """
-    from VibeFlow.Public.Services import teraboxService
-
+    params = params or _active_params()
+    if from_peaks:
+        peaks = peakCacheService.load(song_id, params)
+        if peaks is not None:
+            return replace_fingerprints(song_id, fingerprints_from_peaks(peaks, params))
+
+    path, temporary = _download_song_to_file(song_id)
+    try:
+        fps = dspPoolService.fingerprint_wav_file(path, params, keep_peaks=peakCacheService.is_enabled())
+    finally:
+        if temporary:
+            os.remove(path)
+    try:
+        peakCacheService.save(song_id, params, fps.peaks)
+    except Exception as e:
+        # La caché es opcional: sin ella se vuelve a analizar el audio
+        print(f"[PeakCache] No se pudieron guardar los picos de {song_id}: {e}")
+    return replace_fingerprints(song_id, fps)
+
+
+def song_storage_key(song_id):
+    """Clave de almacenamiento del audio (ValueError si no existe / sin audio)."""
     with connection.cursor() as cursor:
         cursor.execute(
             "SELECT id, title, terabox_path FROM app.songs WHERE id = %s",
@@ -366,43 +1345,107 @@ def regenerate_song(song_id):
         sid, title, terabox_path = row
         if not terabox_path:
             raise ValueError(
-                f"Canción {song_id} ('{title}') no tiene audio en TeraBox"
+                f"Canción {song_id} ('{title}') no tiene audio guardado"
             )
+    return terabox_path
 
-    # Descargar audio desde TeraBox
-    wav_bytes = teraboxService.download_song(terabox_path)
 
-    # Borrar fingerprints anteriores
-    with connection.cursor() as cursor:
-        cursor.execute("DELETE FROM app.fingerprints WHERE song_id = %s", [song_id])
+def download_song_audio(song_id):
+    """Audio (WAV o FLAC) de la canción desde su almacenamiento (ValueError si no existe / sin audio)."""
+    from VibeFlow.Public.Services import audioStorageService
 
-    # Generar nuevos fingerprints
-    fps = generate_fingerprints(wav_bytes)
-    count = store_fingerprints(song_id, fps)
-    return count
+    return audioStorageService.get(song_storage_key(song_id))
 
 
-def regenerate_all():
+def _download_song_to_file(song_id):
+    """
+    Audio (WAV o FLAC) en un archivo para fingerprintarlo por bloques (un set de una
+    hora no cabe cómodamente en float32 + temporales de la STFT).
+
+    Retorna (ruta, temporal).  Con almacenamiento local se usa el archivo
+    directamente; si no, se copia a un temporal que el llamador debe
+    borrar.  El blob de la caché de TeraBox no se usa en el sitio (la
+    caché puede desalojarlo antes de que el worker DSP lo abra): se
+    enlaza (hardlink) al temporal y, si no se puede, se descarga.
+    """
+    from VibeFlow.Public.Services import audioStorageService
+
+    key = song_storage_key(song_id)
+    path = audioStorageService.local_path(key)
+    if path is not None and key.startswith(audioStorageService.LOCAL_PREFIX):
+        return path, False
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(key)[1] or '.wav', delete=False) as f:
+        pass
+    try:
+        if path is None or not _link_file(path, f.name):
+            audioStorageService.fetch_to_file(key, f.name)
+    except BaseException:
+        os.remove(f.name)
+        raise
+    return f.name, True
+
+
+def _link_file(src, dest):
+    """
+    Reemplaza `dest` por un hardlink de `src`.  False si no se puede
+    (src desalojado, otro sistema de archivos...).
+    """
+    tmp = dest + '.lnk'
+    try:
+        os.link(src, tmp)
+    except OSError:
+        return False
+    os.replace(tmp, dest)
+    return True
+
+
+def replace_fingerprints(song_id, fps):
+    """
+    Borra los fingerprints anteriores de la canción en la versión de `fps`
+    y guarda los nuevos (en una transacción: la búsqueda nunca ve la
+    canción a medias).
+    """
+    version = fps.version or _active_version()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM app.fingerprints WHERE song_id = %s AND algo_version = %s",
+                [song_id, version],
+            )
+        if version == _active_version():
+            fingerprintIndexService.remove_song(song_id)
+        return store_fingerprints(song_id, fps)
+
+
+def regenerate_all(params=None, only_missing=False, concurrency=None, from_peaks=False):
     """
     Regenera fingerprints de TODAS las canciones.
     Útil al cambiar parámetros del algoritmo.
 
-    Retorna dict con resumen: {total_songs, processed, results: [{id, title, fp_count}]}
+    Encola un lote de jobs 'regenerate' (uno por canción, ver
+    ingestJobsService) y lo procesa en este proceso con `concurrency`
+    hilos: las descargas de unas canciones se solapan con el DSP de
+    otras.  Si hay workers de ingesta corriendo también toman jobs del
+    lote.  Cada job es un checkpoint: si se corta, los jobs pendientes
+    se retoman con run_batch o con cualquier worker.
+
+    params: versión a regenerar (por defecto la activa).  only_missing
+    salta las canciones que ya tienen filas de esa versión: así una
+    construcción interrumpida se retoma donde quedó.  from_peaks
+    re-empareja desde la caché de picos las canciones que la tienen
+    (cambios de TARGET_DELTAS y demás parámetros de emparejado); el resto
+    se descarga y analiza como siempre.
+
+    Retorna dict con resumen: {total_songs, processed, batch_id, results: [{id, title, fp_count}]}
     """
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT id, title FROM app.songs ORDER BY id")
-        songs = cursor.fetchall()
-
-    results = []
-    for sid, title in songs:
-        try:
-            count = regenerate_song(sid)
-            results.append({'id': sid, 'title': title, 'fingerprints': count, 'status': 'ok'})
-        except Exception as e:
-            results.append({'id': sid, 'title': title, 'fingerprints': 0, 'status': f'error: {e}'})
+    from VibeFlow.Public.Services import ingestJobsService
 
+    batch = ingestJobsService.create_regenerate_batch(params or _active_params(), only_missing, from_peaks)
+    ingestJobsService.run_batch(batch['batch_id'], concurrency)
+    results = ingestJobsService.batch_results(batch['batch_id'])
     return {
-        'total_songs': len(songs),
+        'total_songs': batch['total'],
         'processed': len(results),
+        'batch_id': batch['batch_id'],
         'results': results,
     }
@@ -0,0 +1,343 @@
+"""
+fingerprintVersionService.py - Versiones del algoritmo y re-indexado sin corte.
+
+Cada fila de app.fingerprints lleva algo_version y app.fingerprint_versions
+guarda los parámetros (fingerprintService.AlgoParams) de cada versión.
+Cambiar FREQ_QUANT, TARGET_DELTAS, el modo de constellation, etc. en
+producción:
+
+  1. create    → registra los parámetros de la configuración actual
+                 (.env) como versión nueva en estado 'building'.
+  2. build     → genera los fingerprints de esa versión para todas las
+                 canciones, junto a los de la activa.  La búsqueda sigue
+                 fijada a la activa.  Reanudable: solo procesa canciones
+                 sin filas de la versión.  Mientras tanto la ingesta
+                 escribe ambas versiones.  Si la versión solo cambia el
+                 emparejado (TARGET_DELTAS...), --from-peaks re-empareja
+                 desde la caché de picos sin descargar el audio.
+  3. activate  → comprueba que ninguna canción quedó sin construir y
+                 cambia la versión activa en una transacción (la anterior
+                 pasa a 'retired').  Cada proceso ve el cambio en menos de
+                 FINGERPRINT_VERSION_TTL segundos; una sesión de streaming
+                 ya abierta termina con la versión con la que empezó.
+                 Activar una versión 'retired' es el rollback.
+  4. gc        → borra las filas de las versiones retiradas hace más de
+                 FINGERPRINT_VERSION_GC_GRACE segundos ('collected') y
+                 los picos cacheados de configuraciones DSP sin uso.
+
+Uso: python manage.py fingerprint_versions {list,create,build,activate,discard,gc}
+
+Variables de entorno:
+  FINGERPRINT_VERSION_TTL       segundos que cada proceso cachea la
+                                versión activa (5)
+  FINGERPRINT_VERSION_GC_GRACE  antigüedad mínima de una versión
+                                retirada para borrar sus filas (600)
+  FINGERPRINT_VERSION_GC_BATCH  canciones por DELETE del GC (200)
+"""
+
+import os
+import json
+import time
+import threading
+from django.db import connection, transaction
+from VibeFlow.Public.Services import fingerprintIndexService, fingerprintService, peakCacheService
+
+
+# ── Configuración ──────────────────────────────────────────────────────
+FINGERPRINT_VERSION_TTL = float(os.getenv('FINGERPRINT_VERSION_TTL', '5'))
+FINGERPRINT_VERSION_GC_GRACE = int(os.getenv('FINGERPRINT_VERSION_GC_GRACE', '600'))
+FINGERPRINT_VERSION_GC_BATCH = int(os.getenv('FINGERPRINT_VERSION_GC_BATCH', '200'))
+
+_active = None          # AlgoParams de la versión activa (caché del proceso)
+_active_at = 0.0
+_lock = threading.Lock()
+
+
+def _load_json(value):
+    """JSONB llega como dict (psycopg) o como str según el driver."""
+    return json.loads(value) if isinstance(value, str) else (value or {})
+
+
+def _dictfetchall(cursor):
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+# ── Versión activa ─────────────────────────────────────────────────────
+def active_version():
+    """
+    AlgoParams de la versión activa (con .version).  Se cachea
+    FINGERPRINT_VERSION_TTL segundos por proceso: así el cambio de versión
+    llega a todos los workers sin reiniciarlos.
+    """
+    global _active, _active_at
+    params = _active
+    if params is not None and time.monotonic() - _active_at < FINGERPRINT_VERSION_TTL:
+        return params
+
+    with _lock:
+        params = _fetch_active()
+        _active, _active_at = params, time.monotonic()
+    fingerprintIndexService.set_version(params.version)
+    return params
+
+
+def invalidate():
+    """Fuerza a releer la versión activa en la próxima llamada."""
+    global _active
+    with _lock:
+        _active = None
+
+
+def _fetch_active():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT version, params FROM app.fingerprint_versions WHERE status = 'active'")
+        row = cursor.fetchone()
+        if row is None:
+            # Primera vez: las filas existentes (algo_version = 1) las
+            # generó la configuración actual
+            cursor.execute("""
+                INSERT INTO app.fingerprint_versions (version, params, status, activated_at)
+                VALUES (1, %s::jsonb, 'active', NOW())
+                ON CONFLICT (version) DO NOTHING
+            """, [json.dumps(fingerprintService.AlgoParams().as_dict())])
+            cursor.execute("SELECT version, params FROM app.fingerprint_versions WHERE status = 'active'")
+            row = cursor.fetchone()
+    if row is None:
+        raise RuntimeError("No hay ninguna versión de fingerprints activa")
+    version, params = row
+    return fingerprintService.AlgoParams.from_dict(_load_json(params), version=version)
+
+
+def get_version(version):
+    """AlgoParams de una versión registrada (ValueError si no existe)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT params FROM app.fingerprint_versions WHERE version = %s",
+            [version],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"Versión de fingerprints {version} no encontrada")
+    return fingerprintService.AlgoParams.from_dict(_load_json(row[0]), version=version)
+
+
+def live_versions():
+    """
+    Versiones que debe escribir la ingesta: la activa primero y después
+    las que están en construcción.
+    """
+    active = active_version()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT version, params FROM app.fingerprint_versions WHERE status = 'building' ORDER BY version"
+        )
+        rows = cursor.fetchall()
+    building = [
+        fingerprintService.AlgoParams.from_dict(_load_json(params), version=version)
+        for version, params in rows if version != active.version
+    ]
+    return [active] + building
+
+
+def list_versions():
+    """Versiones registradas con el nº de canciones que tienen filas de cada una."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT v.version, v.status, v.params, v.created_at, v.activated_at, v.retired_at,
+                   (SELECT COUNT(DISTINCT f.song_id) FROM app.fingerprints f
+                    WHERE f.algo_version = v.version) AS songs
+            FROM app.fingerprint_versions v
+            ORDER BY v.version
+        """)
+        rows = _dictfetchall(cursor)
+    for row in rows:
+        row['params'] = _load_json(row['params'])
+    return rows
+
+
+# ── Ciclo de vida ──────────────────────────────────────────────────────
+def create_version(params=None):
+    """
+    Registra `params` (por defecto la configuración actual) como versión
+    'building'.  Si ya hay una versión activa o en construcción con los
+    mismos parámetros la retorna en lugar de duplicarla.
+    """
+    params = params or fingerprintService.AlgoParams()
+    active_version()   # garantiza que la versión 1 está registrada
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE app.fingerprint_versions IN EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT version, params FROM app.fingerprint_versions WHERE status IN ('active', 'building')"
+        )
+        for version, existing in cursor.fetchall():
+            if fingerprintService.AlgoParams.from_dict(_load_json(existing)) == params:
+                return fingerprintService.AlgoParams.from_dict(params.as_dict(), version=version)
+
+        cursor.execute("""
+            INSERT INTO app.fingerprint_versions (version, params, status)
+            SELECT COALESCE(MAX(version), 0) + 1, %s::jsonb, 'building'
+            FROM app.fingerprint_versions
+            RETURNING version
+        """, [json.dumps(params.as_dict())])
+        version = cursor.fetchone()[0]
+
+    print(f"[FingerprintVersions] Versión {version} creada: {params.as_dict()}")
+    return fingerprintService.AlgoParams.from_dict(params.as_dict(), version=version)
+
+
+def _status(cursor, version, lock=False):
+    cursor.execute(
+        "SELECT status FROM app.fingerprint_versions WHERE version = %s" + (" FOR UPDATE" if lock else ""),
+        [version],
+    )
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"Versión de fingerprints {version} no encontrada")
+    return row[0]
+
+
+def build_version(version, from_peaks=False):
+    """
+    Genera los fingerprints de `version` para las canciones que aún no
+    tienen filas de esa versión (regenerate_all con only_missing): se
+    puede interrumpir y volver a lanzar.  La versión activa no se toca.
+    from_peaks: si la versión solo cambia parámetros de emparejado
+    (TARGET_DELTAS...), re-empareja desde la caché de picos.
+    """
+    with connection.cursor() as cursor:
+        status = _status(cursor, version)
+    if status not in ('building', 'active'):
+        raise ValueError(f"La versión {version} está '{status}'; solo se construyen versiones 'building'")
+
+    summary = fingerprintService.regenerate_all(get_version(version), only_missing=True, from_peaks=from_peaks)
+    summary['version'] = version
+    summary['missing'] = missing_songs(version)
+    return summary
+
+
+def missing_songs(version):
+    """Canciones con fingerprints en la versión activa y ninguno en `version`."""
+    active = active_version().version
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT COUNT(*) FROM app.songs s
+            WHERE EXISTS (
+                SELECT 1 FROM app.fingerprints f
+                WHERE f.song_id = s.id AND f.algo_version = %s
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM app.fingerprints f
+                WHERE f.song_id = s.id AND f.algo_version = %s
+            )
+        """, [active, version])
+        return cursor.fetchone()[0]
+
+
+def activate(version, force=False):
+    """
+    Cambio atómico de versión activa.  Falla si alguna canción buscable
+    no tiene filas de la versión nueva (salvo force).  Recalcula
+    songs.fingerprint_count y publica el índice de la versión nueva.
+    """
+    previous = active_version().version
+    if version == previous:
+        raise ValueError(f"La versión {version} ya está activa")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT version FROM app.fingerprint_versions WHERE status = 'active' FOR UPDATE"
+        )
+        status = _status(cursor, version, lock=True)
+        if status not in ('building', 'retired'):
+            raise ValueError(f"La versión {version} está '{status}' y no se puede activar")
+        missing = missing_songs(version)
+        if missing and not force:
+            raise ValueError(
+                f"{missing} canciones no tienen fingerprints de la versión {version}; "
+                f"ejecuta build (o usa force)"
+            )
+
+        cursor.execute("""
+            UPDATE app.fingerprint_versions
+            SET status = 'retired', retired_at = NOW()
+            WHERE status = 'active'
+        """)
+        cursor.execute("""
+            UPDATE app.fingerprint_versions
+            SET status = 'active', activated_at = NOW(), retired_at = NULL
+            WHERE version = %s
+        """, [version])
+        cursor.execute("""
+            UPDATE app.songs s
+            SET fingerprint_count = (
+                SELECT COUNT(*) FROM app.fingerprints f
+                WHERE f.song_id = s.id AND f.algo_version = %s
+            )
+        """, [version])
+
+    invalidate()
+    active_version()
+    print(f"[FingerprintVersions] Versión activa: {previous} → {version}")
+
+    index = None
+    try:
+        index = fingerprintIndexService.export_if_mmap(version)
+    except Exception as e:
+        print(f"[FingerprintIndex] Error exportando índice: {e}")
+    return {'previous': previous, 'active': version, 'missing': missing, 'index': index}
+
+
+def discard(version):
+    """Abandona una versión en construcción: queda 'retired' para el GC."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        status = _status(cursor, version, lock=True)
+        if status != 'building':
+            raise ValueError(f"La versión {version} está '{status}'; solo se descartan versiones 'building'")
+        cursor.execute("""
+            UPDATE app.fingerprint_versions
+            SET status = 'retired', retired_at = NOW()
+            WHERE version = %s
+        """, [version])
+
+
+def collect_garbage(grace_seconds=FINGERPRINT_VERSION_GC_GRACE, batch=FINGERPRINT_VERSION_GC_BATCH):
+    """
+    Borra las filas de las versiones retiradas hace más de grace_seconds
+    (las sesiones de streaming abiertas antes del cambio ya terminaron).
+    Borra por lotes de canciones (índice song_id + algo_version), cada
+    lote en su propia transacción para no bloquear la tabla.
+    Retorna {version: filas borradas}.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT version FROM app.fingerprint_versions
+            WHERE status = 'retired' AND retired_at < NOW() - make_interval(secs => %s)
+            ORDER BY version
+        """, [grace_seconds])
+        versions = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT id FROM app.songs ORDER BY id")
+        song_ids = [row[0] for row in cursor.fetchall()]
+
+    deleted = {}
+    for version in versions:
+        total = 0
+        for i in range(0, len(song_ids), batch):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM app.fingerprints WHERE algo_version = %s AND song_id = ANY(%s)",
+                    [version, song_ids[i:i + batch]],
+                )
+                total += cursor.rowcount
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Otra activación pudo recuperarla mientras se borraba
+            cursor.execute("""
+                UPDATE app.fingerprint_versions SET status = 'collected'
+                WHERE version = %s AND status = 'retired'
+            """, [version])
+        deleted[version] = total
+        print(f"[FingerprintVersions] GC versión {version}: {total} filas borradas")
+    # Picos de configuraciones DSP que ya no usa ninguna versión viva
+    peakCacheService.prune(live_versions())
+    return deleted
@@ -0,0 +1,815 @@
+"""
+ingestJobsService.py - Ingesta asíncrona de canciones por jobs.
+
+POST /api/shazam/upload/ guarda el WAV en el spool local (en streaming si
+el upload es binario), inserta un job
+en app.ingest_jobs y responde 202 con el id.  Los workers
+(python manage.py run_ingest_worker) toman jobs con
+FOR UPDATE SKIP LOCKED y ejecutan las etapas en orden:
+
+  1. fingerprint → genera fingerprints (pool DSP) de cada versión viva
+                   del algoritmo (la activa y las que se están
+                   construyendo) y los guarda en el spool como .npz.
+  2. store       → crea la canción y guarda los fingerprints (COPY), en
+                   una sola transacción.  Desde aquí la canción ya es
+                   buscable.
+  3. terabox     → guarda el audio en el almacenamiento
+                   (audioStorageService: TeraBox o disco local) y su
+                   clave en terabox_path.  Con AUDIO_STORAGE_FORMAT=flac
+                   lo codifica antes a FLAC (audioCodecService).
+
+Cada etapa registra su duración en stage_timings.  Si una etapa falla el
+job queda 'failed' con stage = etapa fallida; POST .../retry/ lo vuelve
+a encolar y el worker retoma desde esa etapa reutilizando el spool (no
+se vuelve a fingerprintar).  Al terminar se borran los archivos del spool.
+
+La regeneración del catálogo (POST /api/shazam/regenerate-all/) usa los
+mismos workers: encola un job 'regenerate' por canción, todos con el
+mismo batch_id, con las etapas
+
+  1. download    → copia el audio (WAV o FLAC) desde el almacenamiento
+                   al spool.  Con from_peaks se salta si la caché de
+                   picos (peakCacheService) tiene la canción.
+  2. fingerprint → como arriba, solo para la versión del lote; sin audio
+                   (from_peaks) re-empareja los picos cacheados.
+  3. replace     → reemplaza los fingerprints de esa versión.
+
+Los picos por frame calculados en 'fingerprint' viajan en el .npz del
+spool y se guardan en la caché de picos en 'store' / 'replace'.
+
+Cada job es el checkpoint de su canción: un lote interrumpido se retoma
+con los jobs que quedaron pendientes (o fallidos, con retry_batch).  Con
+varios hilos por worker (--threads, REGENERATE_CONCURRENCY) las
+descargas de unas canciones se solapan con el DSP de otras.  Los jobs de
+upload tienen prioridad sobre los de regeneración.
+
+Variables de entorno:
+  INGEST_SPOOL_DIR      directorio del spool (var/ingest); debe ser
+                        compartido entre el servidor web y los workers
+  INGEST_POLL_SECONDS   espera del worker cuando no hay jobs (2)
+  INGEST_STALE_SECONDS  un job 'running' sin latido en este tiempo se
+                        considera abandonado y se re-encola (900).  El
+                        worker late cada tercio de este tiempo mientras
+                        ejecuta el job, aunque una etapa dure horas
+  INGEST_MAX_ATTEMPTS   intentos de un job abandonado antes de marcarlo
+                        'failed' en vez de re-encolarlo (3)
+  REGENERATE_CONCURRENCY  hilos de run_batch (regenerate_all); por
+                        defecto FINGERPRINT_WORKERS + 1, para que siempre
+                        haya una descarga en curso mientras el pool
+                        fingerprinta
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from pathlib import Path
+import numpy as np
+from django.db import connection, transaction, close_old_connections
+from VibeFlow.Public.Services import audioCodecService, audioStorageService, audioStreamService, dspPoolService, fingerprintIndexService, fingerprintService, fingerprintVersionService, peakCacheService, songsService, teraboxService
+
+
+# ── Configuración ──────────────────────────────────────────────────────
+INGEST_SPOOL_DIR = os.getenv(
+    'INGEST_SPOOL_DIR',
+    str(Path(__file__).resolve().parents[3] / 'var' / 'ingest'),
+)
+INGEST_POLL_SECONDS = float(os.getenv('INGEST_POLL_SECONDS', '2'))
+INGEST_STALE_SECONDS = int(os.getenv('INGEST_STALE_SECONDS', '900'))
+INGEST_MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', '3'))
+INGEST_HEARTBEAT_SECONDS = max(1, INGEST_STALE_SECONDS / 3)
+REGENERATE_CONCURRENCY = int(os.getenv('REGENERATE_CONCURRENCY', '0')) or dspPoolService.FINGERPRINT_WORKERS + 1
+
+# Etapas de cada tipo de job, en orden
+PIPELINES = {
+    'upload':     ('fingerprint', 'store', 'terabox'),
+    'regenerate': ('download', 'fingerprint', 'replace'),
+}
+
+# Errores de un lote que se devuelven con su progreso
+_BATCH_ERRORS_LIMIT = 20
+
+_JOB_COLUMNS = """
+    id, kind, status, stage, song_id, batch_id, payload, audio_path, fingerprints_path,
+    fingerprint_count, stage_timings, attempts, error, worker,
+    heartbeat_at, created_at, updated_at, finished_at
+"""
+
+
+def _dictfetchone(cursor):
+    columns = [col[0] for col in cursor.description]
+    row = cursor.fetchone()
+    return dict(zip(columns, row)) if row else None
+
+
+def _load_json(value):
+    """JSONB llega como dict (psycopg) o como str según el driver."""
+    return json.loads(value) if isinstance(value, str) else (value or {})
+
+
+# ── Creación y consulta ────────────────────────────────────────────────
+def create_upload_job(data, audio):
+    """
+    Guarda el WAV en el spool y encola el job de ingesta.
+    data:  title, artist, duration_seconds, file_type, file_size
+    audio: bytes del WAV o iterable de trozos (upload binario en streaming).
+    """
+    audio_path, size = _spool_audio(audio)
+
+    payload = {
+        'title':            data['title'],
+        'artist':           data.get('artist', 'Desconocido'),
+        'duration_seconds': data.get('duration_seconds'),
+        'file_type':        data.get('file_type', 'audio/wav'),
+        'file_size':        data.get('file_size') or size,
+    }
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO app.ingest_jobs
+                    (kind, status, stage, payload, audio_path, created_at, updated_at)
+                VALUES ('upload', 'queued', %s, %s::jsonb, %s, NOW(), NOW())
+                RETURNING {_JOB_COLUMNS}
+            """, [PIPELINES['upload'][0], json.dumps(payload), audio_path])
+            return _serialize(_dictfetchone(cursor))
+    except Exception:
+        os.remove(audio_path)
+        raise
+
+
+def _spool_audio(audio):
+    """
+    Escribe el WAV en el spool trozo a trozo validando la cabecera RIFF
+    sobre la marcha (sin decodificar).  Retorna (ruta, bytes escritos).
+    """
+    chunks = [audio] if isinstance(audio, (bytes, bytearray)) else audio
+    os.makedirs(INGEST_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(INGEST_SPOOL_DIR, f'{uuid.uuid4().hex}.wav')
+    parser = audioStreamService.WavStreamParser(decode=False)
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                parser.feed(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        parser.finish()
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size
+
+
+def get_job(job_id):
+    """Estado de un job (sin rutas internas del spool) o None."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {_JOB_COLUMNS} FROM app.ingest_jobs WHERE id = %s", [job_id])
+        row = _dictfetchone(cursor)
+    return _serialize(row) if row else None
+
+
+def _serialize(row):
+    payload = _load_json(row['payload'])
+    stages = PIPELINES.get(row['kind'], ())
+    done = len(stages) if row['status'] == 'done' else (
+        stages.index(row['stage']) if row['stage'] in stages else 0
+    )
+    return {
+        'id':                row['id'],
+        'kind':              row['kind'],
+        'status':            row['status'],
+        'stage':             row['stage'],
+        'stages':            list(stages),
+        'progress':          round(done / len(stages), 2) if stages else None,
+        'song_id':           row['song_id'],
+        'batch_id':          str(row['batch_id']) if row['batch_id'] else None,
+        'title':             payload.get('title'),
+        'artist':            payload.get('artist'),
+        'fingerprint_count': row['fingerprint_count'],
+        'stage_timings':     _load_json(row['stage_timings']),
+        'attempts':          row['attempts'],
+        'error':             row['error'],
+        'created_at':        row['created_at'].isoformat() if row['created_at'] else None,
+        'updated_at':        row['updated_at'].isoformat() if row['updated_at'] else None,
+        'finished_at':       row['finished_at'].isoformat() if row['finished_at'] else None,
+    }
+
+
+def retry_job(job_id):
+    """Re-encola un job fallido desde la etapa que falló."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE app.ingest_jobs
+            SET status = 'queued', error = NULL, worker = NULL, attempts = 0, updated_at = NOW()
+            WHERE id = %s AND status = 'failed'
+            RETURNING {_JOB_COLUMNS}
+        """, [job_id])
+        row = _dictfetchone(cursor)
+    if row:
+        return _serialize(row)
+
+    job = get_job(job_id)
+    if not job:
+        raise LookupError(f"Job {job_id} no encontrado")
+    raise ValueError(f"Solo se pueden reintentar jobs fallidos (estado actual: {job['status']})")
+
+
+# ── Lotes de regeneración ──────────────────────────────────────────────
+def create_regenerate_batch(params=None, only_missing=False, from_peaks=False):
+    """
+    Encola un job 'regenerate' por canción para la versión `params` (por
+    defecto la activa).  only_missing salta las canciones que ya tienen
+    filas de esa versión.  from_peaks re-empareja desde la caché de picos
+    las canciones que la tienen (sin descarga ni STFT).  Las canciones con un job 'regenerate' de la
+    misma versión aún sin terminar (otro lote en curso) no se repiten.
+    Retorna el progreso del lote (batch_progress).
+    """
+    params = params or fingerprintVersionService.active_version()
+    batch_id = uuid.uuid4()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO app.ingest_jobs
+                (kind, status, stage, song_id, batch_id, payload, created_at, updated_at)
+            SELECT 'regenerate', 'queued', %s, s.id, %s,
+                   jsonb_build_object('title', s.title, 'artist', s.artist, 'algo_version', %s,
+                                      'from_peaks', %s),
+                   NOW(), NOW()
+            FROM app.songs s
+            WHERE (NOT %s OR NOT EXISTS (
+                    SELECT 1 FROM app.fingerprints f
+                    WHERE f.song_id = s.id AND f.algo_version = %s
+                  ))
+              AND NOT EXISTS (
+                    SELECT 1 FROM app.ingest_jobs j
+                    WHERE j.kind = 'regenerate' AND j.song_id = s.id
+                      AND j.status IN ('queued', 'running')
+                      AND (j.payload->>'algo_version')::int = %s
+                  )
+            ORDER BY s.id
+        """, [PIPELINES['regenerate'][0], batch_id, params.version, from_peaks,
+              only_missing, params.version, params.version])
+        queued = cursor.rowcount
+    print(f"[Ingest] Lote {batch_id}: {queued} canciones (versión {params.version})")
+    return batch_progress(batch_id) or {
+        'batch_id': str(batch_id), 'algo_version': params.version, 'total': 0,
+        'queued': 0, 'running': 0, 'done': 0, 'failed': 0, 'stages': {},
+        'progress': 1.0, 'finished': True, 'errors': [],
+    }
+
+
+def batch_progress(batch_id):
+    """
+    Progreso agregado de un lote o None si no existe:
+    {batch_id, algo_version, total, queued, running, done, failed,
+     stages: {etapa: jobs ejecutándola}, progress, finished, errors}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT status, stage, COUNT(*), MIN((payload->>'algo_version')::int)
+            FROM app.ingest_jobs
+            WHERE batch_id = %s
+            GROUP BY status, stage
+        """, [batch_id])
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        cursor.execute("""
+            SELECT song_id, payload->>'title', stage, error
+            FROM app.ingest_jobs
+            WHERE batch_id = %s AND status = 'failed'
+            ORDER BY id
+            LIMIT %s
+        """, [batch_id, _BATCH_ERRORS_LIMIT])
+        errors = [
+            {'song_id': sid, 'title': title, 'stage': stage, 'error': error}
+            for sid, title, stage, error in cursor.fetchall()
+        ]
+
+    counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+    stages = {}
+    for status, stage, count, _version in rows:
+        counts[status] = counts.get(status, 0) + count
+        if status == 'running':
+            stages[stage] = stages.get(stage, 0) + count
+    total = sum(counts.values())
+    finished = counts['done'] + counts['failed']
+    return {
+        'batch_id':     str(batch_id),
+        'algo_version': rows[0][3],
+        'total':        total,
+        **counts,
+        'stages':       stages,
+        'progress':     round(finished / total, 4),
+        'finished':     finished == total,
+        'errors':       errors,
+    }
+
+
+def batch_results(batch_id):
+    """Resultado por canción de un lote: [{id, title, fingerprints, status}]."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT song_id, payload->>'title', fingerprint_count, status, error
+            FROM app.ingest_jobs
+            WHERE batch_id = %s
+            ORDER BY song_id
+        """, [batch_id])
+        return [
+            {
+                'id':           sid,
+                'title':        title,
+                'fingerprints': count or 0,
+                'status':       'ok' if status == 'done' else (f'error: {error}' if error else status),
+            }
+            for sid, title, count, status, error in cursor.fetchall()
+        ]
+
+
+def retry_batch(batch_id):
+    """Re-encola los jobs fallidos del lote (cada uno desde su etapa)."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE app.ingest_jobs
+            SET status = 'queued', error = NULL, worker = NULL, attempts = 0, updated_at = NOW()
+            WHERE batch_id = %s AND status = 'failed'
+        """, [batch_id])
+        retried = cursor.rowcount
+    progress = batch_progress(batch_id)
+    if not progress:
+        raise LookupError(f"Lote {batch_id} no encontrado")
+    if not retried:
+        raise ValueError("El lote no tiene jobs fallidos")
+    return progress
+
+
+def run_batch(batch_id, concurrency=None, poll_seconds=INGEST_POLL_SECONDS):
+    """
+    Procesa los jobs de un lote en este proceso con `concurrency` hilos
+    (REGENERATE_CONCURRENCY) y espera a que terminen también los que
+    hayan tomado otros workers.  Retorna batch_progress.
+    """
+    concurrency = max(1, concurrency or REGENERATE_CONCURRENCY)
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    threads = [
+        threading.Thread(
+            target=_work_loop, args=(f'{worker_id}:{i}', True, poll_seconds, batch_id),
+            name=f'regenerate-{i}', daemon=True,
+        )
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    while True:
+        progress = batch_progress(batch_id)
+        if not progress or progress['finished']:
+            return progress
+        time.sleep(poll_seconds)
+
+
+# ── Worker ─────────────────────────────────────────────────────────────
+def claim_next_job(worker_id, batch_id=None):
+    """
+    Toma el job en cola más antiguo (SKIP LOCKED: varios workers no se
+    pisan); los uploads van antes que los jobs de regeneración.  Con
+    batch_id solo toma jobs de ese lote.  Antes re-encola los jobs
+    'running' sin latido reciente, salvo los que ya llevan
+    INGEST_MAX_ATTEMPTS intentos (p. ej. una canción que tumba al worker
+    cada vez): esos quedan 'failed'.  Retorna el id o None.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE app.ingest_jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= %s
+                        THEN 'Worker sin latido en ' || attempts || ' intentos'
+                        ELSE error END,
+                worker = NULL, updated_at = NOW()
+            WHERE status = 'running'
+              AND heartbeat_at < NOW() - make_interval(secs => %s)
+        """, [INGEST_MAX_ATTEMPTS, INGEST_MAX_ATTEMPTS, INGEST_STALE_SECONDS])
+        cursor.execute("""
+            UPDATE app.ingest_jobs
+            SET status = 'running', worker = %s, attempts = attempts + 1,
+                heartbeat_at = NOW(), updated_at = NOW()
+            WHERE id = (
+                SELECT id FROM app.ingest_jobs
+                WHERE status = 'queued'
+                  AND (%s::uuid IS NULL OR batch_id = %s::uuid)
+                ORDER BY kind = 'regenerate', id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id
+        """, [worker_id, batch_id, batch_id])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class _JobLost(RuntimeError):
+    """El job ya no es de este worker (re-encolado por falta de latido)."""
+
+
+class _Heartbeat:
+    """
+    Latido de un job en un hilo aparte mientras run_job lo ejecuta: una
+    etapa larga (subida a TeraBox con reintentos, WAV de horas) no deja
+    de latir.  Si el job dejó de ser de este worker (el barrido de
+    claim_next_job lo re-encoló o lo marcó 'failed') check() lanza
+    _JobLost antes de la siguiente etapa.
+    """
+
+    def __init__(self, job):
+        self.job_id = job['id']
+        self.worker = job['worker']
+        self._lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'heartbeat-{self.job_id}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(INGEST_HEARTBEAT_SECONDS):
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute("""
+                            UPDATE app.ingest_jobs SET heartbeat_at = NOW()
+                            WHERE id = %s AND worker = %s AND status = 'running'
+                        """, [self.job_id, self.worker])
+                        if cursor.rowcount == 0:
+                            self._lost.set()
+                            return
+                except Exception as e:
+                    print(f"[Ingest] Job {self.job_id}: error en el latido: {e}")
+        finally:
+            connection.close()
+
+    def check(self):
+        if self._lost.is_set():
+            raise _JobLost(f"el job {self.job_id} ya no es de {self.worker}")
+
+
+def run_job(job_id):
+    """Ejecuta las etapas pendientes de un job ya reclamado."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {_JOB_COLUMNS} FROM app.ingest_jobs WHERE id = %s", [job_id])
+        job = _dictfetchone(cursor)
+    job['payload'] = _load_json(job['payload'])
+    timings = _load_json(job['stage_timings'])
+
+    stages = PIPELINES[job['kind']]
+    pending = stages[stages.index(job['stage']):] if job['stage'] in stages else ()
+
+    try:
+        with _Heartbeat(job) as heartbeat:
+            for stage in pending:
+                heartbeat.check()
+                t0 = time.perf_counter()
+                try:
+                    changes = _STAGES[stage](job) or {}
+                except _JobLost:
+                    raise
+                except Exception as e:
+                    print(f"[Ingest] Job {job_id} falló en '{stage}': {e}")
+                    timings[stage] = round(time.perf_counter() - t0, 3)
+                    _update(job, status='failed', error=f'{type(e).__name__}: {e}', stage_timings=timings)
+                    return False
+
+                timings[stage] = round(time.perf_counter() - t0, 3)
+                job.update(changes)
+                next_stage = stages[stages.index(stage) + 1] if stage != stages[-1] else 'done'
+                _update(job, stage=next_stage, stage_timings=timings, **changes)
+
+            _update(job, status='done', stage='done', finished=True)
+    except _JobLost as e:
+        # Otro worker lo retomó: no se toca el job ni su spool
+        print(f"[Ingest] Job {job_id} abandonado: {e}")
+        return False
+    _cleanup_spool(job)
+    print(f"[Ingest] Job {job_id} completado: {timings}")
+    if job['batch_id']:
+        _finish_batch(job)
+    return True
+
+
+def _finish_batch(job):
+    """
+    Si ya no quedan jobs pendientes en el lote, publica el índice mmap
+    reconstruido (si la versión del lote es la activa).  Dos workers que
+    terminan a la vez pueden exportarlo los dos: es idempotente.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM app.ingest_jobs
+                WHERE batch_id = %s AND status IN ('queued', 'running')
+            )
+        """, [job['batch_id']])
+        if cursor.fetchone()[0]:
+            return
+    version = job['payload'].get('algo_version')
+    print(f"[Ingest] Lote {job['batch_id']} terminado")
+    try:
+        if version == fingerprintVersionService.active_version().version:
+            fingerprintIndexService.export_if_mmap(version)
+    except Exception as e:
+        print(f"[FingerprintIndex] Error exportando índice: {e}")
+
+
+def _update(job, finished=False, **fields):
+    """
+    UPDATE del job + latido, solo si sigue siendo del worker que lo
+    reclamó (si no, _JobLost: dentro de una transacción la deshace).
+    """
+    sets, params = [], []
+    for col, value in fields.items():
+        if col == 'stage_timings':
+            sets.append("stage_timings = %s::jsonb")
+            params.append(json.dumps(value))
+        else:
+            sets.append(f"{col} = %s")
+            params.append(value)
+    if finished:
+        sets.append("finished_at = NOW()")
+    sets.append("heartbeat_at = NOW()")
+    sets.append("updated_at = NOW()")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE app.ingest_jobs SET {', '.join(sets)} WHERE id = %s AND worker = %s",
+            params + [job['id'], job['worker']],
+        )
+        if cursor.rowcount == 0:
+            raise _JobLost(f"el job {job['id']} ya no es de {job['worker']}")
+
+
+def _cleanup_spool(job):
+    for path in (job.get('audio_path'), job.get('fingerprints_path')):
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# ── Etapas ─────────────────────────────────────────────────────────────
+# Cada etapa recibe el job (dict) y retorna las columnas a actualizar.
+def _job_versions(job):
+    """
+    Versiones a fingerprintar: la del lote (regeneración) o todas las
+    vivas (la activa y las que se están construyendo).
+    """
+    version = job['payload'].get('algo_version')
+    if version:
+        return [fingerprintVersionService.get_version(version)]
+    return fingerprintVersionService.live_versions()
+
+
+def _stage_download(job):
+    if job['song_id'] is None:
+        raise ValueError("La canción fue eliminada")
+    if job['payload'].get('from_peaks') and peakCacheService.exists(job['song_id'], _job_versions(job)[0]):
+        # 'fingerprint' re-empareja los picos cacheados
+        return {}
+    if job['batch_id']:
+        _prefetch_dlinks(job['batch_id'])
+    return _download_audio(job)
+
+
+def _download_audio(job):
+    key = fingerprintService.song_storage_key(job['song_id'])
+    os.makedirs(INGEST_SPOOL_DIR, exist_ok=True)
+    ext = os.path.splitext(key)[1] or '.wav'
+    audio_path = os.path.join(INGEST_SPOOL_DIR, f'{uuid.uuid4().hex}{ext}')
+    try:
+        audioStorageService.fetch_to_file(key, audio_path)
+    except BaseException:
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+        raise
+    return {'audio_path': audio_path}
+
+
+def _prefetch_dlinks(batch_id):
+    """
+    Prepara en bloque las lecturas de los próximos jobs del lote (en
+    TeraBox: una llamada a filemetas cada FILEMETAS_BATCH canciones en
+    lugar de una por descarga; los dlinks ya cacheados no vuelven a la
+    red).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT s.terabox_path
+            FROM app.ingest_jobs j
+            JOIN app.songs s ON s.id = j.song_id
+            WHERE j.batch_id = %s AND j.stage = 'download'
+              AND j.status IN ('queued', 'running')
+              AND s.terabox_path IS NOT NULL
+            ORDER BY j.id
+            LIMIT %s
+        """, [batch_id, teraboxService.FILEMETAS_BATCH])
+        paths = [row[0] for row in cursor.fetchall()]
+    try:
+        audioStorageService.prefetch(paths)
+    except Exception as e:
+        # La descarga resolverá su dlink por separado
+        print(f"[Ingest] No se pudieron resolver dlinks en bloque: {e}")
+
+
+def _stage_fingerprint(job):
+    # Por bloques desde el spool: memoria fija aunque el audio dure horas.
+    # Uploads: una pasada por versión viva (la activa y las que se están
+    # construyendo), en paralelo en el pool.  Regeneración: solo la
+    # versión del lote.
+    versions = _job_versions(job)
+    changes = {}
+    if job['audio_path'] is None:
+        # 'download' saltada (from_peaks)
+        peaks = peakCacheService.load(job['song_id'], versions[0])
+        if peaks is not None:
+            fps = fingerprintService.fingerprints_from_peaks(peaks, versions[0])
+            return _spool_fingerprints(os.path.join(INGEST_SPOOL_DIR, uuid.uuid4().hex), [fps])
+        # La caché se borró entre etapas: análisis completo
+        changes = _download_audio(job)
+        job.update(changes)
+
+    # Picos para la caché: una vez por configuración DSP
+    digests = set()
+    futures = []
+    for params in versions:
+        keep = peakCacheService.is_enabled() and params.peak_digest() not in digests
+        digests.add(params.peak_digest())
+        futures.append((params, dspPoolService.submit_wav_file(job['audio_path'], params, keep)))
+    results = [dspPoolService.result_arrays(future, params) for params, future in futures]
+    if not results[0]:
+        raise ValueError("No se pudieron generar fingerprints del audio. ¿El audio tiene sonido?")
+    changes.update(_spool_fingerprints(os.path.splitext(job['audio_path'])[0], results))
+    return changes
+
+
+def _spool_fingerprints(base, results):
+    """Guarda los FingerprintArrays (y sus picos) en <base>.fp.npz."""
+    path = base + '.fp.npz'
+    arrays = {}
+    for fps in results:
+        arrays[f'hashes_{fps.version}'] = fps.hashes
+        arrays[f'offsets_{fps.version}'] = fps.offsets
+        for i, peaks in enumerate(fps.peaks or ()):
+            arrays[f'peaks_{fps.version}_{i}'] = peaks
+    os.makedirs(INGEST_SPOOL_DIR, exist_ok=True)
+    np.savez(path, **arrays)
+    return {'fingerprints_path': path, 'fingerprint_count': len(results[0])}
+
+
+def _load_fingerprints(path):
+    """FingerprintArrays (con .peaks si los hay) por versión guardados por _stage_fingerprint."""
+    with np.load(path) as data:
+        if 'hashes' in data.files:
+            # Spool anterior a las versiones: se generó con la activa
+            return [fingerprintService.FingerprintArrays(data['hashes'], data['offsets'])]
+        versions = sorted(int(name.split('_', 1)[1]) for name in data.files if name.startswith('hashes_'))
+        results = []
+        for v in versions:
+            peaks = tuple(data[name] for name in sorted(
+                (name for name in data.files if name.startswith(f'peaks_{v}_')),
+                key=lambda name: int(name.rsplit('_', 1)[1]),
+            ))
+            results.append(fingerprintService.FingerprintArrays(
+                data[f'hashes_{v}'], data[f'offsets_{v}'], v, peaks or None,
+            ))
+        return results
+
+
+def _cache_peaks(song_id, results):
+    """Guarda en la caché de picos los que trae el spool (no falla el job)."""
+    for fps in results:
+        if fps.peaks is None or fps.version is None:
+            continue
+        try:
+            peakCacheService.save(song_id, fingerprintVersionService.get_version(fps.version), fps.peaks)
+        except Exception as e:
+            print(f"[PeakCache] No se pudieron guardar los picos de {song_id}: {e}")
+
+
+def _stage_store(job):
+    results = _load_fingerprints(job['fingerprints_path'])
+    active = fingerprintVersionService.active_version().version
+
+    with transaction.atomic():
+        song_id = job['song_id']
+        if song_id is None:
+            song_id = songsService.create_song(job['payload'])['id']
+        else:
+            # Reintento: la canción ya existe, reemplazar sus fingerprints
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM app.fingerprints WHERE song_id = %s", [song_id])
+        count = 0
+        for fps in results:
+            stored = fingerprintService.store_fingerprints(song_id, fps)
+            if fps.version in (None, active):
+                count = stored
+        # En la misma transacción: si el worker muere justo después, el
+        # reintento ya conoce la canción y no crea un duplicado; si el
+        # job ya es de otro worker, se deshace la canción creada.
+        _update(job, song_id=song_id)
+    _cache_peaks(song_id, results)
+    return {'song_id': song_id, 'fingerprint_count': count}
+
+
+def _stage_replace(job):
+    if job['song_id'] is None:
+        raise ValueError("La canción fue eliminada")
+    count = 0
+    results = _load_fingerprints(job['fingerprints_path'])
+    for fps in results:
+        count = fingerprintService.replace_fingerprints(job['song_id'], fps)
+    _cache_peaks(job['song_id'], results)
+    return {'fingerprint_count': count}
+
+
+def _stage_terabox(job):
+    # Nombre histórico: guarda en el backend configurado (AUDIO_STORAGE_BACKEND)
+    if not audioCodecService.compress():
+        key = audioStorageService.put_song_file(job['song_id'], job['payload']['title'], job['audio_path'])
+        songsService.update_terabox_path(job['song_id'], key)
+        return {}
+
+    # FLAC: se codifica aquí, en el worker (un reintento lo vuelve a
+    # codificar desde el WAV del spool)
+    flac_path = os.path.splitext(job['audio_path'])[0] + '.flac'
+    try:
+        size = audioCodecService.encode_flac_file(job['audio_path'], flac_path)
+        key = audioStorageService.put_song_file(job['song_id'], job['payload']['title'], flac_path, '.flac')
+    finally:
+        if os.path.exists(flac_path):
+            os.remove(flac_path)
+    songsService.update_terabox_path(job['song_id'], key, 'audio/flac', size)
+    return {}
+
+
+_STAGES = {
+    'download':    _stage_download,
+    'fingerprint': _stage_fingerprint,
+    'store':       _stage_store,
+    'replace':     _stage_replace,
+    'terabox':     _stage_terabox,
+}
+
+
+def run_worker(once=False, poll_seconds=INGEST_POLL_SECONDS, worker_id=None, threads=1):
+    """
+    Bucle del worker: reclama y ejecuta jobs hasta que se interrumpa.
+    once=True procesa los jobs en cola y termina.  threads > 1 ejecuta
+    varios jobs a la vez (las descargas/subidas de unos se solapan con
+    el DSP de otros).  Retorna los jobs procesados.
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    print(f"[Ingest] Worker {worker_id} iniciado ({threads} hilos)")
+    if threads <= 1:
+        return _work_loop(worker_id, once, poll_seconds)
+
+    processed = []
+    pool = [
+        threading.Thread(
+            target=lambda wid: processed.append(_work_loop(wid, once, poll_seconds)),
+            args=(f'{worker_id}:{i}',), name=f'ingest-{i}', daemon=True,
+        )
+        for i in range(threads)
+    ]
+    for t in pool:
+        t.start()
+    # join con timeout: el hilo principal sigue recibiendo Ctrl+C
+    while any(t.is_alive() for t in pool):
+        for t in pool:
+            t.join(timeout=1)
+    return sum(processed)
+
+
+def _work_loop(worker_id, once, poll_seconds, batch_id=None):
+    """Reclama y ejecuta jobs (del lote batch_id, si se indica)."""
+    processed = 0
+    try:
+        while True:
+            close_old_connections()
+            job_id = claim_next_job(worker_id, batch_id)
+            if job_id is None:
+                if once:
+                    return processed
+                time.sleep(poll_seconds)
+                continue
+            run_job(job_id)
+            processed += 1
+    finally:
+        # Cada hilo tiene su propia conexión
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
@@ -0,0 +1,117 @@
+"""
+peakCacheService.py - Caché en disco de los picos por frame de cada canción.
+
+Los hashes salen de dos pasos: picos del espectrograma por frame
+(_segment_peaks: remuestreo + STFT + picos, lo caro) y emparejado de
+esos picos (_pair_peaks: milisegundos).  Cambiar solo parámetros del
+emparejado (TARGET_DELTAS, TOPN_FAN_OUT, TOPN_ZONE) obligaba a volver a
+descargar y analizar todo el catálogo.  Al fingerprintar una canción se
+guardan sus picos aquí; la regeneración con from_peaks los reutiliza y
+solo vuelve a emparejar.
+
+Estructura:
+
+  PEAK_CACHE_DIR/<digest DSP>/<song_id>.npz
+
+El digest (AlgoParams.peak_digest) cubre todo lo que influye en los
+picos (modo, remuestreo, cuantización, parámetros 'topn', tamaños de la
+STFT y el formato de este archivo): cualquier cambio de DSP apunta a otro
+directorio y la caché vieja deja de usarse sola.  prune() borra los
+directorios que ya no usa ninguna versión viva.  Escrituras atómicas
+(temporal + os.replace), compartible entre servidor web y workers.
+
+Variables de entorno:
+  PEAK_CACHE       1 activa la caché, 0 la desactiva (1)
+  PEAK_CACHE_DIR   directorio (var/peak-cache)
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# ── Configuración ──────────────────────────────────────────────────────
+PEAK_CACHE = os.getenv('PEAK_CACHE', '1') != '0'
+PEAK_CACHE_DIR = os.getenv(
+    'PEAK_CACHE_DIR',
+    str(Path(__file__).resolve().parents[3] / 'var' / 'peak-cache'),
+)
+
+
+def is_enabled():
+    return PEAK_CACHE
+
+
+def _path(song_id, params):
+    return os.path.join(PEAK_CACHE_DIR, params.peak_digest(), f'{int(song_id)}.npz')
+
+
+def save(song_id, params, peaks):
+    """
+    Guarda los picos (tupla de arrays de _segment_peaks, de toda la
+    canción) calculados con `params`.  Bins y distancias caben en int16.
+    """
+    if not PEAK_CACHE or peaks is None:
+        return
+    path = _path(song_id, params)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **{f'peaks_{i}': np.asarray(p, dtype=np.int16) for i, p in enumerate(peaks)})
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def load(song_id, params):
+    """Picos de `song_id` para la configuración DSP de `params` (int64) o None."""
+    if not PEAK_CACHE:
+        return None
+    try:
+        with np.load(_path(song_id, params)) as data:
+            count = len(data.files)
+            return tuple(data[f'peaks_{i}'].astype(np.int64) for i in range(count))
+    except (FileNotFoundError, ValueError, OSError):
+        # Ausente o ilegible (p. ej. disco lleno al escribirla): se recalcula
+        return None
+
+
+def exists(song_id, params):
+    return PEAK_CACHE and os.path.exists(_path(song_id, params))
+
+
+def invalidate(song_id):
+    """Borra los picos de una canción en todas las configuraciones."""
+    if not os.path.isdir(PEAK_CACHE_DIR):
+        return
+    for entry in os.scandir(PEAK_CACHE_DIR):
+        if entry.is_dir():
+            try:
+                os.remove(os.path.join(entry.path, f'{int(song_id)}.npz'))
+            except FileNotFoundError:
+                pass
+
+
+def prune(live_params):
+    """
+    Borra los directorios de configuraciones DSP que no usa ninguna de
+    `live_params` (las versiones vivas).  Retorna cuántos borró.
+    """
+    if not os.path.isdir(PEAK_CACHE_DIR):
+        return 0
+    keep = {params.peak_digest() for params in live_params}
+    removed = 0
+    for entry in os.scandir(PEAK_CACHE_DIR):
+        if entry.is_dir() and entry.name not in keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    if removed:
+        print(f"[PeakCache] {removed} configuraciones DSP obsoletas borradas")
+    return removed
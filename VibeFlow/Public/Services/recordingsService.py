@@ -1,10 +1,16 @@
 """
 recordingsService.py - Capa de servicio para grabaciones de audio.
 Consultas SQL directas usando django.db.connection.
+
+Con AUDIO_STORAGE_FORMAT=flac las grabaciones WAV se guardan en FLAC
+(audioCodecService); las ya comprimidas (webm/ogg/mp4) se guardan tal cual.
 """
 
 import base64
 from django.db import connection
+from VibeFlow.Public.Services import audioCodecService
+
+_WAV_TYPES = ('audio/wav', 'audio/x-wav', 'audio/wave')
 
 
 def _dictfetchall(cursor):
@@ -100,8 +106,13 @@ def create_recording(data):
     data: user_id, name, duration_seconds, sample_rate, audio_base64, file_type, file_size
     """
     audio_bytes = None
+    file_type = data.get('file_type', 'audio/webm')
+    file_size = data.get('file_size')
     if data.get('audio_base64'):
         audio_bytes = base64.b64decode(data['audio_base64'])
+        if audioCodecService.compress() and file_type in _WAV_TYPES and audio_bytes[:4] == b'RIFF':
+            audio_bytes = audioCodecService.encode_flac(audio_bytes)
+            file_type, file_size = 'audio/flac', len(audio_bytes)
 
     with connection.cursor() as cursor:
         cursor.execute("""
@@ -115,8 +126,8 @@ def create_recording(data):
             data.get('duration_seconds'),
             data.get('sample_rate', 44100),
             audio_bytes,
-            data.get('file_type', 'audio/webm'),
-            data.get('file_size'),
+            file_type,
+            file_size,
         ])
         row = cursor.fetchone()
         return {"id": row[0], "message": "Grabación guardada exitosamente"}
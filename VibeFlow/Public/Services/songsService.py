@@ -1,14 +1,17 @@
 """
 songsService.py - Capa de servicio para canciones del Shazam MVP.
-CRUD + integración con TeraBox para almacenamiento de audio.
+CRUD + integración con el almacenamiento de audio (audioStorageService:
+TeraBox o disco local).
 
 El audio binario ya NO se guarda en la BD.
-Se sube a TeraBox y se almacena solo la ruta remota (terabox_path).
+Se guarda en el backend de almacenamiento y en la BD solo su clave
+(columna terabox_path: ruta remota de TeraBox o "local://...").
 Los fingerprints (hashes) sí permanecen en Postgres.
 """
 
 from django.db import connection
-from VibeFlow.Public.Services import teraboxService
+from VibeFlow.Public.Services import audioStorageService, peakCacheService
+from VibeFlow.Public.Services import fingerprintIndexService
 
 
 def _dictfetchall(cursor):
@@ -78,18 +81,24 @@ def create_song(data, terabox_path=None):
         return {"id": row[0], "message": "Canción creada exitosamente"}
 
 
-def update_terabox_path(song_id, terabox_path):
-    """Actualiza la ruta de TeraBox de una canción."""
+def update_terabox_path(song_id, terabox_path, file_type=None, file_size=None):
+    """
+    Actualiza la clave de almacenamiento de una canción.  file_type /
+    file_size solo si el audio guardado cambió de formato (p. ej. FLAC).
+    """
     with connection.cursor() as cursor:
         cursor.execute("""
             UPDATE app.songs
-            SET terabox_path = %s, updated_at = NOW()
+            SET terabox_path = %s,
+                file_type = COALESCE(%s, file_type),
+                file_size = COALESCE(%s, file_size),
+                updated_at = NOW()
             WHERE id = %s
-        """, [terabox_path, song_id])
+        """, [terabox_path, file_type, file_size, song_id])
 
 
 def delete_song(song_id):
-    """Elimina una canción, sus fingerprints y su audio de TeraBox."""
+    """Elimina una canción, sus fingerprints y su audio almacenado."""
     # Obtener terabox_path antes de borrar
     with connection.cursor() as cursor:
         cursor.execute(
@@ -100,16 +109,18 @@ def delete_song(song_id):
             raise ValueError("Canción no encontrada")
         terabox_path = row[0]
 
-    # Eliminar de TeraBox (si tiene audio)
+    # Eliminar el audio (si tiene)
     if terabox_path:
         try:
-            teraboxService.delete_song(terabox_path)
+            audioStorageService.delete(terabox_path)
         except Exception as e:
-            print(f"[TeraBox] Error eliminando {terabox_path}: {e}")
+            print(f"[Storage] Error eliminando {terabox_path}: {e}")
+    peakCacheService.invalidate(song_id)
 
     # Eliminar de BD (CASCADE borra fingerprints)
     with connection.cursor() as cursor:
         cursor.execute("DELETE FROM app.songs WHERE id = %s", [song_id])
+    fingerprintIndexService.remove_song(song_id)
     return True
 
 
@@ -125,12 +136,13 @@ def update_song(song_id, data):
         row = cursor.fetchone()
         if not row:
             raise ValueError("Canción no encontrada")
-        return {"id": row[0], "message": "Canción actualizada"}
+    fingerprintIndexService.update_song_info(song_id, data['title'], data.get('artist', 'Desconocido'))
+    return {"id": row[0], "message": "Canción actualizada"}
 
 
 def get_song_audio(song_id):
     """
-    Obtiene los datos de audio descargándolos de TeraBox.
+    Obtiene los datos de audio desde su almacenamiento.
     Retorna dict con audio_data (bytes), file_type, title, artist.
     """
     with connection.cursor() as cursor:
@@ -143,8 +155,7 @@ def get_song_audio(song_id):
     if not row or not row.get('terabox_path'):
         return None
 
-    # Descargar de TeraBox
-    audio_bytes = teraboxService.download_song(row['terabox_path'])
+    audio_bytes = audioStorageService.get(row['terabox_path'])
     return {
         'audio_data': audio_bytes,
         'file_type':  row['file_type'],
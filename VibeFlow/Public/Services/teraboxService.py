@@ -14,21 +14,91 @@ Cómo obtener la cookie ndus:
     2. Abre DevTools → Application → Cookies → www.terabox.com
     3. Busca la cookie llamada "ndus" y copia su valor.
     4. Pégalo en tu .env como TERABOX_NDUS=...
+
+Las descargas pasan por la caché en disco de audioCacheService: la misma
+ruta remota solo se baja de la red una vez (mientras siga en la caché).
+
+Los dlinks (URL de descarga directa) resueltos con /api/filemetas se
+cachean por ruta remota durante TERABOX_DLINK_TTL segundos; las rutas
+que no existen, TERABOX_DLINK_NEGATIVE_TTL.  Un 403/410 al descargar
+invalida el dlink y se resuelve de nuevo una vez.  resolve_download_urls
+resuelve muchas rutas en una sola llamada (lotes de regeneración).
+
+Las subidas se parten en bloques de TERABOX_UPLOAD_BLOCK_BYTES con un
+MD5 por bloque (block_list del precreate/create) y los bloques se suben
+en paralelo (TERABOX_UPLOAD_CONCURRENCY).  El uploadid y los bloques ya
+subidos se guardan en TERABOX_UPLOAD_STATE_DIR: si la subida se corta,
+el siguiente intento del mismo archivo sube solo los bloques que faltan.
+
+Todas las llamadas pasan por TeraBoxClient._request: un solo Session
+con pool de TERABOX_POOL_SIZE conexiones compartido por los hilos de
+Django/Channels y los workers, un semáforo global que limita las
+operaciones en curso a TERABOX_MAX_INFLIGHT, reintentos con backoff
+exponencial (TERABOX_RETRIES, TERABOX_BACKOFF) para las llamadas
+idempotentes ante errores de red, 429 y 5xx, y renovación del jsToken
+(bajo lock, una sola vez aunque la pidan varios hilos) cuando la API lo
+rechaza.
+
+Variables de entorno opcionales:
+    TERABOX_API=https://www.terabox.com  (p. ej. Scripts/fake_terabox.py)
+    TERABOX_POOL_SIZE=16            conexiones HTTP reutilizables
+    TERABOX_MAX_INFLIGHT=8          operaciones simultáneas (todo el proceso)
+    TERABOX_RETRIES=3               reintentos de las llamadas idempotentes
+    TERABOX_BACKOFF=0.5             espera base (s) antes del 1er reintento
+    TERABOX_DLINK_TTL=600           segundos que se reutiliza un dlink
+    TERABOX_DLINK_NEGATIVE_TTL=60   segundos que se recuerda "no existe"
+    TERABOX_UPLOAD_BLOCK_BYTES=4194304
+    TERABOX_UPLOAD_CONCURRENCY=4
+    TERABOX_UPLOAD_STATE_DIR=var/terabox-uploads
 """
 
 import os
 import re
 import json
+import time
+import random
 import hashlib
+import tempfile
+import threading
 import requests
-from pathlib import PurePosixPath
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from VibeFlow.Public.Services import audioCacheService
 
 # ── Configuración ──────────────────────────────────────────────────────
-TERABOX_API    = 'https://www.terabox.com'
+TERABOX_API    = os.getenv('TERABOX_API', 'https://www.terabox.com').rstrip('/')
 TERABOX_NDUS   = os.getenv('TERABOX_NDUS', '')
 TERABOX_FOLDER = os.getenv('TERABOX_FOLDER', '/VibeFlow/songs')
 APP_ID         = '250528'
 
+TERABOX_DLINK_TTL          = int(os.getenv('TERABOX_DLINK_TTL', '600'))
+TERABOX_DLINK_NEGATIVE_TTL = int(os.getenv('TERABOX_DLINK_NEGATIVE_TTL', '60'))
+
+TERABOX_UPLOAD_BLOCK_BYTES = int(os.getenv('TERABOX_UPLOAD_BLOCK_BYTES', str(4 * 1024 * 1024)))
+TERABOX_UPLOAD_CONCURRENCY = int(os.getenv('TERABOX_UPLOAD_CONCURRENCY', '4'))
+TERABOX_UPLOAD_STATE_DIR   = os.getenv(
+    'TERABOX_UPLOAD_STATE_DIR',
+    str(Path(__file__).resolve().parents[3] / 'var' / 'terabox-uploads'),
+)
+
+TERABOX_POOL_SIZE    = int(os.getenv('TERABOX_POOL_SIZE', '16'))
+TERABOX_MAX_INFLIGHT = int(os.getenv('TERABOX_MAX_INFLIGHT', '8'))
+TERABOX_RETRIES      = int(os.getenv('TERABOX_RETRIES', '3'))
+TERABOX_BACKOFF      = float(os.getenv('TERABOX_BACKOFF', '0.5'))
+
+# Respuestas transitorias que vale la pena reintentar
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# errno con los que la API rechaza la sesión / un jsToken caducado
+_TOKEN_ERRNOS = (-6, 4000020)
+
+# Rutas por llamada a /api/filemetas al resolver en bloque
+FILEMETAS_BATCH = 100
+
+# Respuestas del dlink que indican que caducó (se vuelve a resolver)
+_DLINK_EXPIRED = (403, 410)
+
 _USER_AGENT = (
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
     'AppleWebKit/537.36 (KHTML, like Gecko) '
@@ -36,11 +106,66 @@ _USER_AGENT = (
 )
 
 
+class _DlinkCache:
+    """dlinks por ruta remota con caducidad ('' = la ruta no existe)."""
+
+    def __init__(self, ttl, negative_ttl):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._entries = {}      # ruta → (expira, dlink)
+
+    def get(self, remote_path):
+        """dlink cacheado, '' si se sabe que no existe, o None si hay que resolverlo."""
+        with self._lock:
+            entry = self._entries.get(remote_path)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[remote_path]
+                return None
+            return entry[1]
+
+    def put(self, remote_path, dlink):
+        ttl = self.ttl if dlink else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[remote_path] = (time.monotonic() + ttl, dlink)
+            if len(self._entries) > 10000:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+
+    def invalidate(self, remote_path):
+        with self._lock:
+            self._entries.pop(remote_path, None)
+
+
+# Operaciones en curso contra TeraBox en todo el proceso (todos los
+# hilos y clientes).  En descargas con stream=True cubre hasta recibir
+# las cabeceras: el cuerpo lo consume el llamador a su ritmo.
+_inflight = threading.BoundedSemaphore(TERABOX_MAX_INFLIGHT)
+
+
+def _token_rejected(resp):
+    """¿La API respondió que el jsToken/sesión no es válido?"""
+    if 'json' not in resp.headers.get('Content-Type', ''):
+        return False
+    try:
+        data = resp.json()
+    except ValueError:
+        return False
+    return isinstance(data, dict) and data.get('errno') in _TOKEN_ERRNOS
+
+
 class TeraBoxClient:
-    """Cliente para la API de TeraBox."""
+    """Cliente para la API de TeraBox (thread-safe)."""
 
     def __init__(self):
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=TERABOX_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'User-Agent': _USER_AGENT,
             'Accept': 'application/json',
@@ -48,29 +173,94 @@ class TeraBoxClient:
         self.session.cookies.set('ndus', TERABOX_NDUS, domain='.terabox.com')
         self._jstoken  = None
         self._bdstoken = None
+        self._token_lock = threading.Lock()
+        self._dlinks   = _DlinkCache(TERABOX_DLINK_TTL, TERABOX_DLINK_NEGATIVE_TTL)
+
+    # ── HTTP ───────────────────────────────────────────────────────────
+    def _request(self, method, url, idempotent=True, api_params=None, **kwargs):
+        """
+        Petición HTTP con el límite global de operaciones en curso.
+
+        - idempotent: reintenta con backoff exponencial (+ jitter) ante
+          errores de red, 429 y 5xx.  Las no idempotentes (precreate,
+          create, delete) solo se reintentan si la conexión ni se llegó a
+          abrir (ConnectTimeout).
+        - api_params: llamada a la API con jsToken; los params se arman en
+          cada intento y, si la API rechaza el token, se renueva una vez
+          y se repite la llamada.
+        """
+        renewed = False
+        attempt = 0
+        while True:
+            token = None
+            if api_params is not None:
+                token = self._ensure_tokens()
+                kwargs['params'] = self._api_params(api_params)
+            retry_after = None
+            try:
+                with _inflight:
+                    resp = self.session.request(method, url, **kwargs)
+                    if not kwargs.get('stream'):
+                        resp.content    # leer el cuerpo dentro del límite
+            except requests.RequestException as e:
+                retryable = isinstance(e, requests.ConnectTimeout) or (
+                    idempotent and isinstance(e, (requests.ConnectionError, requests.Timeout))
+                )
+                if not retryable or attempt >= TERABOX_RETRIES:
+                    raise
+                error = f'{type(e).__name__}: {e}'
+            else:
+                if api_params is not None and not renewed and _token_rejected(resp):
+                    print('[TeraBox] jsToken rechazado, renovando sesión')
+                    renewed = True
+                    self._ensure_tokens(stale=token)
+                    continue
+                if not idempotent or resp.status_code not in _RETRY_STATUS or attempt >= TERABOX_RETRIES:
+                    return resp
+                error = f'HTTP {resp.status_code}'
+                retry_after = resp.headers.get('Retry-After')
+                resp.close()
+
+            delay = TERABOX_BACKOFF * 2 ** attempt * (1 + random.random() / 2)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            attempt += 1
+            print(f'[TeraBox] {method} {url.split("?")[0]}: {error}; '
+                  f'reintento {attempt}/{TERABOX_RETRIES} en {delay:.1f} s')
+            time.sleep(delay)
 
     # ── Tokens internos ────────────────────────────────────────────────
-    def _ensure_tokens(self):
-        """Obtiene jsToken y bdstoken de la página principal de TeraBox."""
-        if self._jstoken:
-            return
+    def _ensure_tokens(self, stale=None):
+        """
+        Obtiene jsToken y bdstoken de la página principal de TeraBox.
+        stale: token que la API acaba de rechazar → se vuelve a pedir,
+        salvo que otro hilo ya lo haya renovado.  Retorna el jsToken.
+        """
+        token = self._jstoken
+        if token and token != stale:
+            return token
 
-        resp = self.session.get(f'{TERABOX_API}/main', timeout=15)
-        resp.raise_for_status()
+        with self._token_lock:
+            if self._jstoken and self._jstoken != stale:
+                return self._jstoken
 
-        m = re.search(r'"jsToken"\s*:\s*"([^"]+)"', resp.text)
-        if m:
-            self._jstoken = m.group(1)
+            resp = self._request('GET', f'{TERABOX_API}/main', timeout=15)
+            resp.raise_for_status()
 
-        m = re.search(r'"bdstoken"\s*:\s*"([^"]+)"', resp.text)
-        if m:
-            self._bdstoken = m.group(1)
+            m = re.search(r'"jsToken"\s*:\s*"([^"]+)"', resp.text)
+            jstoken = m.group(1) if m else None
 
-        if not self._jstoken:
-            raise RuntimeError(
-                'No se pudo obtener jsToken de TeraBox. '
-                'Verifica que TERABOX_NDUS sea válido y no haya expirado.'
-            )
+            m = re.search(r'"bdstoken"\s*:\s*"([^"]+)"', resp.text)
+            if m:
+                self._bdstoken = m.group(1)
+
+            if not jstoken or jstoken == stale:
+                raise RuntimeError(
+                    'No se pudo obtener jsToken de TeraBox. '
+                    'Verifica que TERABOX_NDUS sea válido y no haya expirado.'
+                )
+            self._jstoken = jstoken
+            return jstoken
 
     def _api_params(self, extra=None):
         params = {'app_id': APP_ID, 'jsToken': self._jstoken}
@@ -81,9 +271,9 @@ class TeraBoxClient:
     # ── Crear carpeta ──────────────────────────────────────────────────
     def _ensure_folder(self, folder_path):
         """Crea la carpeta remota si no existe."""
-        self.session.post(
-            f'{TERABOX_API}/api/create',
-            params=self._api_params(),
+        self._request(
+            'POST', f'{TERABOX_API}/api/create', idempotent=False,
+            api_params={},
             data={'path': folder_path, 'isdir': '1', 'size': '0',
                   'block_list': '[]'},
             timeout=15,
@@ -92,7 +282,17 @@ class TeraBoxClient:
     # ── Upload ─────────────────────────────────────────────────────────
     def upload(self, filename, data_bytes):
         """
-        Sube un archivo a TeraBox.
+        Sube un archivo a TeraBox por bloques, en paralelo y reanudable.
+
+        1. precreate con el MD5 de cada bloque (TeraBox responde qué
+           bloques necesita, o return_type 2 si ya tiene el contenido).
+        2. superfile2 por bloque (partseq = índice), hasta
+           TERABOX_UPLOAD_CONCURRENCY a la vez.
+        3. create con el block_list de los MD5 devueltos.
+
+        Si un intento anterior del mismo archivo (misma ruta y mismos
+        bloques) quedó a medias, reutiliza su uploadid y solo sube los
+        bloques que faltan.
 
         Args:
             filename:   nombre del archivo (ej: "42_cancion.wav")
@@ -101,25 +301,37 @@ class TeraBoxClient:
         Returns:
             str: ruta remota completa (ej: "/VibeFlow/songs/42_cancion.wav")
         """
-        self._ensure_tokens()
         remote_path = f'{TERABOX_FOLDER}/{filename}'
 
         # Crear carpeta destino
         self._ensure_folder(TERABOX_FOLDER)
 
-        # MD5 del archivo completo
-        md5_full = hashlib.md5(data_bytes).hexdigest()
+        # MD5 por bloque (memoryview: sin copiar el archivo)
+        data = memoryview(data_bytes)
+        block = TERABOX_UPLOAD_BLOCK_BYTES
+        blocks = [data[i:i + block] for i in range(0, len(data), block)] or [data]
+        md5s = [hashlib.md5(b).hexdigest() for b in blocks]
+
+        state = _UploadState(remote_path, md5s)
+        if state.uploadid:
+            print(f'[TeraBox] Reanudando {remote_path}: '
+                  f'{len(state.parts)}/{len(blocks)} bloques ya subidos')
+            try:
+                return self._finish_upload(remote_path, blocks, md5s, state, len(data))
+            except _UploadExpired as e:
+                print(f'[TeraBox] uploadid caducado ({e}); se sube de nuevo')
+                state.clear()
 
         # 1. Pre-create
-        block_list = json.dumps([md5_full])
-        resp = self.session.post(
-            f'{TERABOX_API}/api/precreate',
-            params=self._api_params(),
+        resp = self._request(
+            'POST', f'{TERABOX_API}/api/precreate', idempotent=False,
+            api_params={},
             data={
                 'path': remote_path,
+                'size': str(len(data)),
                 'autoinit': '1',
                 'target_path': TERABOX_FOLDER,
-                'block_list': block_list,
+                'block_list': json.dumps(md5s),
                 'local_mtime': '',
             },
             timeout=30,
@@ -133,38 +345,52 @@ class TeraBoxClient:
         # Rapid upload (el archivo ya existe en la nube)
         if pre.get('return_type') == 2:
             print(f'[TeraBox] Rapid upload: {remote_path}')
+            self.invalidate_download_url(remote_path)
             return remote_path
 
-        uploadid = pre.get('uploadid', '')
-
-        # 2. Subir chunk (archivo completo como un solo chunk)
-        resp = self.session.post(
-            f'{TERABOX_API}/rest/2.0/pcs/superfile2',
-            params={
-                'method': 'upload',
-                'app_id': APP_ID,
-                'jsToken': self._jstoken,
-                'path': remote_path,
-                'uploadid': uploadid,
-                'partseq': '0',
-            },
-            files={'file': ('chunk', data_bytes)},
-            timeout=120,
-        )
-        resp.raise_for_status()
-        chunk_info = resp.json()
-        chunk_md5 = chunk_info.get('md5', md5_full)
+        # block_list de la respuesta = índices de los bloques que faltan
+        needed = set(pre.get('block_list') or range(len(blocks)))
+        state.start(pre.get('uploadid', ''), {
+            seq: md5 for seq, md5 in enumerate(md5s) if seq not in needed
+        })
+        try:
+            return self._finish_upload(remote_path, blocks, md5s, state, len(data))
+        except _UploadExpired as e:
+            state.clear()
+            raise RuntimeError(f'TeraBox create falló: {e}')
+
+    def _finish_upload(self, remote_path, blocks, md5s, state, size):
+        """Pasos 2 y 3 de upload(): bloques pendientes + create."""
+        pending = [seq for seq in range(len(blocks)) if seq not in state.parts]
+        if pending:
+            workers = max(1, min(TERABOX_UPLOAD_CONCURRENCY, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='terabox-upload') as pool:
+                futures = [
+                    pool.submit(self._upload_block, remote_path, state.uploadid, seq, blocks[seq], md5s[seq])
+                    for seq in pending
+                ]
+                # Cada bloque subido queda registrado aunque otro falle
+                error = None
+                for seq, future in zip(pending, futures):
+                    try:
+                        state.part_done(seq, future.result())
+                    except _UploadExpired as e:
+                        error = e
+                    except Exception as e:
+                        error = error or e
+                if error is not None:
+                    raise error
 
         # 3. Create (finalizar)
-        resp = self.session.post(
-            f'{TERABOX_API}/api/create',
-            params=self._api_params(),
+        resp = self._request(
+            'POST', f'{TERABOX_API}/api/create', idempotent=False,
+            api_params={},
             data={
                 'path': remote_path,
-                'size': str(len(data_bytes)),
-                'uploadid': uploadid,
+                'size': str(size),
+                'uploadid': state.uploadid,
                 'target_path': TERABOX_FOLDER,
-                'block_list': json.dumps([chunk_md5]),
+                'block_list': json.dumps([state.parts[seq] for seq in range(len(blocks))]),
                 'local_mtime': '',
             },
             timeout=30,
@@ -173,29 +399,125 @@ class TeraBoxClient:
         result = resp.json()
 
         if result.get('errno', -1) != 0:
-            raise RuntimeError(f'TeraBox create falló: {result}')
+            raise _UploadExpired(result)
 
-        print(f'[TeraBox] Subido: {remote_path} ({len(data_bytes)} bytes)')
+        state.clear()
+        # Pudo quedar en caché como inexistente
+        self.invalidate_download_url(remote_path)
+        print(f'[TeraBox] Subido: {remote_path} ({size} bytes, {len(blocks)} bloques)')
         return remote_path
 
+    def _upload_block(self, remote_path, uploadid, seq, chunk, md5):
+        """superfile2 de un bloque.  Retorna el MD5 que reporta TeraBox."""
+        # Re-subir el mismo partseq es idempotente: se reintenta
+        resp = self._request(
+            'POST', f'{TERABOX_API}/rest/2.0/pcs/superfile2',
+            api_params={
+                'method': 'upload',
+                'path': remote_path,
+                'uploadid': uploadid,
+                'partseq': str(seq),
+            },
+            files={'file': ('chunk', chunk.tobytes())},
+            timeout=120,
+        )
+        if 400 <= resp.status_code < 500:
+            # uploadid caducado/desconocido: reintentar no sirve
+            raise _UploadExpired(f'bloque {seq}: HTTP {resp.status_code} {resp.text[:200]}')
+        resp.raise_for_status()
+        info = resp.json()
+        if info.get('error_code') or info.get('errno', 0) != 0:
+            raise RuntimeError(f'TeraBox superfile2 falló (bloque {seq}): {info}')
+        return info.get('md5', md5)
+
     # ── Download ───────────────────────────────────────────────────────
     def get_download_url(self, remote_path):
-        """Obtiene la URL de descarga directa (dlink) de un archivo."""
-        self._ensure_tokens()
-        resp = self.session.get(
-            f'{TERABOX_API}/api/filemetas',
-            params=self._api_params({
-                'dlink': '1',
-                'target': json.dumps([remote_path]),
-            }),
+        """Obtiene la URL de descarga directa (dlink) de un archivo ('' si no existe)."""
+        dlink = self._dlinks.get(remote_path)
+        if dlink is None:
+            dlink = self.resolve_download_urls([remote_path])[remote_path]
+        return dlink
+
+    def resolve_download_urls(self, remote_paths):
+        """
+        dlinks de varias rutas: las que no están en caché se resuelven con
+        una llamada a /api/filemetas por cada FILEMETAS_BATCH rutas.
+
+        Returns:
+            dict: ruta → dlink ('' si el archivo no existe)
+        """
+        result, pending = {}, []
+        for path in dict.fromkeys(remote_paths):
+            dlink = self._dlinks.get(path)
+            if dlink is None:
+                pending.append(path)
+            else:
+                result[path] = dlink
+        if not pending:
+            return result
+
+        for i in range(0, len(pending), FILEMETAS_BATCH):
+            batch = pending[i:i + FILEMETAS_BATCH]
+            resp = self._request(
+                'GET', f'{TERABOX_API}/api/filemetas',
+                api_params={
+                    'dlink': '1',
+                    'target': json.dumps(batch),
+                },
+                timeout=15,
+            )
+            resp.raise_for_status()
+            data = resp.json()
+            if data.get('errno', -1) != 0:
+                # Error de la API: no se sabe qué rutas existen, no se
+                # cachea nada (solo las ausentes de una respuesta correcta)
+                raise RuntimeError(f'TeraBox filemetas falló: {data}')
+            found = {
+                item.get('path'): item.get('dlink', '')
+                for item in data.get('list') or []
+            }
+            if len(batch) == 1 and len(found) == 1:
+                # Con una sola ruta no hace falta emparejar por 'path'
+                found = {batch[0]: next(iter(found.values()))}
+            for path in batch:
+                result[path] = found.get(path) or ''
+                self._dlinks.put(path, result[path])
+        return result
+
+    def stat(self, remote_path):
+        """Metadatos de un archivo ({'size'}) o None si no existe."""
+        resp = self._request(
+            'GET', f'{TERABOX_API}/api/filemetas',
+            api_params={'target': json.dumps([remote_path])},
             timeout=15,
         )
         resp.raise_for_status()
         data = resp.json()
-
-        if data.get('list'):
-            return data['list'][0].get('dlink', '')
-        return ''
+        if data.get('errno', -1) != 0:
+            raise RuntimeError(f'TeraBox filemetas falló: {data}')
+        items = data.get('list') or []
+        if not items:
+            return None
+        return {'size': int(items[0].get('size') or 0)}
+
+    def invalidate_download_url(self, remote_path):
+        """Olvida el dlink cacheado de una ruta (caducado o archivo borrado)."""
+        self._dlinks.invalidate(remote_path)
+
+    def _get_dlink(self, remote_path, **kwargs):
+        """
+        GET al dlink de la ruta.  Si responde 403/410 (dlink caducado antes
+        del TTL) lo vuelve a resolver y reintenta una vez.
+        """
+        for attempt in range(2):
+            dlink = self.get_download_url(remote_path)
+            if not dlink:
+                raise RuntimeError(f'No se obtuvo URL de descarga para: {remote_path}')
+            resp = self._request('GET', dlink, allow_redirects=True, **kwargs)
+            if resp.status_code not in _DLINK_EXPIRED or attempt:
+                return resp
+            resp.close()
+            self.invalidate_download_url(remote_path)
 
     def download(self, remote_path):
         """
@@ -207,32 +529,101 @@ class TeraBoxClient:
         Returns:
             bytes: contenido del archivo
         """
-        dlink = self.get_download_url(remote_path)
-        if not dlink:
-            raise RuntimeError(f'No se obtuvo URL de descarga para: {remote_path}')
-
-        resp = self.session.get(dlink, allow_redirects=True, timeout=120)
+        resp = self._get_dlink(remote_path, timeout=120)
         resp.raise_for_status()
         return resp.content
 
+    def open_download(self, remote_path, byte_range=None):
+        """
+        Abre la descarga de un archivo en streaming (stream=True) para
+        leerla con iter_content, sin tenerla entera en memoria.
+
+        Args:
+            remote_path: ruta remota
+            byte_range:  cabecera Range a reenviar (ej: "bytes=1000-")
+
+        Returns:
+            requests.Response (200, 206 o 416); el llamador la cierra.
+        """
+        headers = {'Range': byte_range} if byte_range else {}
+        resp = self._get_dlink(remote_path, headers=headers, stream=True, timeout=(15, 120))
+        if resp.status_code not in (200, 206, 416):
+            resp.close()
+            resp.raise_for_status()
+        return resp
+
     # ── Delete ─────────────────────────────────────────────────────────
     def delete(self, remote_path):
         """Elimina un archivo de TeraBox."""
-        self._ensure_tokens()
-        resp = self.session.post(
-            f'{TERABOX_API}/api/filemanager',
-            params=self._api_params({'opera': 'delete'}),
+        resp = self._request(
+            'POST', f'{TERABOX_API}/api/filemanager', idempotent=False,
+            api_params={'opera': 'delete'},
             data={'filelist': json.dumps([remote_path])},
             timeout=15,
         )
         resp.raise_for_status()
         result = resp.json()
+        self.invalidate_download_url(remote_path)
         print(f'[TeraBox] Eliminado: {remote_path} → {result}')
         return result
 
 
+class _UploadExpired(Exception):
+    """TeraBox rechazó el uploadid (caducado o bloques incompletos)."""
+
+
+class _UploadState:
+    """
+    Progreso de una subida en TERABOX_UPLOAD_STATE_DIR (JSON, escritura
+    atómica): uploadid y MD5 de los bloques ya subidos.  La clave es la
+    ruta remota + los MD5 de los bloques: otro contenido en la misma ruta
+    empieza de cero.
+    """
+
+    def __init__(self, remote_path, md5s):
+        key = hashlib.sha256(json.dumps([remote_path, md5s]).encode('utf-8')).hexdigest()
+        self.path = os.path.join(TERABOX_UPLOAD_STATE_DIR, f'{key}.json')
+        self._lock = threading.Lock()
+        self.uploadid = None
+        self.parts = {}
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+            self.uploadid = saved['uploadid']
+            self.parts = {int(seq): md5 for seq, md5 in saved['parts'].items()}
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+    def start(self, uploadid, parts):
+        with self._lock:
+            self.uploadid = uploadid
+            self.parts = dict(parts)
+            self._save()
+
+    def part_done(self, seq, md5):
+        with self._lock:
+            self.parts[seq] = md5
+            self._save()
+
+    def clear(self):
+        self.uploadid = None
+        self.parts = {}
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _save(self):
+        os.makedirs(TERABOX_UPLOAD_STATE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=TERABOX_UPLOAD_STATE_DIR, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'uploadid': self.uploadid, 'parts': self.parts}, f)
+        os.replace(tmp, self.path)
+
+
 # ── Singleton ──────────────────────────────────────────────────────────
 _client = None
+_client_lock = threading.Lock()
 
 
 def get_client():
@@ -244,28 +635,42 @@ def get_client():
                 'TERABOX_NDUS no configurado. '
                 'Añade tu cookie ndus de TeraBox en el archivo .env'
             )
-        _client = TeraBoxClient()
+        with _client_lock:
+            if _client is None:
+                _client = TeraBoxClient()
     return _client
 
 
-def upload_song(song_id, title, wav_bytes):
+def upload_song(filename, data):
     """
-    Shortcut: sube un WAV a TeraBox con nombre normalizado.
-    Retorna la ruta remota.
+    Shortcut: sube el audio de una canción (WAV o FLAC) a TeraBox.  El
+    nombre lo pone audioStorageService.song_filename.  Retorna la ruta
+    remota.
     """
-    # Nombre seguro: id_titulo.wav
-    safe_title = re.sub(r'[^\w\s-]', '', title).strip().replace(' ', '_')[:50]
-    filename = f'{song_id}_{safe_title}.wav'
-    return get_client().upload(filename, wav_bytes)
+    remote_path = get_client().upload(filename, data)
+    # Lo más probable es que se reproduzca pronto: dejarlo ya en caché
+    audioCacheService.put(remote_path, data)
+    return remote_path
 
 
 def download_song(remote_path):
-    """Shortcut: descarga un WAV desde TeraBox."""
-    return get_client().download(remote_path)
+    """Shortcut: descarga un WAV desde TeraBox (o desde la caché en disco)."""
+    return audioCacheService.fetch(remote_path, lambda path: get_client().download(path))
+
+
+def resolve_download_urls(remote_paths):
+    """Shortcut: resuelve (y cachea) los dlinks de varias rutas de una vez."""
+    return get_client().resolve_download_urls(remote_paths)
+
+
+def open_song_stream(remote_path, byte_range=None):
+    """Shortcut: descarga en streaming (sin caché; ver audio_cancion)."""
+    return get_client().open_download(remote_path, byte_range)
 
 
 def delete_song(remote_path):
     """Shortcut: elimina un archivo de TeraBox."""
+    audioCacheService.invalidate(remote_path)
     return get_client().delete(remote_path)
 
 
@@ -5,6 +5,10 @@
 
 const API = '/api/shazam/';
 
+// true → upload/búsqueda envían el WAV como body binario (audio/wav) con
+// metadatos en la query; false → JSON con audio_base64 (modo anterior).
+const USE_BINARY_UPLOAD = true;
+
 /* ── Auth helpers ── */
 function getToken() { return localStorage.getItem('vf_token') || ''; }
 function authH(extra = {}) { return { 'Authorization': 'Bearer ' + getToken(), ...extra }; }
@@ -158,26 +162,39 @@ document.getElementById('form-upload').addEventListener('submit', async (e) => {
 
         // 3. Convertir a WAV PCM 16-bit
         const wavBuffer = audioBufferToWav(audioBuffer);
-        const wavBase64 = arrayBufferToBase64(wavBuffer);
 
-        progressFill.style.width = '70%';
-        progressText.textContent = 'Subiendo y generando fingerprints...';
+        progressFill.style.width = '60%';
+        progressText.textContent = 'Subiendo...';
 
         // 4. Enviar al server
-        const resp = await fetch(API + 'upload/', {
-            method: 'POST',
-            headers: authH({ 'Content-Type': 'application/json' }),
-            body: JSON.stringify({
-                title,
-                artist,
-                audio_base64: wavBase64,
-                file_type: 'audio/wav',
-                file_size: wavBuffer.byteLength,
-                duration_seconds: Math.round(audioBuffer.duration)
+        const meta = {
+            title,
+            artist,
+            file_type: 'audio/wav',
+            file_size: wavBuffer.byteLength,
+            duration_seconds: Math.round(audioBuffer.duration)
+        };
+        const resp = USE_BINARY_UPLOAD
+            ? await fetch(API + 'upload/?' + new URLSearchParams(meta), {
+                method: 'POST',
+                headers: authH({ 'Content-Type': 'audio/wav' }),
+                body: wavBuffer
             })
-        });
+            : await fetch(API + 'upload/', {
+                method: 'POST',
+                headers: authH({ 'Content-Type': 'application/json' }),
+                body: JSON.stringify({ ...meta, audio_base64: arrayBufferToBase64(wavBuffer) })
+            });
 
-        const data = await resp.json();
+        let data = await resp.json();
+
+        // 5. El server responde 202 con un job: seguir su progreso
+        if (data.status && resp.status === 202) {
+            data = await waitForJob(data.data, (job) => {
+                progressFill.style.width = `${60 + Math.round(job.progress * 40)}%`;
+                progressText.textContent = `Procesando en servidor: ${JOB_STAGE_LABELS[job.stage] || job.stage}...`;
+            });
+        }
         progressFill.style.width = '100%';
 
         if (data.status) {
@@ -204,6 +221,40 @@ document.getElementById('form-upload').addEventListener('submit', async (e) => {
     }
 });
 
+/* ====================================================================
+   Jobs de ingesta — polling de GET /api/shazam/jobs/<id>/
+   ==================================================================== */
+const JOB_STAGE_LABELS = {
+    download:    'descargando audio de TeraBox',
+    fingerprint: 'generando fingerprints',
+    replace:     'reemplazando fingerprints',
+    store:       'guardando fingerprints',
+    terabox:     'subiendo audio a TeraBox',
+};
+
+async function waitForJob(job, onProgress, intervalMs = 1500) {
+    while (job.status === 'queued' || job.status === 'running') {
+        onProgress(job);
+        await new Promise(r => setTimeout(r, intervalMs));
+        const resp = await fetch(API + 'jobs/' + job.id + '/', { headers: authH() });
+        const data = await resp.json();
+        if (!data.status) return data;
+        job = data.data;
+    }
+    if (job.status === 'done') {
+        return {
+            status: true,
+            data: job,
+            message: `Canción subida con ${job.fingerprint_count} fingerprints generados`,
+        };
+    }
+    return {
+        status: false,
+        data: job,
+        message: `Falló la etapa "${JOB_STAGE_LABELS[job.stage] || job.stage}" (job ${job.id}): ${job.error}`,
+    };
+}
+
 /* ====================================================================
    Search Tabs
    ==================================================================== */
@@ -224,8 +275,8 @@ function getWsUrl() {
 
 /* ====================================================================
    Mic Recording — streaming en tiempo real vía WebSocket
-   Graba audio del micrófono → convierte a WAV PCM 16-bit en tiempo real
-   → envía chunks binarios por WebSocket → recibe resultados parciales.
+   Graba audio del micrófono → handshake con el formato del stream
+   → envía PCM 16-bit crudo por WebSocket → recibe resultados parciales.
    ==================================================================== */
 let isListening = false;
 let activeWs = null;
@@ -336,7 +387,15 @@ async function startListening() {
         }
         drawViz();
 
-        // 4. Capturar audio con ScriptProcessorNode y enviar WAV PCM por WebSocket
+        // 4. Handshake: declarar formato del stream (PCM 16-bit mono, sin headers)
+        ws.send(JSON.stringify({
+            action: 'start',
+            sample_rate: audioCtx.sampleRate,
+            channels: 1,
+            format: 's16le'
+        }));
+
+        // 5. Capturar audio con ScriptProcessorNode y enviar PCM crudo por WebSocket
         //    Usamos un buffer size de 4096 samples → ~93 ms por chunk a 44100 Hz
         const processor = audioCtx.createScriptProcessor(4096, 1, 1);
         source.connect(processor);
@@ -345,15 +404,11 @@ async function startListening() {
         processor.onaudioprocess = (e) => {
             if (songFound || ws.readyState !== WebSocket.OPEN) return;
 
-            // Obtener muestras mono float32
-            const inputData = e.inputBuffer.getChannelData(0);
-
-            // Convertir a PCM 16-bit WAV (con header) para que el server pueda parsear
-            const wavBuffer = float32ToWav(inputData, e.inputBuffer.sampleRate);
-            ws.send(wavBuffer);
+            // Muestras mono float32 → PCM 16-bit little-endian
+            ws.send(float32ToPcm16(e.inputBuffer.getChannelData(0)));
         };
 
-        // 5. Countdown 30 → 0
+        // 6. Countdown 30 → 0
         let remaining = 30;
         countdown.textContent = `🎤 Escuchando en vivo... ${remaining}s`;
 
@@ -368,7 +423,7 @@ async function startListening() {
             }
         }, 1000);
 
-        // 6. Esperar hasta 30 s o hasta encontrar canción
+        // 7. Esperar hasta 30 s o hasta encontrar canción
         await new Promise(resolve => {
             const timeout = setTimeout(resolve, 30000);
             const checkInterval = setInterval(() => {
@@ -412,47 +467,16 @@ async function startListening() {
 }
 
 /**
- * Convierte un array Float32 (muestras mono) a un ArrayBuffer WAV PCM 16-bit.
- * Incluye header WAV completo para que el server pueda parsearlo.
+ * Convierte un array Float32 (muestras mono) a PCM 16-bit little-endian crudo.
+ * El formato ya se declaró en el handshake, así que no lleva header WAV.
  */
-function float32ToWav(samples, sampleRate) {
-    const numSamples = samples.length;
-    const bitsPerSample = 16;
-    const numChannels = 1;
-    const byteRate = sampleRate * numChannels * bitsPerSample / 8;
-    const blockAlign = numChannels * bitsPerSample / 8;
-    const dataSize = numSamples * blockAlign;
-    const buffer = new ArrayBuffer(44 + dataSize);
-    const view = new DataView(buffer);
-
-    // RIFF header
-    writeString(view, 0, 'RIFF');
-    view.setUint32(4, 36 + dataSize, true);
-    writeString(view, 8, 'WAVE');
-
-    // fmt chunk
-    writeString(view, 12, 'fmt ');
-    view.setUint32(16, 16, true);
-    view.setUint16(20, 1, true);             // PCM
-    view.setUint16(22, numChannels, true);
-    view.setUint32(24, sampleRate, true);
-    view.setUint32(28, byteRate, true);
-    view.setUint16(32, blockAlign, true);
-    view.setUint16(34, bitsPerSample, true);
-
-    // data chunk
-    writeString(view, 36, 'data');
-    view.setUint32(40, dataSize, true);
-
-    // PCM samples
-    let offset = 44;
-    for (let i = 0; i < numSamples; i++) {
+function float32ToPcm16(samples) {
+    const pcm = new Int16Array(samples.length);
+    for (let i = 0; i < samples.length; i++) {
         const s = Math.max(-1, Math.min(1, samples[i]));
-        view.setInt16(offset, s < 0 ? s * 0x8000 : s * 0x7FFF, true);
-        offset += 2;
+        pcm[i] = s < 0 ? s * 0x8000 : s * 0x7FFF;
     }
-
-    return buffer;
+    return pcm.buffer;
 }
 
 function getSupportedMimeType() {
@@ -496,15 +520,20 @@ async function searchFromFile() {
         audioCtx.close();
 
         const wavBuffer = audioBufferToWav(audioBuffer);
-        const wavBase64 = arrayBufferToBase64(wavBuffer);
 
         showMsg('msg-search', '🔍 Buscando coincidencias...', true);
 
-        const resp = await fetch(API + 'search/', {
-            method: 'POST',
-            headers: authH({ 'Content-Type': 'application/json' }),
-            body: JSON.stringify({ audio_base64: wavBase64 })
-        });
+        const resp = USE_BINARY_UPLOAD
+            ? await fetch(API + 'search/', {
+                method: 'POST',
+                headers: authH({ 'Content-Type': 'audio/wav' }),
+                body: wavBuffer
+            })
+            : await fetch(API + 'search/', {
+                method: 'POST',
+                headers: authH({ 'Content-Type': 'application/json' }),
+                body: JSON.stringify({ audio_base64: arrayBufferToBase64(wavBuffer) })
+            });
 
         const result = await resp.json();
         displayResult(result);
@@ -703,27 +732,84 @@ async function deleteSong(id) {
 /* ====================================================================
    Regenerar Fingerprints (desde audio ya almacenado)
    ==================================================================== */
+// EventSource no permite la cabecera Authorization: se lee el stream
+// SSE con fetch y se parsean los eventos a mano.
+async function followBatch(url, onProgress) {
+    const resp = await fetch(url, { headers: authH() });
+    if (!resp.ok) throw new Error('HTTP ' + resp.status);
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let batch = null;
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) return batch;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) >= 0) {
+            const block = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            const data = block.split('\n').filter(l => l.startsWith('data: ')).map(l => l.slice(6)).join('\n');
+            if (!data) continue;   // keepalive
+            batch = JSON.parse(data);
+            onProgress(batch);
+        }
+    }
+}
+
+// Espera a que termine el lote.  El stream puede cortarse (proxy, red)
+// sin el evento 'done': se reconecta y, si la conexión falla, se consulta
+// el estado (status_url) hasta que termine.
+async function waitBatch(batch, onProgress) {
+    const { events_url: eventsUrl, status_url: statusUrl } = batch;
+    while (!batch.finished) {
+        try {
+            batch = (await followBatch(eventsUrl, onProgress)) || batch;
+        } catch (err) {
+            const resp = await fetch(statusUrl, { headers: authH() });
+            const data = await resp.json();
+            if (!data.status) throw new Error(data.message);
+            batch = data.data;
+            onProgress(batch);
+        }
+        if (!batch.finished) await new Promise(r => setTimeout(r, 2000));
+    }
+    return batch;
+}
+
 async function regenerarTodas() {
-    if (!confirm('¿Regenerar fingerprints de TODAS las canciones? Esto puede tardar unos segundos.')) return;
+    if (!confirm('¿Regenerar fingerprints de TODAS las canciones? Se procesan en segundo plano con los workers de ingesta.')) return;
     const btn = document.getElementById('btn-regen');
     const status = document.getElementById('regen-status');
     btn.disabled = true;
-    status.textContent = '⏳ Regenerando...';
+    status.textContent = '⏳ Encolando...';
     try {
         const resp = await fetch(API + 'regenerate-all/', {
             method: 'POST',
             headers: authH()
         });
         const data = await resp.json();
-        if (data.status) {
-            const r = data.data;
-            status.textContent = `✅ ${r.processed} canciones procesadas`;
-            showMsg('msg-upload', data.message, true);
-            loadSongs();
-        } else {
+        if (!data.status) {
             status.textContent = '❌ Error';
             showMsg('msg-upload', data.message, false);
+            return;
+        }
+        const show = b => {
+            const pct = Math.round(b.progress * 100);
+            status.textContent = `⏳ ${b.done + b.failed}/${b.total} canciones (${pct}%)` +
+                (b.failed ? ` — ${b.failed} con error` : '');
+        };
+        show(data.data);
+        const r = await waitBatch(data.data, show);
+        if (r.failed) {
+            status.textContent = `⚠️ ${r.done} canciones procesadas, ${r.failed} con error`;
+            const first = r.errors[0];
+            showMsg('msg-upload', `Regeneración con errores (p. ej. "${first.title}": ${first.error})`, false);
+        } else {
+            status.textContent = `✅ ${r.done} canciones procesadas`;
+            showMsg('msg-upload', 'Regeneración completa', true);
         }
+        loadSongs();
     } catch (err) {
         status.textContent = '❌ Error';
         showMsg('msg-upload', 'Error: ' + err.message, false);
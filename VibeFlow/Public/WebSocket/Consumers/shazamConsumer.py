@@ -1,14 +1,26 @@
 """
 shazamConsumer.py - WebSocket consumer para streaming de audio en tiempo real.
 
-Flujo:
-1. El cliente abre ws://…/ws/shazam/  y envía chunks de audio PCM (binario).
-2. Los chunks se acumulan en un buffer interno.
-3. Cada ANALYSIS_INTERVAL segundos (o cuando el cliente envía {"action":"search"})
-   el server genera fingerprints del audio acumulado, busca en la BD y envía
-   el resultado al cliente.
-4. Si se encuentra una coincidencia confirmada, se envía un mensaje final
-   con is_confirmed=True y se cierra el WebSocket.
+Protocolo:
+1. El cliente abre ws://…/ws/shazam/ y envía un handshake JSON declarando
+   el formato del audio:
+       {"action": "start", "sample_rate": 44100, "channels": 1, "format": "s16le"}
+   Formatos: "s16le" (PCM 16-bit) o "f32le" (IEEE float 32-bit), little-endian.
+2. Después envía frames PCM crudos (binario, sin cabecera WAV).  El server
+   los decodifica incrementalmente a un buffer circular float32 preasignado
+   (últimos STREAM_BUFFER_SECONDS segundos), reservado contra los
+   presupuestos de memoria por conexión y global (audioStreamService).
+   Si el presupuesto global está agotado el handshake se rechaza.
+3. Cada AUTO_ANALYSIS_SECONDS segundos de audio nuevo (o cuando el cliente
+   envía {"action":"search"}) el server fingerprinta SOLO el audio nuevo
+   (StreamingFingerprinter conserva la cola STFT y los picos pendientes),
+   busca esos hashes en la BD y suma sus votos al histograma
+   (song_id, offset_diff) de la sesión (VoteAccumulator).
+4. En cuanto el mejor grupo coherente llega a MIN_MATCHES se envía un
+   mensaje final con is_confirmed=True.
+
+Compatibilidad: sin handshake, cada mensaje binario que empiece por 'RIFF'
+se parsea como un WAV completo e independiente (cliente antiguo).
 
 Mensajes JSON que envía el servidor al cliente:
   - {"type": "status",    "message": "..."}         → info / progreso
@@ -16,52 +28,81 @@ Mensajes JSON que envía el servidor al cliente:
   - {"type": "confirmed", "data": {...}}             → canción confirmada (fin)
   - {"type": "no_match",  "message": "..."}          → búsqueda sin resultado
   - {"type": "error",     "message": "..."}          → error
+  - {"type": "stats",     "data": {...}}             → estadísticas de buffer/memoria
+                                                        y de la caché de audio
 
 Mensajes que acepta del cliente:
-  - Binario (bytes)                    → chunk de audio WAV/PCM
+  - {"action": "start", ...}           → handshake de formato (ver arriba)
+  - Binario (bytes)                    → frame PCM crudo
   - {"action": "search"}               → forzar búsqueda con lo acumulado
-  - {"action": "reset"}                → limpiar buffer
+  - {"action": "reset"}                → limpiar buffer y votos
+  - {"action": "stats"}                → estadísticas de la sesión y del proceso
   - {"action": "stop"}                 → cerrar conexión
 """
 
 import json
+import asyncio
 import traceback
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from VibeFlow.Public.Services import fingerprintService
+from VibeFlow.Public.Services import audioCacheService, audioStreamService, dspPoolService, fingerprintVersionService
+from VibeFlow.Public.Services.audioStreamService import PcmStreamDecoder
 
 
-# ── Cada cuántos bytes acumulados se lanza un análisis automático ──
-# ~5 segundos de audio PCM 16-bit mono 11025 Hz ≈ 110 250 bytes
-AUTO_ANALYSIS_BYTES = 110_250
+# ── Análisis automático cada N segundos de audio nuevo ──
+# (cada análisis solo procesa el audio nuevo, así que puede ser frecuente)
+AUTO_ANALYSIS_SECONDS = 1
 
 
 class ShazamStreamConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer para identificación de audio en tiempo real."""
 
     async def connect(self):
-        self.audio_buffer = bytearray()
+        self.decoder = None
+        self.ring = None
+        self.sample_rate = None
+        self.samples_since_analysis = 0
+        self.consumed = 0            # muestras del ring ya fingerprintadas
+        self.fingerprinter = None
+        self.params = None
+        self.votes = None
         self.found = False
         await self.accept()
         await self.send(text_data=json.dumps({
             'type': 'status',
-            'message': 'Conexión WebSocket establecida. Envía audio para identificar.'
+            'message': 'Conexión WebSocket establecida. Envía el handshake "start" y luego audio PCM.'
         }))
 
     async def disconnect(self, close_code):
-        self.audio_buffer.clear()
+        audioStreamService.close_ring(self.ring)
+        self.decoder = None
+        self.ring = None
+        self.fingerprinter = None
+        self.votes = None
 
     # ── Recepción de mensajes ──────────────────────────────────────────
     async def receive(self, text_data=None, bytes_data=None):
-        # ── Mensaje binario: chunk de audio ──
+        # ── Mensaje binario: frame de audio ──
         if bytes_data:
             if self.found:
                 return  # Ya se encontró, ignorar más audio
 
-            self.audio_buffer.extend(bytes_data)
+            try:
+                samples = self._decode(bytes_data)
+            except audioStreamService.StreamBudgetExceeded as e:
+                await self._send_error(str(e))
+                await self.close(code=1013)
+                return
+            except ValueError as e:
+                await self._send_error(str(e))
+                return
+
+            self.ring.append(samples)
+            self.samples_since_analysis += len(samples)
 
-            # Análisis automático cada AUTO_ANALYSIS_BYTES bytes
-            if len(self.audio_buffer) >= AUTO_ANALYSIS_BYTES:
+            # Análisis automático cada AUTO_ANALYSIS_SECONDS de audio nuevo
+            if self.samples_since_analysis >= AUTO_ANALYSIS_SECONDS * self.sample_rate:
                 await self._analyze()
             return
 
@@ -70,51 +111,118 @@ class ShazamStreamConsumer(AsyncWebsocketConsumer):
             try:
                 msg = json.loads(text_data)
             except json.JSONDecodeError:
-                await self.send(text_data=json.dumps({
-                    'type': 'error',
-                    'message': 'JSON inválido'
-                }))
+                await self._send_error('JSON inválido')
                 return
 
             action = msg.get('action', '')
 
-            if action == 'search':
+            if action == 'start':
+                try:
+                    self._start_stream(
+                        msg.get('sample_rate'),
+                        msg.get('channels', 1),
+                        msg.get('format', 's16le'),
+                    )
+                except audioStreamService.StreamBudgetExceeded as e:
+                    await self._send_error(str(e))
+                    await self.close(code=1013)   # Try Again Later
+                    return
+                except (TypeError, ValueError) as e:
+                    await self._send_error(f'Handshake inválido: {e}')
+                    return
+                await self.send(text_data=json.dumps({
+                    'type': 'status',
+                    'message': (
+                        f'Stream listo: {self.sample_rate} Hz, '
+                        f'{self.decoder.channels} canal(es), {self.decoder.sample_format}'
+                    ),
+                }))
+
+            elif action == 'search':
                 await self._analyze()
 
             elif action == 'reset':
-                self.audio_buffer.clear()
+                if self.ring is not None:
+                    self.ring.clear()
+                if self.decoder is not None:
+                    self.decoder.reset()
+                self._reset_session()
                 self.found = False
                 await self.send(text_data=json.dumps({
                     'type': 'status',
                     'message': 'Buffer limpiado. Listo para nuevo audio.'
                 }))
 
+            elif action == 'stats':
+                data = self._stats()
+                # Contadores de la caché de audio de ESTE proceso (los
+                # aciertos del proxy de audio_cancion); el primer uso
+                # recorre el directorio, fuera del event loop
+                data['audio_cache'] = await asyncio.to_thread(audioCacheService.stats)
+                await self.send(text_data=json.dumps({
+                    'type': 'stats',
+                    'data': data,
+                }))
+
             elif action == 'stop':
                 await self.close()
 
+    # ── Decodificación ─────────────────────────────────────────────────
+    def _start_stream(self, sample_rate, channels, sample_format):
+        """Handshake: prepara decoder PCM y buffer circular."""
+        decoder = PcmStreamDecoder(sample_rate, channels, sample_format)
+        self._open_ring(decoder.sample_rate)
+        self.decoder = decoder
+
+    def _open_ring(self, sample_rate):
+        """Reserva el ring de la conexión (libera el anterior si lo había)."""
+        audioStreamService.close_ring(self.ring)
+        self.ring = None
+        self.ring = audioStreamService.open_ring(sample_rate)
+        self.sample_rate = sample_rate
+        self._reset_session()
+
+    def _reset_session(self):
+        """Reinicia fingerprinting incremental e histograma de votos."""
+        self.samples_since_analysis = 0
+        self.consumed = self.ring.total_written if self.ring is not None else 0
+        self.fingerprinter = None
+        self.params = None           # versión del algoritmo fijada al empezar
+        self.votes = fingerprintService.VoteAccumulator()
+
+    def _decode(self, data):
+        """Frame binario → muestras float32 mono."""
+        if self.decoder is not None:
+            return self.decoder.feed(data)
+
+        # Cliente antiguo: cada mensaje es un WAV completo
+        if data[:4] == b'RIFF':
+            sample_rate, samples = fingerprintService._parse_wav_bytes(data)
+            if self.ring is None:
+                self._open_ring(sample_rate)
+            elif sample_rate != self.sample_rate:
+                raise ValueError('El sample rate cambió a mitad del stream')
+            return samples
+
+        raise ValueError('Envía el handshake {"action": "start", ...} antes del audio PCM.')
+
     # ── Análisis de audio ──────────────────────────────────────────────
     async def _analyze(self):
-        if not self.audio_buffer:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': 'No hay audio en el buffer para analizar.'
-            }))
+        if not self.ring:
+            await self._send_error('No hay audio en el buffer para analizar.')
             return
 
-        await self.send(text_data=json.dumps({
-            'type': 'status',
-            'message': f'Analizando {len(self.audio_buffer)} bytes de audio...'
-        }))
+        self.samples_since_analysis = 0
+        buffer_seconds = round(len(self.ring) / self.sample_rate, 1)
 
         try:
-            wav_bytes = bytes(self.audio_buffer)
-            result = await self._search_fingerprints(wav_bytes)
+            result = await self._search_new_audio()
 
             if result is None:
                 await self.send(text_data=json.dumps({
                     'type': 'no_match',
                     'message': 'Sin coincidencias por ahora. Sigue enviando audio...',
-                    'buffer_size': len(self.audio_buffer),
+                    'buffer_seconds': buffer_seconds,
                 }))
                 return
 
@@ -142,16 +250,59 @@ class ShazamStreamConsumer(AsyncWebsocketConsumer):
 
         except Exception as e:
             traceback.print_exc()
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': f'Error al analizar audio: {str(e)}'
-            }))
+            await self._send_error(f'Error al analizar audio: {str(e)}')
+
+    def _stats(self):
+        """Estadísticas del buffer de esta conexión y globales del proceso."""
+        session = None
+        if self.ring is not None:
+            session = dict(self.ring.stats())
+            session['sample_rate'] = self.sample_rate
+            session['buffer_seconds'] = round(len(self.ring) / self.sample_rate, 1)
+            session['capacity_seconds'] = round(self.ring.capacity / self.sample_rate, 1)
+            session['vote_keys'] = len(self.votes)
+            session['vote_bytes'] = self.votes.nbytes
+            session['pruned_vote_keys'] = self.votes.pruned
+        return {'session': session, 'global': audioStreamService.stats()}
+
+    async def _send_error(self, message):
+        await self.send(text_data=json.dumps({'type': 'error', 'message': message}))
+
+    # ── Fingerprinting incremental ─────────────────────────────────────
+    async def _search_new_audio(self):
+        """
+        Fingerprinta el audio recibido desde el último análisis, suma sus
+        votos al histograma de la sesión y devuelve el resultado acumulado.
+        El estado del stream vive aquí; solo la STFT + picos va al pool de
+        procesos (dspPoolService) y la votación al thread pool de BD.
+        """
+        pending = self.ring.total_written - self.consumed
+        available = min(pending, len(self.ring))
+        self.consumed = self.ring.total_written
+
+        if self.params is None:
+            # La sesión entera usa la misma versión aunque cambie la activa
+            self.params = await database_sync_to_async(fingerprintVersionService.active_version)()
+
+        if self.fingerprinter is None or available < pending:
+            # Inicio del stream, o el ring sobrescribió audio sin analizar:
+            # se reanuda conservando la numeración absoluta de frames.
+            start = self.ring.total_written - available
+            frame_offset = int(start * fingerprintService.SAMPLE_RATE / self.sample_rate) // fingerprintService.HOP
+            if self.fingerprinter is not None:
+                print(f"[Shazam] {pending - available} muestras sin analizar descartadas por el buffer")
+            self.fingerprinter = fingerprintService.StreamingFingerprinter(
+                self.sample_rate, frame_offset, params=self.params,
+            )
+
+        segment = self.fingerprinter.take_frames(self.ring.latest(available))
+        peaks = await dspPoolService.aband_peaks(segment, self.params) if segment is not None else None
+        new_fps = self.fingerprinter.push_peaks(peaks)
+        return await self._add_votes(new_fps)
 
     # ── Operación síncrona de BD ejecutada en thread pool ──────────────
     @database_sync_to_async
-    def _search_fingerprints(self, wav_bytes):
-        """Genera fingerprints y busca en BD (ejecutado en hilo separado)."""
-        fps = fingerprintService.generate_fingerprints(wav_bytes)
-        if not fps:
-            return None
-        return fingerprintService.search_by_fingerprints(fps)
+    def _add_votes(self, new_fps):
+        """Vota los hashes nuevos en BD/índice (ejecutado en hilo separado)."""
+        self.votes.add(new_fps)
+        return self.votes.result()
@@ -0,0 +1,142 @@
+"""
+bench_constellation.py - Modo 'bands' vs 'topn' (FINGERPRINT_MODE).
+
+Para cada configuración (modo, picos por banda, fan-out) mide:
+  - hashes por segundo de audio (tamaño del índice),
+  - recall con consultas de 2/4/6/8 s (≥ MIN_MATCHES coherentes para la
+    canción correcta) con ruido blanco, y con ruido + un tono interferente
+    más fuerte que la música (silbido, acople) que se mueve cada 0.5 s,
+  - segundos de escucha hasta confirmar (mediana),
+  - falsos positivos: consultas de 8 s de canciones que no están en la
+    biblioteca y aun así suman MIN_MATCHES votos coherentes.
+
+Usa la misma canción sintética que bench_resample.py y votación
+(song_id, offset_diff) en memoria.  No necesita BD.
+Uso: python VibeFlow/Scripts/bench_constellation.py [canciones] [consultas] [snr_db]
+"""
+
+import os
+import sys
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import numpy as np
+
+from VibeFlow.Public.Services import fingerprintService as fps
+from bench_resample import SONG_SECONDS, _song
+
+QUERY_LENGTHS = (2, 4, 6, 8)
+CONFIGS = [
+    ('bands', None, None),
+    ('topn', 1, 2),
+    ('topn', 1, 4),
+    ('topn', 2, 4),
+    ('topn', 3, 4),
+]
+
+
+def _interferer(n, sr, seed, level):
+    """Tono que salta de frecuencia cada 0.5 s, `level` veces la RMS dada."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / sr
+    freqs = rng.uniform(200, 5000, size=int(n / sr * 2) + 1)
+    return level * np.sqrt(2) * np.sin(2 * np.pi * freqs[(t * 2).astype(int)] * t)
+
+
+def _configure(mode, peaks, fan_out):
+    fps.FINGERPRINT_MODE = mode
+    if peaks is not None:
+        fps.TOPN_PEAKS_PER_BAND = peaks
+        fps.TOPN_FAN_OUT = fan_out
+
+
+def _confirm_seconds(query_fps, index, sid):
+    """Segundos de consulta hasta que la canción correcta suma MIN_MATCHES."""
+    votes = Counter()
+    order = np.argsort(query_fps.offsets, kind='stable')
+    for h, q_off in zip(query_fps.hashes[order].tolist(), query_fps.offsets[order].tolist()):
+        for db_sid, db_off in index.get(h, ()):
+            if db_sid == sid:
+                votes[db_off - q_off] += 1
+                if votes[db_off - q_off] >= fps.MIN_MATCHES:
+                    return (q_off + fps._pair_horizon()) / fps.FPS
+    return None
+
+
+def _votes(x, index):
+    votes = Counter()
+    for h, q_off in fps.generate_fingerprints_from_samples(x, 44100):
+        for db_sid, db_off in index.get(h, ()):
+            votes[(db_sid, db_off - q_off)] += 1
+    return votes
+
+
+def _best_count(x, index):
+    return max(_votes(x, index).values(), default=0)
+
+
+def _evaluate(queries, index):
+    """Recall por duración de consulta y segundos hasta confirmar."""
+    recall = Counter()
+    confirm = []
+    for sid, x in queries:
+        for q in QUERY_LENGTHS:
+            votes = _votes(x[:q * 44100], index)
+            (best_sid, _diff), count = max(votes.items(), key=lambda kv: kv[1], default=((None, 0), 0))
+            recall[q] += best_sid == sid and count >= fps.MIN_MATCHES
+        seconds = _confirm_seconds(fps.generate_fingerprints_from_samples(x, 44100), index, sid)
+        if seconds is not None:
+            confirm.append(seconds)
+    return recall, confirm
+
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    snr_db = float(sys.argv[3]) if len(sys.argv) > 3 else -3.0
+
+    rng = np.random.default_rng(2)
+    library = {sid: _song(sid, 44100) for sid in range(n_songs)}
+    scenarios = {'ruido': [], 'ruido + tono': []}
+    for i in range(n_queries):
+        sid = int(rng.integers(n_songs))
+        start = float(rng.uniform(0, SONG_SECONDS - max(QUERY_LENGTHS)))
+        x = library[sid][int(start * 44100):int((start + max(QUERY_LENGTHS)) * 44100)]
+        rms = np.sqrt(np.mean(x ** 2))
+        x = x + rng.standard_normal(len(x)) * rms / 10 ** (snr_db / 20)
+        scenarios['ruido'].append((sid, x.astype(np.float32)))
+        tone = _interferer(len(x), 44100, i, 2 * rms)
+        scenarios['ruido + tono'].append((sid, (x + tone).astype(np.float32)))
+    unknown = [_song(n_songs + 1000 + i, 44100)[:max(QUERY_LENGTHS) * 44100] for i in range(n_queries)]
+
+    print(f"{n_songs} canciones de {SONG_SECONDS} s, {n_queries} consultas, SNR {snr_db:.0f} dB")
+    header = "".join(f"{f'{q} s':>7}" for q in QUERY_LENGTHS)
+    print(f"{'':<16}{'':>8}  {'ruido':<{len(header) + 9}}  ruido + tono")
+    print(f"{'modo':<16}{'hash/s':>8}  {header}{'confirma':>9}  {header}{'confirma':>9}{'FP':>6}")
+
+    for mode, peaks, fan_out in CONFIGS:
+        _configure(mode, peaks, fan_out)
+        index = defaultdict(list)
+        total = 0
+        for sid, samples in library.items():
+            song_fps = fps.generate_fingerprints_from_samples(samples, 44100)
+            total += len(song_fps)
+            for h, off in song_fps:
+                index[h].append((sid, off))
+
+        cols = []
+        for queries in scenarios.values():
+            recall, confirm = _evaluate(queries, index)
+            median = f"{np.median(confirm):.1f} s" if confirm else "—"
+            cols.append("".join(f"{recall[q] / n_queries:>7.0%}" for q in QUERY_LENGTHS) + f"{median:>9}")
+
+        false_pos = sum(_best_count(x, index) >= fps.MIN_MATCHES for x in unknown)
+
+        label = mode if peaks is None else f"topn N={peaks} F={fan_out}"
+        print(f"{label:<16}{total / (n_songs * SONG_SECONDS):>8.0f}  " + "  ".join(cols)
+              + f"{false_pos / n_queries:>6.0%}")
+
+
+if __name__ == '__main__':
+    main()
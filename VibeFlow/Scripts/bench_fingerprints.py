@@ -0,0 +1,141 @@
+"""
+bench_fingerprints.py - Micro-benchmark del motor de fingerprinting.
+
+Compara la extracción de picos vectorizada (_extract_band_peaks) contra la
+implementación histórica frame a frame, y el hash entero empaquetado contra
+el SHA-1 histórico.  Verifica que cada hash int64 codifique EXACTAMENTE los
+mismos 6 componentes (y el mismo anchor) que generaba el algoritmo original.
+
+No necesita BD: sintetiza una canción WAV en memoria.
+Uso: python VibeFlow/Scripts/bench_fingerprints.py [segundos]
+"""
+
+import io
+import os
+import sys
+import time
+import wave
+import hashlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import numpy as np
+from scipy.signal import spectrogram as scipy_spectrogram
+
+from VibeFlow.Public.Services import fingerprintService as fps
+
+
+def _synth_wav(seconds, sr=44100, seed=7):
+    """Canción sintética: acordes aleatorios cada 250 ms + ruido, PCM 16-bit."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    t = np.arange(n) / sr
+    audio = 0.02 * rng.standard_normal(n)
+    step = sr // 4
+    for start in range(0, n, step):
+        seg = slice(start, start + step)
+        for f in rng.uniform(80, 5000, size=3):
+            audio[seg] += 0.2 * np.sin(2 * np.pi * f * t[seg])
+    pcm = np.clip(audio / np.abs(audio).max(), -1, 1)
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes((pcm * 32767).astype('<i2').tobytes())
+    return buf.getvalue()
+
+
+# ── Implementación histórica (referencia) ─────────────────────────────
+def _legacy_band_peaks(Sxx_db):
+    n_bins = Sxx_db.shape[0]
+    mid_bin = n_bins // 2
+    frame_peaks = []
+    for t in range(Sxx_db.shape[1]):
+        col = Sxx_db[:, t]
+        f_peak = int(np.argmax(col[1:])) + 1
+        f_midlow = int(np.argmax(col[1:mid_bin])) + 1
+        fp_q = f_peak // fps.FREQ_QUANT
+        fm_q = f_midlow // fps.FREQ_QUANT
+        frame_peaks.append((fp_q, fm_q, fp_q - fm_q))
+    return frame_peaks
+
+
+def _legacy_pairs(frame_peaks):
+    """Componentes de cada par (t1, delta) en el orden histórico."""
+    max_delta = max(fps.TARGET_DELTAS)
+    out = []
+    for t1 in range(len(frame_peaks) - max_delta):
+        for delta in fps.TARGET_DELTAS:
+            out.append((frame_peaks[t1] + frame_peaks[t1 + delta], t1))
+    return out
+
+
+def _legacy_sha1(pairs):
+    return [
+        (hashlib.sha1("|".join(map(str, comps)).encode()).hexdigest(), t1)
+        for comps, t1 in pairs
+    ]
+
+
+def _unpack(h):
+    """Inversa de fps._pack_hashes para un hash int."""
+    comps = []
+    for _ in range(6):
+        comps.append(h & fps.HASH_FIELD_MASK)
+        h >>= fps.HASH_FIELD_BITS
+    fp1, fm1, d1, fp2, fm2, d2 = reversed(comps)
+    return (fp1, fm1, d1 - fps.HASH_DIST_BIAS, fp2, fm2, d2 - fps.HASH_DIST_BIAS)
+
+
+def _spectrogram_db(wav_bytes):
+    orig_sr, samples = fps._parse_wav_bytes(wav_bytes)
+    samples = fps._resample(samples, orig_sr, fps.SAMPLE_RATE)
+    _f, _t, Sxx = scipy_spectrogram(
+        samples, fs=fps.SAMPLE_RATE, nperseg=fps.NPERSEG,
+        noverlap=fps.NOVERLAP, scaling='spectrum',
+    )
+    return 10 * np.log10(Sxx + 1e-10)
+
+
+def _best_of(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 240.0
+    wav_bytes = _synth_wav(seconds)
+    Sxx_db = _spectrogram_db(wav_bytes)
+    print(f"Audio: {seconds:.0f} s → {Sxx_db.shape[1]} frames")
+
+    # 1. Picos por frame
+    t_loop = _best_of(lambda: _legacy_band_peaks(Sxx_db))
+    t_vec = _best_of(lambda: fps._extract_band_peaks(Sxx_db))
+    legacy_peaks = _legacy_band_peaks(Sxx_db)
+    fp_q, fm_q, dist = fps._extract_band_peaks(Sxx_db)
+    assert legacy_peaks == list(zip(fp_q.tolist(), fm_q.tolist(), dist.tolist())), \
+        "Los picos vectorizados difieren de la implementación histórica"
+    print(f"_extract_band_peaks  loop: {t_loop * 1000:8.2f} ms   "
+          f"vectorizado: {t_vec * 1000:8.2f} ms   (x{t_loop / t_vec:.1f})")
+
+    # 2. Hash: SHA-1 por par vs empaquetado int64 vectorizado
+    pairs = _legacy_pairs(legacy_peaks)
+    t_sha1 = _best_of(lambda: _legacy_sha1(pairs), repeat=3)
+    current = fps.generate_fingerprints(wav_bytes)
+    assert [(_unpack(h), t) for h, t in current] == pairs, \
+        "Los hashes empaquetados no codifican los mismos componentes"
+    assert len(set(current.hashes.tolist())) == len(set(h for h, _ in _legacy_sha1(pairs))), \
+        "El empaquetado colisiona donde SHA-1 no lo hacía"
+    t_full = _best_of(lambda: fps.generate_fingerprints(wav_bytes), repeat=3)
+    print(f"hash SHA-1 (solo hashing): {t_sha1 * 1000:8.2f} ms")
+    print(f"generate_fingerprints:     {t_full * 1000:8.2f} ms   "
+          f"({len(current)} hashes int64 equivalentes a la referencia)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+bench_resample.py - Remuestreo lineal vs polifásico (FINGERPRINT_RESAMPLER).
+
+1. Throughput de _resample para 44100/48000/22050/16000 → 11025 Hz.
+2. Aliasing: energía que un tono por encima de 5.5 kHz deja en la banda
+   0–5.5 kHz que leen los picos.
+3. Identificación: biblioteca de canciones sintéticas (con contenido hasta
+   15 kHz) fingerprintada a 44.1 kHz con cada método; consultas de 8 s a
+   distintas frecuencias de muestreo con ruido, votación
+   (song_id, offset_diff) en memoria como en la búsqueda real.
+
+No necesita BD.
+Uso: python VibeFlow/Scripts/bench_resample.py [canciones] [consultas]
+"""
+
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import numpy as np
+
+from VibeFlow.Public.Services import fingerprintService as fps
+
+RATES = (44100, 48000, 22050, 16000)
+METHODS = ('linear', 'polyphase')
+SONG_SECONDS = 60
+QUERY_SECONDS = 8
+
+
+def _song(seed, sr, seconds=SONG_SECONDS):
+    """
+    Canción sintética definida en tiempo continuo (se puede renderizar a
+    cualquier sr): acordes aleatorios cada 250 ms, parte por encima de
+    5.5 kHz, + ruido.
+    """
+    rng = np.random.default_rng(seed)
+    n_steps = int(seconds * 4)
+    freqs = np.concatenate([
+        rng.uniform(80, 5000, size=(n_steps, 2)),
+        rng.uniform(5500, 15000, size=(n_steps, 2)),     # contenido que se pliega
+    ], axis=1)
+    amps = np.array([0.2, 0.2, 0.3, 0.3])
+    t = np.arange(int(seconds * sr)) / sr
+    step = np.minimum((t * 4).astype(int), n_steps - 1)
+    audio = np.zeros_like(t)
+    for k in range(freqs.shape[1]):
+        f = freqs[step, k]
+        keep = f < sr / 2
+        audio += keep * amps[k] * np.sin(2 * np.pi * f * t)
+    audio += 0.02 * np.random.default_rng(seed + 10_000).standard_normal(len(t))
+    return (audio / np.abs(audio).max()).astype(np.float32)
+
+
+def _fingerprints(samples, sr, method):
+    fps.RESAMPLER = method
+    return fps.generate_fingerprints_from_samples(samples, sr)
+
+
+def _best_of(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_throughput(seconds=60):
+    print(f"── Throughput ({seconds} s de audio, mejor de 5) ──")
+    rng = np.random.default_rng(0)
+    for sr in RATES:
+        x = rng.standard_normal(sr * seconds).astype(np.float32)
+        row = []
+        for method in METHODS:
+            fps.RESAMPLER = method
+            t = _best_of(lambda: fps._resample(x, sr, fps.SAMPLE_RATE))
+            row.append(f"{method}: {len(x) / t / 1e6:7.1f} Msamples/s")
+        print(f"{sr:>6} → {fps.SAMPLE_RATE}   " + "   ".join(row))
+
+
+def bench_aliasing(sr=44100, tone=8000.0):
+    alias = abs(fps.SAMPLE_RATE - tone)
+    print(f"── Aliasing: tono de {tone:.0f} Hz a {sr} Hz (alias en {alias:.0f} Hz) ──")
+    t = np.arange(sr * 5) / sr
+    x = np.sin(2 * np.pi * tone * t).astype(np.float32)
+    for method in METHODS:
+        fps.RESAMPLER = method
+        y = fps._resample(x, sr, fps.SAMPLE_RATE)
+        rms = np.sqrt(np.mean(y[fps.SAMPLE_RATE:-fps.SAMPLE_RATE] ** 2))
+        print(f"  {method:<10} energía en banda: {20 * np.log10(rms / np.sqrt(0.5) + 1e-12):7.1f} dB")
+
+
+def bench_identification(n_songs, n_queries, snr_db=0.0):
+    print(f"── Identificación: {n_songs} canciones, {n_queries} consultas "
+          f"de {QUERY_SECONDS} s por sr, SNR {snr_db:.0f} dB ──")
+    rng = np.random.default_rng(1)
+    library = {sid: _song(sid, 44100) for sid in range(n_songs)}
+    queries = []
+    for sr in RATES:
+        for _ in range(n_queries):
+            sid = int(rng.integers(n_songs))
+            start = float(rng.uniform(0, SONG_SECONDS - QUERY_SECONDS))
+            queries.append((sr, sid, start, rng.integers(1 << 31)))
+
+    for method in METHODS:
+        index = defaultdict(list)
+        for sid, samples in library.items():
+            for h, off in _fingerprints(samples, 44100, method):
+                index[h].append((sid, off))
+
+        hits, coherent = Counter(), defaultdict(list)
+        for sr, sid, start, seed in queries:
+            x = _song(sid, sr)[int(start * sr):int((start + QUERY_SECONDS) * sr)]
+            noise = np.random.default_rng(seed).standard_normal(len(x))
+            x = x + noise * np.sqrt(np.mean(x ** 2) / 10 ** (snr_db / 10))
+            votes = Counter()
+            for h, q_off in _fingerprints(x.astype(np.float32), sr, method):
+                for db_sid, db_off in index.get(h, ()):
+                    votes[(db_sid, db_off - q_off)] += 1
+            best = max(votes.items(), key=lambda kv: kv[1], default=((None, 0), 0))
+            (best_sid, _diff), count = best
+            if best_sid == sid and count >= fps.MIN_MATCHES:
+                hits[sr] += 1
+            coherent[sr].append(max((c for (s, _), c in votes.items() if s == sid), default=0))
+
+        summary = "   ".join(
+            f"{sr}: {hits[sr]:>3}/{n_queries} (≈{np.median(coherent[sr]):.0f} matches)"
+            for sr in RATES
+        )
+        print(f"  {method:<10} {summary}")
+
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    bench_throughput()
+    bench_aliasing()
+    bench_identification(n_songs, n_queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""
+fake_terabox.py - Servidor HTTP local que imita la API de TeraBox.
+
+Implementa lo que usa teraboxService: /main (jsToken), /api/precreate,
+/rest/2.0/pcs/superfile2, /api/create (carpetas y archivos),
+/api/filemetas (dlink), la descarga del dlink (con Range) y
+/api/filemanager?opera=delete.  Los archivos viven en memoria.  Las
+llamadas a /api/* y superfile2 con un jsToken distinto del vigente
+responden errno -6 (como una sesión caducada).
+
+Inyección de fallos para probar reintentos, reanudación y re-auth:
+  --fail-parts N     los N primeros superfile2 responden 500
+  --fail-metas N     los N primeros filemetas responden 503
+  --rotate-token S   cambia el jsToken cada S segundos
+  --latency S        espera S segundos en cada superfile2
+
+Uso:
+    python VibeFlow/Scripts/fake_terabox.py [--port 8765]
+        → TERABOX_API=http://127.0.0.1:8765 TERABOX_NDUS=x python manage.py ...
+    python VibeFlow/Scripts/fake_terabox.py --check
+        → sube un archivo de varios bloques con fallos, lo reanuda, lo
+          descarga (entero y por Range) y lo borra.  No necesita BD.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import tempfile
+import threading
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+class FakeTeraBox:
+    """Estado del servidor: archivos, subidas en curso y contadores."""
+
+    def __init__(self, fail_parts=0, latency=0.0, fail_metas=0):
+        self.lock = threading.Lock()
+        self.jstoken = 'fake-js-1'
+        self.fail_metas = fail_metas
+        self.files = {}          # ruta → bytes
+        self.block_lists = {}    # ruta → MD5 de sus bloques (rapid upload)
+        self.folders = set()
+        self.uploads = {}        # uploadid → {'path', 'md5s', 'parts': {seq: bytes}}
+        self.fail_parts = fail_parts
+        self.latency = latency
+        self.calls = {}
+        self.max_parallel_parts = 0
+        self._parallel = 0
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def rotate_token(self):
+        with self.lock:
+            n = int(self.jstoken.rsplit('-', 1)[1]) + 1
+            self.jstoken = f'fake-js-{n}'
+
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *args):
+            pass
+
+        # ── Utilidades ─────────────────────────────────────────────────
+        def _json(self, data, status=200):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def _form(self):
+            return {k: v[0] for k, v in parse_qs(self._body().decode('utf-8')).items()}
+
+        def _multipart_file(self):
+            raw = b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + self._body()
+            for part in BytesParser().parsebytes(raw).walk():
+                if part.get_filename() is not None:
+                    return part.get_payload(decode=True)
+            return b''
+
+        # ── Rutas ──────────────────────────────────────────────────────
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path.startswith('/api/') and query.get('jsToken') != state.jstoken:
+                return self._json({'errno': -6, 'errmsg': 'jsToken inválido'})
+            if url.path == '/main':
+                state.count('main')
+                body = ('<script>var templateData = {"jsToken":"%s","bdstoken":"fake-bd"};</script>'
+                        % state.jstoken).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif url.path == '/api/filemetas':
+                state.count('filemetas')
+                with state.lock:
+                    fail = state.fail_metas > 0
+                    if fail:
+                        state.fail_metas -= 1
+                if fail:
+                    return self._json({'errno': -1, 'errmsg': 'fallo inyectado'}, 503)
+                host = self.headers.get('Host')
+                items = [
+                    {'path': p, 'size': len(state.files[p]),
+                     'dlink': f'http://{host}/file?path={quote(p)}'}
+                    for p in json.loads(query.get('target', '[]')) if p in state.files
+                ]
+                self._json({'errno': 0, 'list': items})
+            elif url.path == '/file':
+                state.count('download')
+                self._serve_file(state.files.get(unquote(query.get('path', ''))))
+            else:
+                self._json({'errno': -1}, 404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if query.get('jsToken') != state.jstoken:
+                self._body()
+                return self._json({'errno': -6, 'errmsg': 'jsToken inválido'})
+            if url.path == '/api/precreate':
+                state.count('precreate')
+                form = self._form()
+                md5s = json.loads(form['block_list'])
+                path = form['path']
+                if path in state.files and state.block_lists.get(path) == md5s:
+                    return self._json({'errno': 0, 'return_type': 2})
+                uploadid = uuid.uuid4().hex
+                with state.lock:
+                    state.uploads[uploadid] = {'path': path, 'md5s': md5s, 'parts': {}}
+                self._json({'errno': 0, 'return_type': 1, 'uploadid': uploadid,
+                            'block_list': list(range(len(md5s)))})
+            elif url.path == '/rest/2.0/pcs/superfile2':
+                state.count('superfile2')
+                chunk = self._multipart_file()
+                with state.lock:
+                    state._parallel += 1
+                    state.max_parallel_parts = max(state.max_parallel_parts, state._parallel)
+                    fail = state.fail_parts > 0
+                    if fail:
+                        state.fail_parts -= 1
+                try:
+                    time.sleep(state.latency)
+                    upload = state.uploads.get(query.get('uploadid'))
+                    if fail:
+                        return self._json({'error_code': 31299, 'error_msg': 'fallo inyectado'}, 500)
+                    if upload is None:
+                        return self._json({'error_code': 31363, 'error_msg': 'uploadid inválido'}, 400)
+                    with state.lock:
+                        upload['parts'][int(query['partseq'])] = chunk
+                    self._json({'md5': hashlib.md5(chunk).hexdigest(), 'partseq': query['partseq']})
+                finally:
+                    with state.lock:
+                        state._parallel -= 1
+            elif url.path == '/api/create':
+                state.count('create')
+                form = self._form()
+                if form.get('isdir') == '1':
+                    state.folders.add(form['path'])
+                    return self._json({'errno': 0})
+                upload = state.uploads.get(form.get('uploadid'))
+                md5s = json.loads(form['block_list'])
+                if upload is None or sorted(upload['parts']) != list(range(len(md5s))):
+                    return self._json({'errno': 31363, 'errmsg': 'bloques incompletos'})
+                data = b''.join(upload['parts'][i] for i in range(len(md5s)))
+                if [hashlib.md5(upload['parts'][i]).hexdigest() for i in range(len(md5s))] != md5s \
+                        or len(data) != int(form['size']):
+                    return self._json({'errno': 31190, 'errmsg': 'block_list no coincide'})
+                with state.lock:
+                    state.files[form['path']] = data
+                    state.block_lists[form['path']] = md5s
+                    del state.uploads[form['uploadid']]
+                self._json({'errno': 0, 'path': form['path'], 'size': len(data)})
+            elif url.path == '/api/filemanager' and query.get('opera') == 'delete':
+                state.count('delete')
+                for path in json.loads(self._form()['filelist']):
+                    state.files.pop(path, None)
+                self._json({'errno': 0})
+            else:
+                self._json({'errno': -1}, 404)
+
+        def _serve_file(self, data):
+            if data is None:
+                return self._json({'errno': -9}, 404)
+            start, end, status = 0, len(data) - 1, 200
+            m = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range') or '')
+            if m and (m.group(1) or m.group(2)):
+                if m.group(1):
+                    start = int(m.group(1))
+                    end = min(int(m.group(2)), len(data) - 1) if m.group(2) else len(data) - 1
+                else:
+                    start = max(0, len(data) - int(m.group(2)))
+                if start >= len(data):
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{len(data)}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 206
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(end - start + 1))
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+            self.end_headers()
+            self.wfile.write(data[start:end + 1])
+
+    return Handler
+
+
+def serve(port=8765, fail_parts=0, latency=0.0, fail_metas=0):
+    """Arranca el servidor en un hilo.  Retorna (server, state)."""
+    state = FakeTeraBox(fail_parts, latency, fail_metas)
+    server = ThreadingHTTPServer(('127.0.0.1', port), _make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def check():
+    """Sube/reanuda/descarga/borra contra el servidor falso."""
+    server, state = serve(port=0, latency=0.05)
+    os.environ['AUDIO_CACHE_MAX_BYTES'] = '0'
+    from VibeFlow.Public.Services import teraboxService as tb
+
+    tb.TERABOX_API = f'http://127.0.0.1:{server.server_port}'
+    tb.TERABOX_NDUS = 'fake'
+    tb.TERABOX_UPLOAD_BLOCK_BYTES = 256 * 1024
+    tb.TERABOX_UPLOAD_CONCURRENCY = 3
+    tb.TERABOX_UPLOAD_STATE_DIR = tempfile.mkdtemp()
+    tb.TERABOX_BACKOFF = 0.01
+    client = tb.TeraBoxClient()
+    data = os.urandom(10 * 256 * 1024 + 1234)     # 11 bloques
+
+    # 1. Sin reintentos, dos bloques fallan: la subida queda a medias
+    tb.TERABOX_RETRIES, state.fail_parts = 0, 2
+    try:
+        client.upload('check.wav', data)
+        raise AssertionError('la primera subida debía fallar (fallos inyectados)')
+    except Exception as e:
+        print(f"1er intento falló como se esperaba: {e}")
+    sent_first = state.calls.get('superfile2', 0)
+
+    # 2. Reanudación: solo los bloques que faltan
+    tb.TERABOX_RETRIES = 3
+    t0 = time.perf_counter()
+    remote = client.upload('check.wav', data)
+    resumed = state.calls['superfile2'] - sent_first
+    print(f"2º intento: {remote} en {time.perf_counter() - t0:.2f} s, "
+          f"{resumed} bloques re-subidos de 11, hasta {state.max_parallel_parts} en paralelo")
+    assert resumed == 2, resumed
+    assert state.files[remote] == data
+    assert not os.listdir(tb.TERABOX_UPLOAD_STATE_DIR)
+
+    # 3. Errores transitorios: se reintentan con backoff y la subida no falla
+    state.fail_parts, state.fail_metas = 2, 2
+    other = client.upload('check2.wav', data[::-1])
+    assert state.files[other] == data[::-1]
+    assert client.download(other) == data[::-1]
+
+    # 4. jsToken caducado: un hilo lo renueva y la llamada se repite
+    state.rotate_token()
+    mains = state.calls['main']
+    client.invalidate_download_url(remote)
+    assert client.download(remote) == data
+    assert state.calls['main'] == mains + 1
+
+    assert client.upload('check.wav', data) == remote          # rapid upload
+    resp = client.open_download(remote, 'bytes=1000-1999')
+    assert resp.status_code == 206 and resp.content == data[1000:2000]
+    client.delete(remote)
+    assert remote not in state.files
+    print(f"OK  llamadas: {state.calls}")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fail-parts', type=int, default=0)
+    parser.add_argument('--fail-metas', type=int, default=0)
+    parser.add_argument('--rotate-token', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--check', action='store_true', help='Prueba subida/reanudación/descarga y termina')
+    args = parser.parse_args()
+
+    if args.check:
+        check()
+        return
+    server, state = serve(args.port, args.fail_parts, args.latency, args.fail_metas)
+    print(f"TeraBox falso en http://127.0.0.1:{server.server_port} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(args.rotate_token or 3600)
+            if args.rotate_token:
+                state.rotate_token()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+export_fingerprint_index - Exporta app.fingerprints al archivo de índice mmap.
+
+Uso:
+    python manage.py export_fingerprint_index
+    python manage.py export_fingerprint_index --path /srv/vibeflow/fingerprints.idx
+
+Exporta la versión activa del algoritmo.  Los workers con
+FINGERPRINT_INDEX=mmap detectan el archivo nuevo (cambio del puntero) y
+lo remapean sin reiniciar.
+"""
+
+from django.core.management.base import BaseCommand
+from VibeFlow.Public.Services import fingerprintIndexService, fingerprintVersionService
+
+
+class Command(BaseCommand):
+    help = 'Exporta los fingerprints a un índice binario ordenado (np.memmap) y lo publica de forma atómica.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=fingerprintIndexService.FINGERPRINT_INDEX_PATH,
+            help='Archivo puntero del índice (default: FINGERPRINT_INDEX_PATH)',
+        )
+
+    def handle(self, *args, **options):
+        version = fingerprintVersionService.active_version().version
+        summary = fingerprintIndexService.export_index_file(version, options['path'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice publicado en {summary['path']} → {summary['file']} "
+            f"(versión {version}, snapshot {summary['snapshot']}, {summary['keys']} hashes, "
+            f"{summary['postings']} postings)"
+        ))
@@ -0,0 +1,89 @@
+"""
+fingerprint_versions - Versiones del algoritmo de fingerprinting.
+
+Uso:
+    python manage.py fingerprint_versions list
+    python manage.py fingerprint_versions create        # parámetros del .env actual
+    python manage.py fingerprint_versions build 2       # reanudable
+    python manage.py fingerprint_versions build 2 --from-peaks  # solo cambió el emparejado
+    python manage.py fingerprint_versions activate 2 [--force]
+    python manage.py fingerprint_versions discard 2     # abandona una versión en construcción
+    python manage.py fingerprint_versions gc [--grace 600]
+
+Flujo para cambiar parámetros sin corte: ajustar el .env del proceso que
+ejecuta el comando, create → build → activate → gc (ver
+fingerprintVersionService).
+"""
+
+import json
+from django.core.management.base import BaseCommand, CommandError
+from VibeFlow.Public.Services import fingerprintVersionService
+
+
+class Command(BaseCommand):
+    help = 'Gestiona las versiones del algoritmo de fingerprinting (re-indexado sin corte).'
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest='action', required=True)
+        sub.add_parser('list', help='Lista las versiones y su cobertura')
+        sub.add_parser('create', help='Registra la configuración actual como versión nueva')
+        build = sub.add_parser('build', help='Genera los fingerprints de una versión')
+        build.add_argument('version', type=int)
+        build.add_argument(
+            '--from-peaks', action='store_true',
+            help='Re-empareja desde la caché de picos (sin descargar el audio) las canciones que la tienen',
+        )
+        activate = sub.add_parser('activate', help='Cambia la versión activa')
+        activate.add_argument('version', type=int)
+        activate.add_argument('--force', action='store_true', help='Activa aunque falten canciones')
+        discard = sub.add_parser('discard', help='Abandona una versión en construcción')
+        discard.add_argument('version', type=int)
+        gc = sub.add_parser('gc', help='Borra las filas de las versiones retiradas')
+        gc.add_argument(
+            '--grace', type=int, default=fingerprintVersionService.FINGERPRINT_VERSION_GC_GRACE,
+            help='Segundos mínimos desde que se retiró (default: FINGERPRINT_VERSION_GC_GRACE)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, '_' + options['action'])(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def _list(self, options):
+        for v in fingerprintVersionService.list_versions():
+            self.stdout.write(
+                f"v{v['version']:<3} {v['status']:<10} {v['songs']:>6} canciones  "
+                f"{json.dumps(v['params'], sort_keys=True)}"
+            )
+
+    def _create(self, options):
+        params = fingerprintVersionService.create_version()
+        self.stdout.write(self.style.SUCCESS(f"Versión {params.version}: {params.as_dict()}"))
+
+    def _build(self, options):
+        summary = fingerprintVersionService.build_version(options['version'], from_peaks=options['from_peaks'])
+        errors = [r for r in summary['results'] if r['status'] != 'ok']
+        for r in errors:
+            self.stdout.write(self.style.WARNING(f"  {r['id']} {r['title']}: {r['status']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Versión {summary['version']}: {summary['processed']} canciones procesadas, "
+            f"{len(errors)} errores, {summary['missing']} pendientes"
+        ))
+
+    def _activate(self, options):
+        summary = fingerprintVersionService.activate(options['version'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Versión activa: {summary['previous']} → {summary['active']}"
+        ))
+
+    def _discard(self, options):
+        fingerprintVersionService.discard(options['version'])
+        self.stdout.write(self.style.SUCCESS(f"Versión {options['version']} descartada"))
+
+    def _gc(self, options):
+        deleted = fingerprintVersionService.collect_garbage(options['grace'])
+        if not deleted:
+            self.stdout.write("No hay versiones retiradas que borrar")
+        for version, rows in deleted.items():
+            self.stdout.write(self.style.SUCCESS(f"Versión {version}: {rows} filas borradas"))
@@ -0,0 +1,57 @@
+"""
+regenerate_fingerprints - Regenera los fingerprints del catálogo.
+
+Uso:
+    python manage.py regenerate_fingerprints                  # versión activa, todas
+    python manage.py regenerate_fingerprints --from-peaks     # desde la caché de picos
+    python manage.py regenerate_fingerprints --only-missing --concurrency 4
+
+Encola un lote de jobs 'regenerate' y lo procesa en este proceso (los
+workers de ingesta en marcha también toman jobs del lote).  Con
+--from-peaks las canciones con picos cacheados para la configuración DSP
+de la versión solo se re-emparejan (milisegundos, sin descarga ni STFT);
+las demás se descargan y analizan como siempre.  Útil cuando solo cambian
+parámetros de emparejado; para cambiarlos sin corte usar
+fingerprint_versions create/build.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from VibeFlow.Public.Services import fingerprintService, fingerprintVersionService
+
+
+class Command(BaseCommand):
+    help = 'Regenera los fingerprints de todas las canciones (opcionalmente desde la caché de picos).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--algo-version', type=int, default=None,
+            help='Versión del algoritmo a regenerar (default: la activa)',
+        )
+        parser.add_argument(
+            '--from-peaks', action='store_true',
+            help='Re-empareja desde la caché de picos las canciones que la tienen',
+        )
+        parser.add_argument(
+            '--only-missing', action='store_true',
+            help='Solo las canciones sin fingerprints de esa versión',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=None,
+            help='Jobs en paralelo (default: REGENERATE_CONCURRENCY)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            params = fingerprintVersionService.get_version(options['algo_version']) if options['algo_version'] else None
+            summary = fingerprintService.regenerate_all(
+                params, only_missing=options['only_missing'],
+                concurrency=options['concurrency'], from_peaks=options['from_peaks'],
+            )
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+        errors = [r for r in summary['results'] if r['status'] != 'ok']
+        for r in errors:
+            self.stdout.write(self.style.WARNING(f"  {r['id']} {r['title']}: {r['status']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Lote {summary['batch_id']}: {summary['processed']} canciones procesadas, {len(errors)} errores"
+        ))
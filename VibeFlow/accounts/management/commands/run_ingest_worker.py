@@ -0,0 +1,45 @@
+"""
+run_ingest_worker - Worker de jobs de ingesta de canciones.
+
+Uso:
+    python manage.py run_ingest_worker            # bucle (Ctrl+C para salir)
+    python manage.py run_ingest_worker --once     # procesa la cola y termina
+    python manage.py run_ingest_worker --threads 4  # 4 jobs a la vez
+
+Se pueden lanzar varios procesos: cada job lo toma uno solo
+(FOR UPDATE SKIP LOCKED).  El spool (INGEST_SPOOL_DIR) debe ser el mismo
+que usa el servidor web.  Con --threads las descargas/subidas de unos
+jobs se solapan con el DSP de otros (útil para los lotes de
+regeneración).
+"""
+
+from django.core.management.base import BaseCommand
+from VibeFlow.Public.Services import ingestJobsService
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los jobs de ingesta y regeneración en cola.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Procesa los jobs en cola y termina',
+        )
+        parser.add_argument(
+            '--poll', type=float, default=ingestJobsService.INGEST_POLL_SECONDS,
+            help='Segundos de espera cuando no hay jobs (default: INGEST_POLL_SECONDS)',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Jobs en paralelo dentro del proceso (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            processed = ingestJobsService.run_worker(
+                once=options['once'], poll_seconds=options['poll'], threads=options['threads'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido.')
+            return
+        self.stdout.write(self.style.SUCCESS(f"{processed} jobs procesados"))
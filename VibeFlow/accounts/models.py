@@ -11,5 +11,7 @@ from VibeFlow.Public.Models.routePermissionsModel import RoutePermission
 from VibeFlow.Public.Models.recordingsModel import Recording
 from VibeFlow.Public.Models.songsModel import Song
 from VibeFlow.Public.Models.fingerprintsModel import Fingerprint
+from VibeFlow.Public.Models.ingestJobsModel import IngestJob
+from VibeFlow.Public.Models.fingerprintVersionsModel import FingerprintVersion
 
-__all__ = ['User', 'Role', 'UserRole', 'Module', 'Family', 'Subfamily', 'ViewRoute', 'RoutePermission', 'Recording', 'Song', 'Fingerprint']
+__all__ = ['User', 'Role', 'UserRole', 'Module', 'Family', 'Subfamily', 'ViewRoute', 'RoutePermission', 'Recording', 'Song', 'Fingerprint', 'IngestJob', 'FingerprintVersion']